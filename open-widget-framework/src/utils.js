@@ -12,6 +12,12 @@ function apiPath(name, pk) {
   case "get_configurations":
     return `${apiBase}/list/get_configurations/`
 
+  case "choices":
+    return `${apiBase}/list/choices/`
+
+  case "file":
+    return `${apiBase}/file/`
+
   case "widget_list":
     return `${apiBase}/list/${pk ? `${pk}/` : ""}`
 
@@ -1,5 +1,6 @@
 import React, { Component } from "react"
 import Select from "react-select"
+import AsyncSelect from "react-select/lib/Async"
 
 import { makeOptionsFromList, makeOptionsFromObject, apiPath } from "./utils"
 
@@ -69,7 +70,7 @@ class EditWidgetForm extends Component {
     /**
      * If data is loaded, render a widget form with initial data from the widget
      */
-    const { Loader } = this.props
+    const { errorHandler, fetchData, Loader } = this.props
     const {
       widgetClass,
       widgetClassConfiguration,
@@ -80,6 +81,8 @@ class EditWidgetForm extends Component {
     } else {
       return (
         <WidgetForm
+          errorHandler={errorHandler}
+          fetchData={fetchData}
           formData={currentWidgetData}
           onSubmit={this.onSubmit}
           widgetClass={widgetClass}
@@ -159,13 +162,15 @@ class NewWidgetForm extends Component {
     /**
      * If data is loaded, render a blank widget form
      */
-    const { Loader } = this.props
+    const { errorHandler, fetchData, Loader } = this.props
     const { widgetClasses, widgetClassConfigurations } = this.state
     if (widgetClasses === null || widgetClassConfigurations === null) {
       return <Loader />
     } else {
       return (
         <WidgetForm
+          errorHandler={errorHandler}
+          fetchData={fetchData}
           formData={{ title: null }}
           onSubmit={this.onSubmit}
           widgetClass={""}
@@ -182,6 +187,8 @@ class WidgetForm extends Component {
    * WidgetForm is a dynamically generated form with input fields defined by a configuration JSON blob
    *
    * Props:
+   *    errorHandler: the error handler set in config.js
+   *    fetchData: the fetch wrapper set in config.js, used to search choices that are loaded lazily and upload files
    *    formData: the default values for the form. If null, all inputs will start blank
    *    onSubmit(widgetClass, data): the behavior to take when the form is submitted
    *    widgetClass: the class of the widget being edited or the empty string for a new widget
@@ -255,6 +262,38 @@ class WidgetForm extends Component {
     )
   }
 
+  loadChoices = (key, search) => {
+    /**
+     * Fetch the first page of choices of a field with lazyChoices that match search, as react-select options
+     */
+    const { fetchData } = this.props
+    const { widgetClass } = this.state
+    const query = `widget_class=${encodeURIComponent(
+      widgetClass
+    )}&field=${encodeURIComponent(key)}&search=${encodeURIComponent(search)}`
+    return fetchData(`${apiPath("choices")}?${query}`).then(data =>
+      data.results.map(choice => ({
+        key:   choice.value,
+        label: choice.label,
+        value: String(choice.value)
+      }))
+    )
+  }
+
+  uploadFile = (key, file) => {
+    /**
+     * Upload a file chosen in a file input and set the uploaded file as the input's value
+     */
+    const { errorHandler, fetchData } = this.props
+    fetchData(`${apiPath("file")}?name=${encodeURIComponent(file.name)}`, {
+      body:    file,
+      headers: { "Content-Type": "application/octet-stream" },
+      method:  "POST"
+    })
+      .then(data => this.onChange(key, data))
+      .catch(errorHandler)
+  }
+
   renderInputs = model => {
     /**
      * Render widget form inputs based on the configuration of widgetClass
@@ -293,8 +332,9 @@ class WidgetForm extends Component {
       if (inputType === "select") {
         inputProps.options = makeOptionsFromObject(choices)
         if (key in formData && formData[key]) {
+          const selected = [].concat(formData[key]).map(String)
           for (const option of inputProps.options) {
-            if (formData[key].includes(option.value)) {
+            if (selected.includes(option.value)) {
               inputProps.defaultValue.push(option)
             }
           }
@@ -306,7 +346,25 @@ class WidgetForm extends Component {
         inputProps.onChange = selection => {
           this.onChange(key, selection.map(option => option.value))
         }
-        input = <Select {...inputProps} />
+        if (field.lazyChoices) {
+          // The choices are searched on the backend; choices only holds the labels of the selected values
+          delete inputProps.options
+          input = (
+            <AsyncSelect
+              {...inputProps}
+              cacheOptions
+              defaultOptions
+              loadOptions={search => this.loadChoices(key, search)}
+            />
+          )
+        } else {
+          input = <Select {...inputProps} />
+        }
+      } else if (inputType === "file") {
+        // File inputs cannot have a value set; the uploaded file is kept in formData
+        delete inputProps.defaultValue
+        inputProps.onChange = event => this.uploadFile(key, event.target.files[0])
+        input = <input {...inputProps} type="file" />
       } else if (inputType === "textarea") {
         input = <textarea {...inputProps} />
       } else {
@@ -0,0 +1,75 @@
+"""
+Benchmark for RssFeedWidget entry selection and rendering on large feeds.
+
+Compares the previous approach (sort the whole feed on its struct_time key, build html with +=) against the current
+one (precomputed epoch timestamps, heap selection, a single format_html_join). Run with:
+
+    python benchmarks/rss_feed_selection.py
+"""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+settings.configure(INSTALLED_APPS=["django.contrib.auth", "django.contrib.contenttypes"])
+django.setup()
+
+from unittest.mock import patch  # noqa: E402
+
+from open_widget_framework.feeds import compact_entries  # noqa: E402
+from open_widget_framework.widget_classes import RssFeedWidget  # noqa: E402
+
+FEED_SIZES = (1000, 5000, 20000)
+DISPLAY_LIMIT = 12
+REPEAT = 5
+
+
+def make_entries(count):
+    """Build feedparser-like entries with distinct publication times"""
+    return [
+        {
+            "title": "entry %s <with markup>" % index,
+            "link": "https://example.com/%s" % index,
+            "published_parsed": time.gmtime(1514764800 + (index * 7919) % (count * 60)),
+        }
+        for index in range(count)
+    ]
+
+
+def previous_render(entries, limit):
+    """The selection and rendering used before entries were compacted"""
+    feed_output = ""
+    sorted_feed = sorted(entries, reverse=True, key=lambda entry: entry["published_parsed"])
+    for entry in sorted_feed[:limit]:
+        entry_timestamp = time.strftime("%m/%d %I:%M%p", entry["published_parsed"])
+        feed_output += '<p><a href="%s">%s | %s<a><p>' % (entry["link"], entry_timestamp, entry["title"])
+    return feed_output
+
+
+def main():
+    widget = RssFeedWidget(data={"url": "https://example.com/feed.xml", "feed_display_limit": DISPLAY_LIMIT})
+    widget.is_valid()
+    feed = {}
+
+    print("%8s %14s %14s %8s" % ("entries", "previous (ms)", "current (ms)", "speedup"))
+    # The feed layer is stubbed to compact freshly parsed entries, so the timing covers selection and rendering
+    with patch(
+        "open_widget_framework.widget_classes.get_feed_entries",
+        lambda url, limit: compact_entries(feed["entries"], limit),
+    ):
+        for size in FEED_SIZES:
+            feed["entries"] = make_entries(size)
+            previous = min(timeit.repeat(
+                lambda: previous_render(feed["entries"], DISPLAY_LIMIT), number=1, repeat=REPEAT
+            ))
+            current = min(timeit.repeat(widget.render, number=1, repeat=REPEAT))
+            print("%8s %14.2f %14.2f %7.1fx" % (size, previous * 1000, current * 1000, previous / current))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark of the memory held per widget while a widget-list renders.
+
+Compares the previous representation (a values() dict per widget row, and a deep copy of the widget class fields for
+each validated widget class serializer) against the current one (a named tuple per widget row, and fields shared by
+every serializer of a widget class). render_many holds the serializers of every uncached widget of a class at once, so
+both are measured while a whole list is held. Run with:
+
+    python benchmarks/widget_row_memory.py
+"""
+import os
+import sys
+import tracemalloc
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+# No queries are made; the database settings are only needed to build the widget serializers
+settings.configure(
+    INSTALLED_APPS=["django.contrib.auth", "django.contrib.contenttypes", "open_widget_framework"],
+    DATABASES={"default": {"ENGINE": "django.db.backends.postgresql_psycopg2", "NAME": "widgetdb"}},
+)
+django.setup()
+
+from django.db.models.query import NamedValuesListIterable  # noqa: E402
+
+from open_widget_framework.widget_classes import RssFeedWidget  # noqa: E402
+from open_widget_framework.widget_serializer import get_widget_row_fields  # noqa: E402
+
+LIST_SIZES = (100, 1000, 10000)
+
+
+class PreviousRssFeedWidget(RssFeedWidget):
+    """RssFeedWidget with the fields deep copied for each serializer, as all widget classes had before"""
+
+    @classmethod
+    def has_static_fields(cls):
+        return False
+
+
+@lru_cache(maxsize=None)
+def get_row_columns():
+    """The columns that get_widget_rows loads"""
+    return ("configuration_hash", "rendered_body", "render_version") + tuple(
+        column for _, column in get_widget_row_fields()
+    )
+
+
+def make_values(index):
+    """Build the column values of one widget row"""
+    values = {
+        "configuration_hash": "%040x" % index,
+        "rendered_body": "<p>widget %s</p>" % index,
+        "render_version": 1,
+        "id": index,
+        "widget_list_id": 1,
+        "widget_class": "RssFeedWidget",
+        "react_renderer": None,
+        "position": index,
+        "title": "widget %s" % index,
+    }
+    return tuple(values[column] for column in get_row_columns())
+
+
+def previous_rows(count):
+    """Rows as values() dicts"""
+    columns = get_row_columns()
+    return [dict(zip(columns, make_values(index))) for index in range(count)]
+
+
+def current_rows(count):
+    """Rows as values_list(named=True) named tuples"""
+    row_class = NamedValuesListIterable.create_namedtuple_class(*get_row_columns())
+    return [row_class(*make_values(index)) for index in range(count)]
+
+
+def validated_serializers(widget_class, count):
+    """The validated widget class serializers that render_many is called with"""
+    serializers = []
+    for index in range(count):
+        serializer = widget_class(data={"url": "https://example.com/%s.xml" % index, "feed_display_limit": 3})
+        serializer.is_valid()
+        serializers.append(serializer)
+    return serializers
+
+
+def measure(build, count):
+    """Return the bytes allocated per widget by build(count) that are still held after it returns"""
+    tracemalloc.start()
+    held = build(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size / count
+
+
+def main():
+    # Build the shared fields and the row classes once, as a running server would have
+    for build in (previous_rows, current_rows):
+        build(1)
+    validated_serializers(RssFeedWidget, 1)
+    validated_serializers(PreviousRssFeedWidget, 1)
+
+    print("%8s %-12s %16s %16s %8s" % ("widgets", "", "previous (B)", "current (B)", "saved"))
+    for size in LIST_SIZES:
+        for name, previous, current in (
+            ("rows", previous_rows, current_rows),
+            ("serializers", lambda count: validated_serializers(PreviousRssFeedWidget, count),
+             lambda count: validated_serializers(RssFeedWidget, count)),
+        ):
+            previous_size = measure(previous, size)
+            current_size = measure(current, size)
+            print("%8s %-12s %16.0f %16.0f %7.0f%%" % (
+                size, name, previous_size, current_size, 100 * (1 - current_size / previous_size)
+            ))
+
+
+if __name__ == "__main__":
+    main()
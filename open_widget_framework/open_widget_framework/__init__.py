@@ -0,0 +1 @@
+default_app_config = "open_widget_framework.apps.OpenWidgetFrameworkConfig"
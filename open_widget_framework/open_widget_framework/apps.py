@@ -1,8 +1,12 @@
 """
 AppConfig for widget_app
 """
+import logging
+
 from django.apps import AppConfig
 
+log = logging.getLogger(__name__)
+
 
 class OpenWidgetFrameworkConfig(AppConfig):
     """
@@ -10,3 +14,19 @@ class OpenWidgetFrameworkConfig(AppConfig):
     """
 
     name = "open_widget_framework"
+
+    def ready(self):
+        """
+        Warm up the widget classes and form specs when WIDGET_WARM_UP_ON_READY is set, so the first requests of a new
+            worker do not pay for them
+        """
+        from open_widget_framework.settings import api_settings
+
+        if api_settings.WIDGET_WARM_UP_ON_READY:
+            # Imported here so that processes which do not warm up, such as migrations, do not load the widget classes
+            from open_widget_framework.warmup import warm_up
+
+            timings = warm_up()
+            log.info("Warmed up open_widget_framework: %s", ", ".join(
+                "%s %.1fms" % (step, seconds * 1000) for step, seconds in timings.items()
+            ))
@@ -0,0 +1,85 @@
+"""
+WidgetApp async views
+
+These views are registered in urls.py on Django versions that support async views (3.1+) and are meant for ASGI
+deployments. They render the widgets on a list concurrently, so a list of I/O bound widgets such as rss feeds takes
+about as long as its slowest widget and no worker thread is held while they render. Database work runs in a thread
+through sync_to_async.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.http import Http404
+from rest_framework.exceptions import APIException
+
+from open_widget_framework.db_routers import get_widget_lists_for_read
+from open_widget_framework.models import WidgetList
+from open_widget_framework.rendering import arender_prepared_widgets, prepare_widget_renders
+from open_widget_framework.views import WidgetListViewSet, get_widget_list_ids
+
+
+def get_widget_list_view(request):
+    """
+    get_widget_list_view returns a WidgetListViewSet for request, as DRF would build to serve it, with the request
+        authenticated by the widget-framework authentication classes. The view is passed to the permission classes
+    :raises APIException: if authentication fails or the request is not permitted
+    """
+    view = WidgetListViewSet(action_map={'get': 'retrieve'}, args=(), kwargs={}, format_kwarg=None)
+    view.request = view.initialize_request(request)
+    view.perform_authentication(view.request)
+    view.check_permissions(view.request)
+    return view
+
+
+@sync_to_async
+def prepare_widget_list_renders(request, widget_list_ids):
+    """
+    Load the widget-lists with ids widget_list_ids and prepare their widgets for rendering
+    """
+    view = get_widget_list_view(request)
+    prepared = {}
+    for widget_list in get_widget_lists_for_read(WidgetList.objects.all(), widget_list_ids).values():
+        view.check_object_permissions(view.request, widget_list)
+        prepared[widget_list.id] = prepare_widget_renders(widget_list.get_widgets())
+    return prepared
+
+
+@sync_to_async
+def prepare_widget_list_render(request, pk):
+    """
+    Load the widget-list with id pk, or raise Http404, and prepare its widgets for rendering
+    """
+    view = get_widget_list_view(request)
+    widget_list = get_widget_lists_for_read(WidgetList.objects.all(), [int(pk)]).get(int(pk))
+    if widget_list is None:
+        raise Http404
+    view.check_object_permissions(view.request, widget_list)
+    return prepare_widget_renders(widget_list.get_widgets())
+
+
+async def widget_list_retrieve(request, pk):
+    """
+    Async version of WidgetListViewSet.retrieve
+    """
+    try:
+        prepared = await prepare_widget_list_render(request, pk)
+    except APIException as error:
+        return JsonResponse({'detail': error.detail}, status=error.status_code)
+    return JsonResponse(await arender_prepared_widgets(prepared), safe=False)
+
+
+async def widget_list_batch(request):
+    """
+    Async version of WidgetListViewSet.batch. The widgets of all requested lists render concurrently
+    """
+    try:
+        widget_list_ids = get_widget_list_ids(request)
+        prepared = await prepare_widget_list_renders(request, widget_list_ids)
+    except APIException as error:
+        return JsonResponse({'detail': error.detail}, status=error.status_code)
+    widget_list_ids = list(prepared.keys())
+    rendered_widget_lists = await asyncio.gather(
+        *(arender_prepared_widgets(prepared[widget_list_id]) for widget_list_id in widget_list_ids)
+    )
+    return JsonResponse(dict(zip(widget_list_ids, rendered_widget_lists)))
@@ -0,0 +1,106 @@
+"""
+WidgetApp database routing for read replicas
+
+When WIDGET_READ_DATABASE names a database alias, WidgetReadReplicaRouter sends reads of widget-lists and widgets to it
+and leaves writes on the default (primary) database. Reads stay on the primary:
+    - inside transactions on the primary, so a mutation never reads rows older than the ones it is changing
+    - inside use_primary_database blocks, which the views use for every request that changes widgets
+    - for widgets of a widget-list that was itself loaded from the primary
+    - for widget-lists written in the last WIDGET_READ_YOUR_WRITES_TIMEOUT seconds whose replica row is missing or
+      has an older version than the one written (read-your-writes)
+
+Add "open_widget_framework.db_routers.WidgetReadReplicaRouter" to DATABASE_ROUTERS to enable it.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from open_widget_framework.settings import api_settings
+
+WRITTEN_VERSION_CACHE_KEY_PREFIX = "open_widget_framework:list-written:"
+
+# Whether the current thread is inside a use_primary_database block
+_routing = threading.local()
+
+
+@contextmanager
+def use_primary_database():
+    """
+    use_primary_database sends all widget reads inside the block to the primary database
+    """
+    previous = getattr(_routing, "use_primary_database", False)
+    _routing.use_primary_database = True
+    try:
+        yield
+    finally:
+        _routing.use_primary_database = previous
+
+
+class WidgetReadReplicaRouter:
+    """
+    WidgetReadReplicaRouter routes reads of the open_widget_framework models to WIDGET_READ_DATABASE. Models of other
+        apps, and all writes, are left to the next router or the default database
+    """
+    app_label = "open_widget_framework"
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not api_settings.WIDGET_READ_DATABASE:
+            return None
+        if getattr(_routing, "use_primary_database", False) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # Related rows are read from the database their widget-list was read from
+            return instance._state.db
+        return api_settings.WIDGET_READ_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == self.app_label and obj2._meta.app_label == self.app_label:
+            # The replica holds the same rows as the primary
+            return True
+        return None
+
+
+def get_written_version_cache_key(widget_list_id):
+    """
+    get_written_version_cache_key returns the cache key of the last version written for a widget-list
+    """
+    return "%s%s" % (WRITTEN_VERSION_CACHE_KEY_PREFIX, widget_list_id)
+
+
+def record_widget_list_write(widget_list):
+    """
+    record_widget_list_write remembers the version of a widget-list that was just written to the primary for
+        WIDGET_READ_YOUR_WRITES_TIMEOUT seconds, so reads of the list can tell whether the replica has caught up
+    """
+    if api_settings.WIDGET_READ_DATABASE:
+        cache.set(
+            get_written_version_cache_key(widget_list.id),
+            widget_list.version,
+            api_settings.WIDGET_READ_YOUR_WRITES_TIMEOUT,
+        )
+
+
+def get_widget_lists_for_read(queryset, widget_list_ids):
+    """
+    get_widget_lists_for_read loads the widget-lists of a queryset with ids in widget_list_ids, reloading from the
+        primary any that were written recently and are missing or out of date on the replica. Their widgets are then
+        read from the primary as well.
+    :return: a dict mapping widget-list ids to widget-lists
+    """
+    widget_lists = {widget_list.id: widget_list for widget_list in queryset.filter(pk__in=widget_list_ids)}
+    if not api_settings.WIDGET_READ_DATABASE or not widget_list_ids:
+        return widget_lists
+
+    written_versions = cache.get_many([get_written_version_cache_key(pk) for pk in widget_list_ids])
+    stale_ids = []
+    for pk in widget_list_ids:
+        written_version = written_versions.get(get_written_version_cache_key(pk))
+        if written_version is not None and (pk not in widget_lists or widget_lists[pk].version < written_version):
+            stale_ids.append(pk)
+    if stale_ids:
+        with use_primary_database():
+            widget_lists.update({widget_list.id: widget_list for widget_list in queryset.filter(pk__in=stale_ids)})
+    return widget_lists
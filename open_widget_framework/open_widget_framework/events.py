@@ -0,0 +1,114 @@
+"""
+WidgetApp widget-list change events
+
+Every change to a widget-list publishes a compact event (widget added/updated/moved/deleted plus the new list version)
+through the backend set in WIDGET_EVENT_BACKEND, and clients subscribe to the event stream of a list instead of polling
+it. The default InProcessEventBackend only delivers events within one process; deployments with several processes
+should configure a backend built on a shared message broker.
+"""
+import threading
+import time
+from collections import deque
+
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from open_widget_framework.settings import api_settings
+
+WIDGET_ADDED = "widget_added"
+WIDGET_UPDATED = "widget_updated"
+WIDGET_MOVED = "widget_moved"
+WIDGET_DELETED = "widget_deleted"
+# Sent to a subscriber that missed events which are no longer available, so it has to fetch the whole list again
+RESYNC = "resync"
+
+
+class BaseEventBackend:
+    """
+    BaseEventBackend is the interface for widget-list event backends
+    """
+
+    def publish(self, widget_list_id, event):
+        """
+        publish sends event to all subscribers of the widget-list. Events for a list are published in version order
+        """
+        raise NotImplementedError
+
+    def subscribe(self, widget_list_id, last_version, timeout):
+        """
+        subscribe returns an iterator of events for the widget-list with a version greater than last_version. If
+            events after last_version are no longer available it starts with a RESYNC event. When no event arrives
+            within timeout seconds it yields None, so callers can send keepalives or stop.
+        """
+        raise NotImplementedError
+
+
+class InProcessEventBackend(BaseEventBackend):
+    """
+    InProcessEventBackend keeps the last WIDGET_EVENT_HISTORY events of each widget-list in memory and wakes up
+        subscribers in the same process when an event is published
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.history = {}
+
+    def publish(self, widget_list_id, event):
+        with self.condition:
+            if widget_list_id not in self.history:
+                self.history[widget_list_id] = deque(maxlen=api_settings.WIDGET_EVENT_HISTORY)
+            self.history[widget_list_id].append(event)
+            self.condition.notify_all()
+
+    def get_events(self, widget_list_id, last_version):
+        """
+        get_events returns the stored events of a widget-list after last_version, starting with a RESYNC event if some
+            of them are no longer stored
+        """
+        history = self.history.get(widget_list_id, ())
+        events = [event for event in history if event["version"] > last_version]
+        if history and history[0]["version"] > last_version + 1:
+            events.insert(0, {"type": RESYNC, "widget_list": widget_list_id, "version": history[-1]["version"]})
+        return events
+
+    def subscribe(self, widget_list_id, last_version, timeout):
+        while True:
+            deadline = time.monotonic() + timeout
+            with self.condition:
+                events = self.get_events(widget_list_id, last_version)
+                while not events and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                    events = self.get_events(widget_list_id, last_version)
+            if not events:
+                yield None
+            for event in events:
+                last_version = max(last_version, event["version"])
+                yield event
+
+
+_event_backends = {}
+
+
+def get_event_backend():
+    """
+    get_event_backend returns the configured event backend. There is one backend instance per process
+    """
+    backend_path = api_settings.WIDGET_EVENT_BACKEND
+    if backend_path not in _event_backends:
+        _event_backends[backend_path] = import_string(backend_path)()
+    return _event_backends[backend_path]
+
+
+def publish_widget_list_event(widget_list, event_type, widget_id, position=None):
+    """
+    publish_widget_list_event publishes a change to a widget-list once the current transaction commits, so events are
+        never sent for changes that are rolled back. widget_list.version must already be the new list version
+    """
+    event = {
+        "type": event_type,
+        "widget_list": widget_list.id,
+        "widget": widget_id,
+        "position": position,
+        "version": widget_list.version,
+    }
+    transaction.on_commit(lambda: get_event_backend().publish(widget_list.id, event))
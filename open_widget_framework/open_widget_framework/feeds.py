@@ -0,0 +1,136 @@
+"""
+WidgetApp RSS feed fetching
+
+Feeds are fetched with conditional requests: the upstream ETag and Last-Modified validators are stored in the django
+cache along with a compact copy of the top entries, so an unchanged feed costs a 304 and no parsing.
+"""
+import calendar
+import hashlib
+import heapq
+import socket
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.cache import cache
+
+from open_widget_framework.settings import api_settings
+
+FEED_CACHE_KEY_PREFIX = "open_widget_framework:feed:v2:"
+FEED_READ_CHUNK_SIZE = 64 * 1024
+
+
+class FeedFetchError(Exception):
+    """Raised when an upstream feed cannot be fetched within the configured limits"""
+
+
+def get_feed_cache_key(url):
+    """
+    get_feed_cache_key returns the cache key under which the validators and entries for a feed url are stored
+    """
+    return FEED_CACHE_KEY_PREFIX + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def fetch_feed(url, etag=None, modified=None):
+    """
+    fetch_feed downloads a feed, sending If-None-Match/If-Modified-Since when validators are given. The download is
+        capped at RSS_FEED_MAX_BYTES and must complete within RSS_FEED_TIMEOUT seconds.
+    :return: a tuple of (body, etag, modified). body is None if the upstream answered 304 Not Modified
+    """
+    headers = {"User-Agent": "open_widget_framework"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+
+    timeout = api_settings.RSS_FEED_TIMEOUT
+    max_bytes = api_settings.RSS_FEED_MAX_BYTES
+    deadline = time.monotonic() + timeout
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as error:
+        if error.code == 304:
+            return None, etag, modified
+        raise FeedFetchError("Feed %s returned status %s" % (url, error.code))
+    except (URLError, socket.timeout, ValueError) as error:
+        raise FeedFetchError("Feed %s could not be fetched: %s" % (url, error))
+
+    with response:
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise FeedFetchError("Feed %s is larger than %s bytes" % (url, max_bytes))
+        chunks = []
+        size = 0
+        try:
+            while True:
+                chunk = response.read(FEED_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FeedFetchError("Feed %s is larger than %s bytes" % (url, max_bytes))
+                if time.monotonic() > deadline:
+                    raise FeedFetchError("Feed %s took longer than %s seconds" % (url, timeout))
+                chunks.append(chunk)
+        except OSError as error:
+            raise FeedFetchError("Feed %s could not be read: %s" % (url, error))
+
+        return b"".join(chunks), response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+
+def _entry_timestamp(entry):
+    """Return a parsed entry's publication (or else update) time, or an empty tuple so undated entries sort last"""
+    return entry.get("published_parsed") or entry.get("updated_parsed") or ()
+
+
+def compact_entries(entries, limit):
+    """
+    compact_entries reduces parsed feedparser entries to the newest limit entries, each stored as a
+        (timestamp, title, link) tuple where timestamp is seconds since the epoch (UTC) or None. The newest entries
+        are selected with a heap rather than by sorting the whole feed, and only the selected entries are converted.
+    """
+    compacted = []
+    for entry in heapq.nlargest(limit, entries, key=_entry_timestamp):
+        timestamp = _entry_timestamp(entry)
+        compacted.append((calendar.timegm(timestamp) if timestamp else None, entry.get("title"), entry.get("link")))
+    return compacted
+
+
+def get_feed_entries(url, limit):
+    """
+    get_feed_entries returns the newest limit entries of a feed as compact (timestamp, title, link) tuples. The stored
+        validators are sent upstream and the stored entries are reused when the feed has not changed. If the feed
+        cannot be fetched the last stored entries are returned, or an empty list if there are none.
+    """
+    cache_key = get_feed_cache_key(url)
+    stored = cache.get(cache_key)
+    if stored and stored["limit"] < limit:
+        # The stored entries are not enough to satisfy this request so the feed has to be parsed again
+        stored = None
+
+    try:
+        body, etag, modified = fetch_feed(
+            url,
+            etag=stored["etag"] if stored else None,
+            modified=stored["modified"] if stored else None,
+        )
+    except FeedFetchError:
+        return stored["entries"][:limit] if stored else []
+
+    if body is None:
+        if not stored:
+            return []
+        cache.touch(cache_key, api_settings.RSS_FEED_CACHE_TIMEOUT)
+        return stored["entries"][:limit]
+
+    # feedparser is slow to import and only needed when a feed body has to be parsed
+    import feedparser
+
+    entries = compact_entries(feedparser.parse(body).entries, limit)
+    if etag or modified:
+        cache.set(
+            cache_key,
+            {"etag": etag, "modified": modified, "limit": limit, "entries": entries},
+            api_settings.RSS_FEED_CACHE_TIMEOUT,
+        )
+    return entries
@@ -0,0 +1,119 @@
+"""
+WidgetApp file storage for file widgets
+
+Uploaded files are streamed to a temporary file in chunks while they are hashed, then saved to the widget file storage
+under their sha256 content hash, so identical uploads are stored once. Stored files never change, so downloads are
+served with long-lived cache headers and the content hash as their ETag.
+"""
+import hashlib
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils.module_loading import import_string
+
+from open_widget_framework.settings import api_settings
+
+CONTENT_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload is larger than WIDGET_FILE_MAX_BYTES"""
+
+
+def get_file_storage():
+    """
+    get_file_storage returns the storage that widget files are kept in: an instance of WIDGET_FILE_STORAGE, or the
+        default storage if it is not set
+    """
+    if api_settings.WIDGET_FILE_STORAGE is None:
+        return default_storage
+    return import_string(api_settings.WIDGET_FILE_STORAGE)()
+
+
+def is_content_hash(value):
+    """
+    is_content_hash returns whether value has the form of a stored file's content hash
+    """
+    return isinstance(value, str) and bool(CONTENT_HASH_PATTERN.match(value))
+
+
+def get_file_path(content_hash):
+    """
+    get_file_path returns the storage path of the file with a content hash. Files are spread across directories by the
+        first characters of their hash so that no directory grows too large
+    """
+    return "%s/%s/%s" % (api_settings.WIDGET_FILE_DIRECTORY, content_hash[:2], content_hash)
+
+
+def store_file(stream, storage=None):
+    """
+    store_file reads an uploaded file from stream in WIDGET_FILE_CHUNK_SIZE chunks, hashing each chunk as it is
+        written to a temporary file, so the upload is never held in memory. The file is then saved to storage under its
+        content hash unless a file with the same content is already stored.
+    :return: a tuple of (content_hash, size)
+    """
+    storage = storage or get_file_storage()
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile() as temporary_file:
+        for chunk in iter(lambda: stream.read(api_settings.WIDGET_FILE_CHUNK_SIZE), b""):
+            size += len(chunk)
+            if size > api_settings.WIDGET_FILE_MAX_BYTES:
+                raise FileTooLargeError
+            digest.update(chunk)
+            temporary_file.write(chunk)
+        content_hash = digest.hexdigest()
+        path = get_file_path(content_hash)
+        if not storage.exists(path):
+            temporary_file.seek(0)
+            saved_path = storage.save(path, File(temporary_file))
+            if saved_path != path:
+                # A concurrent upload of the same content saved it first, so this copy was given another name
+                storage.delete(saved_path)
+    return content_hash, size
+
+
+def parse_range(range_header, size):
+    """
+    parse_range parses a single range Range header for a file of size bytes.
+    :return: a tuple of (start, end) with end inclusive, None if the header is absent or is not a single byte range
+        (so the whole file is served), or False if the range cannot be satisfied
+    """
+    match = RANGE_PATTERN.match(range_header or "")
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # A suffix range asks for the last bytes of the file
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return False
+    return start, end
+
+
+def iter_file_range(file, start, end):
+    """
+    iter_file_range yields the bytes from start to end inclusive of an open file in WIDGET_FILE_CHUNK_SIZE chunks,
+        then closes it
+    """
+    try:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(api_settings.WIDGET_FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
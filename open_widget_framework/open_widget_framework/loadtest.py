@@ -0,0 +1,372 @@
+"""
+WidgetApp load testing
+
+run_load_test drives the real widget api routes with concurrent readers and editors against the configured database,
+to find how much traffic a widget-list sustains before the select_for_update paths of widget moves and deletes become
+the bottleneck. Readers fetch lists, batches of lists and list html; editors move, retitle, create and delete widgets.
+RSS widgets point at a local stand-in feed server, so no external host is contacted. For each endpoint it reports
+throughput, p50/p95/p99 latency, errors, lock waits and deadlocks. Lock waits are sampled from pg_locks, so they are
+only reported on postgres. A run lasts for a duration, or until each reader and editor has sent a fixed number of
+requests.
+
+The load test creates its own widget-lists and deletes them afterwards, but it writes to the configured database and
+must not be pointed at production.
+"""
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from open_widget_framework.models import WidgetInstance, WidgetList
+
+LOCK_SAMPLE_INTERVAL = 0.01
+DEADLOCK_DETECTED = "40P01"
+
+
+def make_load_test_configuration(widget_class_name, index, feed_url):
+    """
+    make_load_test_configuration returns a configuration for a widget of the load test. Text widgets get distinct
+        configurations while URL and RSS widgets share theirs, as they tend to in real lists
+    """
+    if widget_class_name == "Text":
+        return {"body": "Load test widget %s" % index}
+    if widget_class_name == "URL":
+        return {"url": "https://example.com/"}
+    if widget_class_name == "RSS Feed":
+        return {"url": feed_url, "feed_display_limit": 3}
+    raise ValueError("the load test cannot configure %s widgets" % widget_class_name)
+
+
+def parse_mix(mix):
+    """
+    parse_mix parses a mix such as "Text=3,URL=1" into a list of (name, weight) pairs
+    """
+    pairs = []
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        pairs.append((name.strip(), float(weight or 1)))
+    return pairs
+
+
+def choose(pairs):
+    """
+    choose picks a name from (name, weight) pairs with probability proportional to its weight
+    """
+    names, weights = zip(*pairs)
+    return random.choices(names, weights)[0]
+
+
+class FeedServer(ThreadingMixIn, HTTPServer):
+    """
+    FeedServer serves each request in its own thread
+    """
+    daemon_threads = True
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """
+    FeedHandler serves a small rss feed for every path
+    """
+    body = (
+        '<rss version="2.0"><channel><title>Load test feed</title>%s</channel></rss>' % "".join(
+            "<item><title>Entry %s</title><link>https://example.com/%s</link>"
+            "<pubDate>%02d Jan 2018 12:00:00 GMT</pubDate></item>" % (index, index, index + 1)
+            for index in range(10)
+        )
+    ).encode("utf-8")
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    """
+    percentile returns the nearest-rank percentile of a sorted list
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def is_deadlock(error):
+    """
+    is_deadlock returns whether a database error was raised because the database broke a deadlock
+    """
+    cause = error.__cause__ or error
+    return getattr(cause, "pgcode", None) == DEADLOCK_DETECTED or "deadlock" in str(error).lower()
+
+
+class LoadTest:
+    """
+    LoadTest holds the configuration, widget-lists and measurements of one load test run
+    """
+
+    def __init__(self, readers, editors, duration, lists, list_size, widget_mix, write_mix, username=None,
+                 requests=None):
+        if duration is None and requests is None:
+            raise ValueError("a load test needs a duration or a number of requests")
+        self.readers = readers
+        self.editors = editors
+        self.duration = duration
+        self.requests = requests
+        self.lists = lists
+        self.list_size = list_size
+        self.widget_mix = parse_mix(widget_mix)
+        self.write_mix = parse_mix(write_mix)
+        self.username = username
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.deadlocks = defaultdict(int)
+        self.lock_wait_requests = defaultdict(set)
+        self.lock_wait_seconds = defaultdict(float)
+        # Maps the database backend pid of each worker to the (endpoint, request number) it is running, under lock
+        self.running = {}
+        self.widget_list_ids = []
+        self.widget_ids = {}
+        # Set when the workers should stop: after duration seconds, or once every worker has sent its requests
+        self.stopped = threading.Event()
+
+    def set_up(self, feed_url):
+        """
+        set_up creates the widget-lists of the load test
+        """
+        for list_number in range(self.lists):
+            widget_list = WidgetList.objects.create()
+            for position in range(self.list_size):
+                widget_class_name = choose(self.widget_mix)
+                WidgetInstance.objects.create(
+                    widget_list=widget_list,
+                    position=position,
+                    title="Load test widget %s" % position,
+                    widget_class=widget_class_name,
+                    configuration=make_load_test_configuration(
+                        widget_class_name, "%s-%s" % (list_number, position), feed_url
+                    ),
+                )
+            self.widget_list_ids.append(widget_list.id)
+            self.widget_ids[widget_list.id] = list(widget_list.get_widgets().values_list("id", flat=True))
+
+    def tear_down(self):
+        """
+        tear_down deletes the widget-lists of the load test
+        """
+        WidgetList.objects.filter(pk__in=self.widget_list_ids).delete()
+
+    def make_client(self):
+        """
+        make_client returns a test client for a worker, logged in as the load test user if there is one
+        """
+        client = Client()
+        if self.username:
+            from django.contrib.auth import get_user_model
+
+            client.force_login(get_user_model().objects.get(username=self.username))
+        return client
+
+    def request(self, endpoint, pid, number, send):
+        """
+        request sends one request for an endpoint and records its latency, or the error it failed with
+        """
+        with self.lock:
+            self.running[pid] = (endpoint, number)
+        start = time.perf_counter()
+        try:
+            response = send()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        except Exception as error:  # pylint: disable=broad-except
+            with self.lock:
+                self.errors[endpoint] += 1
+                if isinstance(error, DatabaseError) and is_deadlock(error):
+                    self.deadlocks[endpoint] += 1
+            return None
+        finally:
+            with self.lock:
+                self.running.pop(pid, None)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if response.status_code >= 400:
+                self.errors[endpoint] += 1
+        return response
+
+    def read(self, client, pid, number):
+        """
+        read sends one reader request
+        """
+        widget_list_id = random.choice(self.widget_list_ids)
+        endpoint = choose([("retrieve", 6), ("batch", 2), ("html", 2)])
+        if endpoint == "retrieve":
+            url = reverse("widget-list-detail", kwargs={"pk": widget_list_id})
+        elif endpoint == "batch":
+            url = "%s?ids=%s" % (
+                reverse("widget-list-batch"),
+                ",".join(str(pk) for pk in random.sample(self.widget_list_ids, min(3, len(self.widget_list_ids)))),
+            )
+        else:
+            url = reverse("widget-list-html", kwargs={"pk": widget_list_id})
+        self.request(endpoint, pid, number, lambda: client.get(url))
+
+    def write(self, client, pid, number):
+        """
+        write sends one editor request. Editors only delete widgets they created, so the widgets that are moved and
+            retitled always exist and the lists keep about list_size widgets
+        """
+        widget_list_id = random.choice(self.widget_list_ids)
+        widget_id = random.choice(self.widget_ids[widget_list_id])
+        widget_url = reverse("widget-detail", kwargs={"pk": widget_id})
+        operation = choose(self.write_mix)
+        if operation == "move":
+            data = {"position": random.randrange(self.list_size)}
+            self.request("move", pid, number, lambda: client.patch(
+                widget_url, data=json.dumps(data), content_type="application/json"
+            ))
+        elif operation == "update":
+            data = {"title": "Load test widget %s" % number}
+            self.request("update", pid, number, lambda: client.patch(
+                widget_url, data=json.dumps(data), content_type="application/json"
+            ))
+        elif operation == "create":
+            data = {
+                "widget_list": widget_list_id,
+                # Concurrent editors may take the same position, which the report shows as create errors
+                "position": WidgetInstance.objects.filter(widget_list_id=widget_list_id).count(),
+                "title": "Load test widget %s" % number,
+                "widget_class": "Text",
+                "react_renderer": None,
+                "configuration": {"body": "Load test widget %s" % number},
+            }
+            response = self.request("create", pid, number, lambda: client.post(
+                reverse("widget-list"), data=json.dumps(data), content_type="application/json"
+            ))
+            if response is not None and response.status_code < 400:
+                created = max(json.loads(response.content), key=lambda widget: widget["position"])
+                self.request("destroy", pid, number, lambda: client.delete(
+                    reverse("widget-detail", kwargs={"pk": created["id"]})
+                ))
+        else:
+            raise ValueError("unknown write operation %s" % operation)
+
+    def run_worker(self, operation):
+        """
+        run_worker sends requests with operation until the load test ends, or until it has sent requests of them
+        """
+        try:
+            client = self.make_client()
+            with connection.cursor() as cursor:
+                pid = None
+                if connection.vendor == "postgresql":
+                    cursor.execute("SELECT pg_backend_pid()")
+                    pid = cursor.fetchone()[0]
+            pid = pid or threading.get_ident()
+            number = 0
+            while not self.stopped.is_set() and (self.requests is None or number < self.requests):
+                number += 1
+                operation(client, pid, number)
+        finally:
+            connection.close()
+
+    def sample_lock_waits(self):
+        """
+        sample_lock_waits polls pg_locks while the load test runs and charges every request seen waiting for a lock
+            to its endpoint
+        """
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.wait(LOCK_SAMPLE_INTERVAL):
+                    cursor.execute("SELECT DISTINCT pid FROM pg_locks WHERE NOT granted")
+                    waiting_pids = [pid for (pid,) in cursor.fetchall()]
+                    with self.lock:
+                        for pid in waiting_pids:
+                            running = self.running.get(pid)
+                            if running is not None:
+                                endpoint, number = running
+                                self.lock_wait_requests[endpoint].add((pid, number))
+                                self.lock_wait_seconds[endpoint] += LOCK_SAMPLE_INTERVAL
+        finally:
+            connection.close()
+
+    def run(self):
+        """
+        run sets up the widget-lists, runs the readers and editors for duration seconds, or until each has sent
+            requests requests, cleans up and returns the report
+        """
+        feed_server = FeedServer(("127.0.0.1", 0), FeedHandler)
+        threading.Thread(target=feed_server.serve_forever, daemon=True).start()
+        # The test client sends requests for the host "testserver"
+        allowed_hosts = override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ["testserver"])
+        allowed_hosts.enable()
+        try:
+            self.set_up("http://127.0.0.1:%s/feed.xml" % feed_server.server_address[1])
+            try:
+                workers = [threading.Thread(target=self.run_worker, args=(self.read,)) for _ in range(self.readers)]
+                workers += [threading.Thread(target=self.run_worker, args=(self.write,)) for _ in range(self.editors)]
+                samplers = []
+                if connection.vendor == "postgresql":
+                    samplers.append(threading.Thread(target=self.sample_lock_waits))
+                timer = threading.Timer(self.duration, self.stopped.set) if self.duration is not None else None
+                start = time.monotonic()
+                for thread in workers + samplers + ([timer] if timer else []):
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+                elapsed = time.monotonic() - start
+                self.stopped.set()
+                if timer:
+                    timer.cancel()
+                for thread in samplers:
+                    thread.join()
+            finally:
+                self.tear_down()
+        finally:
+            allowed_hosts.disable()
+            feed_server.shutdown()
+            feed_server.server_close()
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        """
+        report summarizes the measurements of each endpoint
+        """
+        lock_waits_measured = connection.vendor == "postgresql"
+        report = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[endpoint])
+            report[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "throughput": len(latencies) / elapsed,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "lock_waits": len(self.lock_wait_requests[endpoint]) if lock_waits_measured else None,
+                "lock_wait_seconds": self.lock_wait_seconds[endpoint] if lock_waits_measured else None,
+                "deadlocks": self.deadlocks[endpoint],
+            }
+        return report
+
+
+def run_load_test(**options):
+    """
+    run_load_test runs a load test with the options of LoadTest, for duration seconds or, with duration None, until
+        each reader and editor has sent requests requests, and returns a dict mapping each endpoint to its
+        requests, errors, throughput (requests per second), p50/p95/p99 latency (seconds), lock waits (requests seen
+        waiting for a lock, or None if they cannot be measured), lock wait seconds and deadlocks
+    """
+    return LoadTest(**options).run()
@@ -0,0 +1,77 @@
+"""
+Management command to export widget-lists as newline delimited json
+"""
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from open_widget_framework.models import WidgetInstance, WidgetList
+from open_widget_framework.widget_serializer import load_configurations
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def iter_widget_rows(widgets):
+    """
+    iter_widget_rows yields a values_list row for each widget of a queryset, ending with its configuration. Rows are
+        loaded in chunks, along with the configurations of the chunk that are kept in the WidgetConfiguration store
+    """
+    rows = widgets.values_list(
+        "widget_list_id", "position", "title", "widget_class", "react_renderer", "configuration", "configuration_hash"
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        configurations = load_configurations(
+            ((index, row[5], row[6]) for index, row in enumerate(chunk)), using=widgets.db
+        )
+        for index, row in enumerate(chunk):
+            yield row[:5] + (configurations[index],)
+
+
+class Command(BaseCommand):
+    """
+    Export widget-lists as newline delimited json: one line per widget-list followed by one line per widget on it, in
+        position order. The export is streamed, so any number of widgets can be exported in bounded memory
+    """
+    help = "Export widget-lists (all of them by default) as newline delimited json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("widget_list_ids", nargs="*", type=int, help="ids of the widget-lists to export")
+        parser.add_argument("--output", default="-", help="file to write to, or - for stdout (the default)")
+
+    def handle(self, *args, **options):
+        output = self.stdout if options["output"] == "-" else open(options["output"], "w")
+        try:
+            self.export(output, options["widget_list_ids"])
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+    @staticmethod
+    def export(output, widget_list_ids):
+        """
+        export writes the widget-lists with ids widget_list_ids, or all widget-lists if there are none, to output
+        """
+        widget_lists = WidgetList.objects.order_by("id")
+        widgets = WidgetInstance.objects.order_by("widget_list_id", "position")
+        if widget_list_ids:
+            widget_lists = widget_lists.filter(id__in=widget_list_ids)
+            widgets = widgets.filter(widget_list_id__in=widget_list_ids)
+
+        widget_rows = iter_widget_rows(widgets)
+        widget_row = next(widget_rows, None)
+        for widget_list_id in widget_lists.values_list("id", flat=True).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            output.write(json.dumps({"type": "widget_list", "id": widget_list_id}) + "\n")
+            while widget_row is not None and widget_row[0] == widget_list_id:
+                output.write(json.dumps({
+                    "type": "widget",
+                    "position": widget_row[1],
+                    "title": widget_row[2],
+                    "widget_class": widget_row[3],
+                    "react_renderer": widget_row[4],
+                    "configuration": widget_row[5],
+                }) + "\n")
+                widget_row = next(widget_rows, None)
@@ -0,0 +1,149 @@
+"""
+Management command to import widget-lists from newline delimited json
+"""
+import json
+import sys
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+from rest_framework.serializers import ValidationError
+
+from open_widget_framework.models import WidgetInstance, WidgetList, refresh_widget_list_metadata, \
+    store_configurations
+from open_widget_framework.utils import get_configuration_hash
+from open_widget_framework.widget_serializer import get_widget_class_serializer
+
+
+class Command(BaseCommand):
+    """
+    Import widget-lists written by export_widget_lists. Every widget-list in the input is created as a new widget-list.
+        Widgets are inserted with bulk_create in batches and their configurations are validated in batches, with one
+        widget class serializer per class per batch, so any number of widgets can be imported in bounded memory. The
+        widgets of each widget-list must have the positions 0 to n - 1. The import runs in one transaction and nothing
+        is imported if any line is invalid.
+    """
+    help = "Import widget-lists from newline delimited json written by export_widget_lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", nargs="?", default="-", help="file to read, or - for stdin (the default)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="widgets to validate and insert at once")
+
+    def handle(self, *args, **options):
+        lines = sys.stdin if options["input"] == "-" else open(options["input"])
+        try:
+            with atomic():
+                widget_list_ids = self.import_lines(lines, options["batch_size"])
+                refresh_widget_list_metadata(widget_list_ids)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+        self.stdout.write("Imported %s widget-lists: %s" % (len(widget_list_ids), widget_list_ids))
+
+    def import_lines(self, lines, batch_size):
+        """
+        import_lines creates the widget-lists and widgets described by lines and returns the ids of the new widget-lists
+        """
+        widget_list_ids = []
+        widget_list = None
+        positions = set()
+        batch = []
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CommandError("Line %s is not valid json" % line_number)
+
+            if record.get("type") == "widget_list":
+                self.check_positions(widget_list, positions)
+                widget_list = WidgetList.objects.create()
+                positions = set()
+                widget_list_ids.append(widget_list.id)
+            elif record.get("type") == "widget":
+                if widget_list is None:
+                    raise CommandError("Line %s: a widget must follow its widget_list" % line_number)
+                try:
+                    position = int(record["position"])
+                except (KeyError, TypeError, ValueError):
+                    raise CommandError("Line %s: widgets need a position, title, widget_class and configuration" %
+                                       line_number)
+                if position in positions:
+                    raise CommandError("Line %s: position %s is already used on its widget-list" %
+                                       (line_number, position))
+                positions.add(position)
+                batch.append((line_number, widget_list, record))
+                if len(batch) >= batch_size:
+                    self.import_widgets(batch)
+                    batch = []
+            else:
+                raise CommandError("Line %s: unknown record type %s" % (line_number, record.get("type")))
+        self.check_positions(widget_list, positions)
+        self.import_widgets(batch)
+        return widget_list_ids
+
+    @staticmethod
+    def check_positions(widget_list, positions):
+        """
+        check_positions raises a CommandError unless positions, the distinct positions of the widgets imported onto
+            widget_list, are 0 to n - 1
+        """
+        expected = set(range(len(positions)))
+        if positions != expected:
+            raise CommandError("Widget-list %s has %s widgets but none at position %s" %
+                               (widget_list.id, len(positions), min(expected - positions)))
+
+    @staticmethod
+    def get_stored_configuration(widget_class_serializer, configuration):
+        """
+        get_stored_configuration validates configuration with a serializer that is reused for every widget of its class
+            in a batch and returns the configuration to store, as returned by post_configure
+        :raises ValidationError: if the configuration is not valid
+        """
+        widget_class_serializer.initial_data = configuration
+        for attribute in ("_validated_data", "_errors", "_data"):
+            widget_class_serializer.__dict__.pop(attribute, None)
+        widget_class_serializer.is_valid(raise_exception=True)
+        return widget_class_serializer.post_configure()
+
+    def import_widgets(self, batch):
+        """
+        import_widgets validates the configurations of a batch of widget records and inserts them with bulk_create
+        """
+        records_by_class = defaultdict(list)
+        for line_number, widget_list, record in batch:
+            records_by_class[record.get("widget_class")].append((line_number, record))
+
+        configurations = {}
+        for widget_class, records in records_by_class.items():
+            try:
+                # One serializer per class per batch, so pre_configure runs once rather than once per widget
+                widget_class_serializer = get_widget_class_serializer(widget_class)()
+            except ImproperlyConfigured:
+                raise CommandError("Line %s: unrecognized widget class %s" % (records[0][0], widget_class))
+            for line_number, record in records:
+                try:
+                    configurations[line_number] = self.get_stored_configuration(
+                        widget_class_serializer, record.get("configuration")
+                    )
+                except ValidationError as error:
+                    raise CommandError("Line %s: bad configuration %s" % (line_number, error.detail))
+
+        widgets = []
+        for line_number, widget_list, record in batch:
+            try:
+                widgets.append(WidgetInstance(
+                    widget_list=widget_list,
+                    position=int(record["position"]),
+                    title=record["title"],
+                    widget_class=record["widget_class"],
+                    react_renderer=record.get("react_renderer"),
+                    configuration=configurations[line_number],
+                    configuration_hash=get_configuration_hash(configurations[line_number]),
+                ))
+            except (KeyError, TypeError, ValueError):
+                raise CommandError("Line %s: widgets need a position, title, widget_class and configuration" %
+                                   line_number)
+        WidgetInstance.objects.bulk_create(store_configurations(widgets))
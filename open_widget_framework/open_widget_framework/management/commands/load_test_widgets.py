@@ -0,0 +1,67 @@
+"""
+Management command to load test the widget api with concurrent readers and editors
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from open_widget_framework.loadtest import run_load_test
+
+
+class Command(BaseCommand):
+    """
+    Drive the widget api routes with concurrent readers and editors against the configured database and report
+        throughput, latency percentiles, lock waits and deadlocks per endpoint. It creates and deletes its own
+        widget-lists, but writes to the database, so only run it against a local or staging database
+    """
+    help = "Load test the widget api with a mix of concurrent readers and editors"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8, help="concurrent reader threads")
+        parser.add_argument("--editors", type=int, default=2, help="concurrent editor threads")
+        parser.add_argument(
+            "--duration", type=float, help="seconds to run for (10 unless --requests is given, in which case no limit)"
+        )
+        parser.add_argument("--requests", type=int, help="requests for each reader and editor to send")
+        parser.add_argument("--lists", type=int, default=1, help="widget-lists to spread the traffic over")
+        parser.add_argument("--list-size", type=int, default=20, help="widgets on each widget-list")
+        parser.add_argument(
+            "--widget-mix", default="Text=3,URL=1,RSS Feed=1",
+            help="widget classes on the lists with their weights",
+        )
+        parser.add_argument(
+            "--write-mix", default="move=2,update=1,create=1",
+            help="editor operations with their weights; each create is followed by a delete",
+        )
+        parser.add_argument("--username", help="user to make the requests as")
+        parser.add_argument("--json", action="store_true", help="print the report as json")
+
+    def handle(self, *args, **options):
+        report = run_load_test(
+            readers=options["readers"],
+            editors=options["editors"],
+            duration=10 if options["duration"] is None and options["requests"] is None else options["duration"],
+            lists=options["lists"],
+            list_size=options["list_size"],
+            widget_mix=options["widget_mix"],
+            write_mix=options["write_mix"],
+            username=options["username"],
+            requests=options["requests"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write("%-10s %8s %7s %8s %9s %9s %9s %10s %9s" % (
+            "endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "lock waits", "deadlocks"
+        ))
+        for endpoint, stats in report.items():
+            self.stdout.write("%-10s %8d %7d %8.1f %9s %9s %9s %10s %9d" % (
+                endpoint,
+                stats["requests"],
+                stats["errors"],
+                stats["throughput"],
+                *("-" if stats[key] is None else "%.1f" % (stats[key] * 1000) for key in ("p50", "p95", "p99")),
+                "n/a" if stats["lock_waits"] is None else stats["lock_waits"],
+                stats["deadlocks"],
+            ))
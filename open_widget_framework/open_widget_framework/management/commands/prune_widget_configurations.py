@@ -0,0 +1,29 @@
+"""
+Management command to delete stored widget configurations that no widget uses
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from open_widget_framework.models import WidgetConfiguration, WidgetInstance
+
+
+class Command(BaseCommand):
+    """
+    Delete the configurations in the WidgetConfiguration store that no widget uses any more, which are left behind when
+        widgets are changed or deleted. A widget saved while the command runs may use a configuration that was stored
+        before it and is deleted by the command, so run it when widgets are not being edited
+    """
+    help = "Delete stored widget configurations that no widget uses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="count the unused configurations without deleting")
+
+    def handle(self, *args, **options):
+        unused = WidgetConfiguration.objects.annotate(
+            used=Exists(WidgetInstance.objects.filter(configuration_hash=OuterRef("pk")))
+        ).filter(used=False)
+        if options["dry_run"]:
+            self.stdout.write("%s stored widget configurations are unused" % unused.count())
+            return
+        deleted, _ = WidgetConfiguration.objects.filter(pk__in=unused.values("pk")).delete()
+        self.stdout.write("Deleted %s unused stored widget configurations" % deleted)
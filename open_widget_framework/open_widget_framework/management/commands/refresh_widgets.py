@@ -0,0 +1,37 @@
+"""
+Management command to re-render the hot renders of refresh-ahead widget classes before they expire
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from open_widget_framework.refresh import refresh_hot_renders
+from open_widget_framework.settings import api_settings
+
+
+class Command(BaseCommand):
+    """
+    Re-render the cached renders of refresh-ahead widget classes that are still being read and expire within
+        WIDGET_REFRESH_AHEAD seconds. Run it from cron, or with --loop as a long-running process that makes a pass every
+        WIDGET_REFRESH_INTERVAL seconds. The interval should be shorter than WIDGET_REFRESH_AHEAD so that every hot
+        render is refreshed before it expires
+    """
+    help = "Refresh the cached renders of refresh-ahead widgets before they expire"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="keep refreshing until interrupted")
+        parser.add_argument(
+            "--interval", type=float, help="seconds between passes with --loop (defaults to WIDGET_REFRESH_INTERVAL)"
+        )
+
+    def handle(self, *args, **options):
+        if api_settings.WIDGET_REFRESH_AHEAD is None:
+            raise CommandError("WIDGET_REFRESH_AHEAD is not set, so no renders are tracked for refreshing")
+        interval = options["interval"] or api_settings.WIDGET_REFRESH_INTERVAL
+        while True:
+            start = time.monotonic()
+            refreshed, failed = refresh_hot_renders()
+            self.stdout.write("Refreshed %s renders, %s failed" % (refreshed, failed))
+            if not options["loop"]:
+                return
+            time.sleep(max(interval - (time.monotonic() - start), 0))
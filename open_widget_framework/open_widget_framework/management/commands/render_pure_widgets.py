@@ -0,0 +1,86 @@
+"""
+Management command to store the render output of widgets of pure widget classes
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.db.transaction import atomic
+
+from open_widget_framework.events import RESYNC, publish_widget_list_event
+from open_widget_framework.models import WidgetInstance, WidgetList
+from open_widget_framework.utils import get_widget_class_dict
+from open_widget_framework.widget_serializer import SANDBOX_ERROR_BODY, load_configurations, render_widgets
+
+
+class Command(BaseCommand):
+    """
+    Render and store the output of the widgets of pure widget classes that have no stored output or whose output was
+        rendered with an older render_version of their class, and clear the stored output of widgets whose class is no
+        longer pure. Widgets with the same configuration render once, and each class renders in batches with
+        render_many. The versions of the affected widget-lists are incremented so that their cached payloads are
+        rebuilt, and their subscribers are sent a resync event
+    """
+    help = "Re-render the stored output of widgets of pure widget classes whose render version changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="configurations to render at once")
+        parser.add_argument("--force", action="store_true", help="re-render widgets whose output is up to date")
+
+    def handle(self, *args, **options):
+        widget_classes = get_widget_class_dict()
+        for name, widget_class in sorted(widget_classes.items()):
+            if not widget_class.pure:
+                continue
+            widgets = WidgetInstance.objects.filter(widget_class=name)
+            if not options["force"]:
+                widgets = widgets.filter(
+                    Q(rendered_body__isnull=True) | ~Q(render_version=widget_class.render_version)
+                    | Q(render_version__isnull=True)
+                )
+            configuration_hashes = list(widgets.values_list("configuration_hash", flat=True).distinct())
+            for start in range(0, len(configuration_hashes), options["batch_size"]):
+                self.render_batch(
+                    widgets, widget_class, configuration_hashes[start:start + options["batch_size"]]
+                )
+            self.stdout.write("%s: rendered %s configurations" % (name, len(configuration_hashes)))
+
+        with atomic():
+            stale = WidgetInstance.objects.filter(rendered_body__isnull=False).exclude(
+                widget_class__in=[name for name, widget_class in widget_classes.items() if widget_class.pure]
+            )
+            widget_list_ids = set(stale.values_list("widget_list_id", flat=True))
+            cleared = stale.update(rendered_body=None, render_version=None)
+            self.increment_versions(widget_list_ids)
+        self.stdout.write("Cleared the output of %s widgets of classes that are not pure" % cleared)
+
+    @staticmethod
+    def increment_versions(widget_list_ids):
+        """
+        increment_versions increments the versions of the widget-lists with widget_list_ids and sends their subscribers
+            a resync event
+        """
+        for widget_list in WidgetList.objects.filter(pk__in=widget_list_ids):
+            widget_list.increment_version()
+            publish_widget_list_event(widget_list, RESYNC, None)
+
+    def render_batch(self, widgets, widget_class, configuration_hashes):
+        """
+        render_batch renders one configuration for each of configuration_hashes and stores the output on every widget
+            with that configuration, in one transaction. Configurations that fail to render in the sandbox keep their
+            output and are rendered again on the next run
+        """
+        batch_widgets = widgets.filter(configuration_hash__in=configuration_hashes)
+        configurations = load_configurations(
+            batch_widgets.order_by("configuration_hash").distinct("configuration_hash").values_list(
+                "configuration_hash", "configuration", "configuration_hash"
+            )
+        )
+        rendered_bodies = render_widgets(widget_class.name, list(configurations.values()))
+        with atomic():
+            widget_list_ids = list(batch_widgets.values_list("widget_list_id", flat=True).distinct())
+            for configuration_hash, rendered_body in zip(configurations, rendered_bodies):
+                if rendered_body is SANDBOX_ERROR_BODY:
+                    continue
+                batch_widgets.filter(configuration_hash=configuration_hash).update(
+                    rendered_body=rendered_body, render_version=widget_class.render_version
+                )
+            self.increment_versions(widget_list_ids)
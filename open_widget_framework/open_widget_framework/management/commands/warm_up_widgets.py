@@ -0,0 +1,26 @@
+"""
+Management command to warm up the widget classes and render the hottest widget-lists into the cache
+"""
+from django.core.management.base import BaseCommand
+
+from open_widget_framework.settings import api_settings
+from open_widget_framework.warmup import warm_up
+
+
+class Command(BaseCommand):
+    """
+    Import and check the widget classes, build their form specs and render widget-lists into the render cache, then
+        report how long each step took. Run it when a deploy starts so the first requests find warm caches
+    """
+    help = "Warm up widget classes and form specs and pre-render widget-lists into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "widget_list_ids", nargs="*", type=int,
+            help="ids of the widget-lists to render (defaults to WIDGET_WARM_UP_LIST_IDS)",
+        )
+
+    def handle(self, *args, **options):
+        timings = warm_up(options["widget_list_ids"] or api_settings.WIDGET_WARM_UP_LIST_IDS)
+        for step, seconds in timings.items():
+            self.stdout.write("%s: %.1fms" % (step, seconds * 1000))
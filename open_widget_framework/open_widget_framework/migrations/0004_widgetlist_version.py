@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_widget_framework', '0003_auto_20181109_2006'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetlist',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.1.15 on 2026-10-19 13:10
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def set_configuration_hashes(apps, schema_editor):
+    """Hash the configuration of every existing widget the same way WidgetInstance.save does"""
+    WidgetInstance = apps.get_model('open_widget_framework', 'WidgetInstance')
+    for widget in WidgetInstance.objects.only('id', 'configuration').iterator():
+        canonical = json.dumps(widget.configuration, sort_keys=True, separators=(",", ":"))
+        widget.configuration_hash = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+        widget.save(update_fields=['configuration_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_widget_framework', '0004_widgetlist_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetinstance',
+            name='configuration_hash',
+            field=models.CharField(default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_configuration_hashes, migrations.RunPython.noop),
+    ]
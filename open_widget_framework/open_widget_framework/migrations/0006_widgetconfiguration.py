@@ -0,0 +1,26 @@
+# Generated by Django 2.1.15 on 2026-10-19 12:53
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_widget_framework', '0005_widgetinstance_configuration_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WidgetConfiguration',
+            fields=[
+                ('configuration_hash', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('configuration', django.contrib.postgres.fields.jsonb.JSONField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='widgetinstance',
+            name='configuration',
+            field=django.contrib.postgres.fields.jsonb.JSONField(null=True),
+        ),
+    ]
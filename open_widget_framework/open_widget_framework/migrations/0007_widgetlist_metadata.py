@@ -0,0 +1,47 @@
+# Generated by Django 2.1.15 on 2026-10-19 13:12
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def count_widgets(apps, schema_editor):
+    """Count the widgets of every existing widget-list, in total and by widget class"""
+    WidgetList = apps.get_model('open_widget_framework', 'WidgetList')
+    WidgetInstance = apps.get_model('open_widget_framework', 'WidgetInstance')
+    metadata = {}
+    widget_class_counts = WidgetInstance.objects.values_list('widget_list_id', 'widget_class').annotate(
+        count=models.Count('id')
+    ).order_by()
+    for widget_list_id, widget_class, count in widget_class_counts:
+        metadata.setdefault(widget_list_id, {})[widget_class] = count
+    for widget_list_id, counts in metadata.items():
+        WidgetList.objects.filter(pk=widget_list_id).update(
+            widget_count=sum(counts.values()), widget_class_counts=counts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_widget_framework', '0006_widgetconfiguration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetlist',
+            name='modified',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='widgetlist',
+            name='widget_class_counts',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='widgetlist',
+            name='widget_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_widgets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.1.15 on 2026-10-19 13:14
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_widget_framework', '0007_widgetlist_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='widgetinstance',
+            name='render_version',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='widgetinstance',
+            name='rendered_body',
+            field=django.contrib.postgres.fields.jsonb.JSONField(editable=False, null=True),
+        ),
+    ]
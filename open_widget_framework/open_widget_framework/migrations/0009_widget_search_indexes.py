@@ -0,0 +1,41 @@
+# Generated by Django 2.1.15 on 2026-10-19 15:02
+
+from django.db import migrations
+
+# The indexes are built concurrently so that large widget tables stay writable, which cannot be done in a transaction.
+# Configurations are searched as text, as to_tsvector does not take jsonb before PostgreSQL 10
+INDEXES = (
+    (
+        'open_widget_framework_widgetinstance_configuration_gin',
+        'open_widget_framework_widgetinstance USING gin (configuration jsonb_path_ops)',
+    ),
+    (
+        'open_widget_framework_widgetinstance_search_gin',
+        "open_widget_framework_widgetinstance USING gin "
+        "((to_tsvector('simple'::regconfig, title || ' ' || COALESCE(configuration::text, ''))))",
+    ),
+    (
+        'open_widget_framework_widgetconfiguration_configuration_gin',
+        'open_widget_framework_widgetconfiguration USING gin (configuration jsonb_path_ops)',
+    ),
+    (
+        'open_widget_framework_widgetconfiguration_search_gin',
+        "open_widget_framework_widgetconfiguration USING gin ((to_tsvector('simple'::regconfig, configuration::text)))",
+    ),
+)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('open_widget_framework', '0008_widgetinstance_rendered_body'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s' % (name, definition),
+            'DROP INDEX CONCURRENTLY IF EXISTS %s' % name,
+        )
+        for name, definition in INDEXES
+    ]
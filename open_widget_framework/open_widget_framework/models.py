@@ -1,34 +1,255 @@
 """
 WidgetApp models
 """
-from django.db import models
+from itertools import islice
+
 from django.contrib.postgres.fields import JSONField
+from django.db import models, router
+from django.db.models import Count
+from django.db.models.query import ModelIterable
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from open_widget_framework.db_routers import record_widget_list_write
+from open_widget_framework.settings import api_settings
+from open_widget_framework.utils import get_configuration_hash
+
+
+def get_widget_list_metadata(widget_list_ids, using=None):
+    """
+    get_widget_list_metadata counts the widgets of several widget-lists, in total and by widget class, with one
+        aggregate query.
+    :return: a dict mapping each of widget_list_ids to a dict of the widget_count and widget_class_counts fields
+    """
+    metadata = {widget_list_id: {"widget_count": 0, "widget_class_counts": {}} for widget_list_id in widget_list_ids}
+    widget_class_counts = (
+        WidgetInstance.objects.db_manager(using)
+        .filter(widget_list_id__in=widget_list_ids)
+        .values_list("widget_list_id", "widget_class")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for widget_list_id, widget_class, count in widget_class_counts:
+        metadata[widget_list_id]["widget_count"] += count
+        metadata[widget_list_id]["widget_class_counts"][widget_class] = count
+    return metadata
+
+
+def refresh_widget_list_metadata(widget_list_ids):
+    """
+    refresh_widget_list_metadata recounts the widgets of widget-lists whose widgets were inserted in bulk, such as
+        cloned and imported lists, and marks them modified. It should run in the transaction that inserted the widgets
+    """
+    modified = timezone.now()
+    for widget_list_id, metadata in get_widget_list_metadata(widget_list_ids).items():
+        WidgetList.objects.filter(pk=widget_list_id).update(modified=modified, **metadata)
 
 
 class WidgetList(models.Model):
     """
-    WidgetList handles authentication and is linked to a set of WidgetInstances
+    WidgetList handles authentication and is linked to a set of WidgetInstances. Its version is incremented whenever
+        a widget on the list changes, so it can be used to key cached renders of the whole list. It also keeps
+        metadata about its widgets, so widget-lists can be listed without loading their widgets: how many widgets it
+        has, in total and of each widget class, and when a widget on it last changed
     """
+    version = models.PositiveIntegerField(default=0)
+    widget_count = models.PositiveIntegerField(default=0)
+    widget_class_counts = JSONField(default=dict)
+    modified = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        record_widget_list_write(self)
+
+    def increment_version(self):
+        """
+        Increment the version of the widget-list and recount its widgets. This must be called by every path that
+            changes a widget on the list, in the same transaction as the change. The widget-list row is locked first,
+            so the changes of concurrent transactions are counted one after another
+        """
+        using = router.db_for_write(WidgetList, instance=self)
+        with atomic(using=using):
+            version = WidgetList.objects.using(using).select_for_update().values_list("version", flat=True).get(
+                pk=self.pk
+            )
+            metadata = get_widget_list_metadata([self.pk], using=using)[self.pk]
+            self.version = version + 1
+            self.modified = timezone.now()
+            self.widget_count = metadata["widget_count"]
+            self.widget_class_counts = metadata["widget_class_counts"]
+            WidgetList.objects.using(using).filter(pk=self.pk).update(
+                version=self.version, modified=self.modified, **metadata
+            )
+        record_widget_list_write(self)
+
     def get_length(self):
         """
         Get the length of the widget-list
         """
-        return WidgetInstance.objects.filter(widget_list=self).count()
+        return WidgetInstance.objects.db_manager(hints={"instance": self}).filter(widget_list=self).count()
 
     def get_widgets(self):
         """
         Get an ordered list of all widgetInstances in a widget-list
         """
-        return WidgetInstance.objects.filter(widget_list=self).order_by("position")
+        # The instance hint lets the database router read the widgets from the database the widget-list came from
+        widgets = WidgetInstance.objects.db_manager(hints={"instance": self})
+        return widgets.filter(widget_list=self).order_by("position")
+
+    @atomic
+    def clone(self):
+        """
+        Copy the widget-list and all of its widgets into a new widget-list with one bulk insert. The configurations
+            were validated when they were saved, so they are copied as they are along with their hashes, and the copies
+            share cached renders with the original widgets
+        """
+        widget_list = WidgetList.objects.create()
+        WidgetInstance.objects.bulk_create(
+            WidgetInstance(widget_list=widget_list, **row)
+            for row in self.get_widgets().values(
+                "widget_class", "react_renderer", "configuration", "position", "title", "configuration_hash",
+                "rendered_body", "render_version",
+            )
+        )
+        refresh_widget_list_metadata([widget_list.pk])
+        widget_list.refresh_from_db(fields=["widget_count", "widget_class_counts", "modified"])
+        return widget_list
+
+
+class WidgetConfiguration(models.Model):
+    """
+    WidgetConfiguration is a content-addressed store of widget configurations keyed by their hash. When
+        WIDGET_CONFIGURATION_STORE is set, widgets keep their configuration here instead of on their own row, so widgets
+        with identical configurations share one stored copy
+    """
+    configuration_hash = models.CharField(max_length=40, primary_key=True)
+    configuration = JSONField()
+
+
+def get_stored_configurations(configuration_hashes, using=None):
+    """
+    get_stored_configurations returns a dict mapping each of configuration_hashes to its stored configuration, loaded
+        in one query
+    """
+    if not configuration_hashes:
+        return {}
+    return dict(
+        WidgetConfiguration.objects.db_manager(using)
+        .filter(pk__in=configuration_hashes)
+        .values_list("configuration_hash", "configuration")
+    )
+
+
+def load_stored_configurations(widgets, using=None):
+    """
+    load_stored_configurations sets the configuration of each of widgets that keeps it in the WidgetConfiguration store,
+        loading them all in one query
+    """
+    stored_widgets = [
+        widget for widget in widgets
+        if "configuration" in widget.__dict__ and widget.configuration is None
+    ]
+    stored_configurations = get_stored_configurations(
+        {widget.configuration_hash for widget in stored_widgets}, using=using
+    )
+    for widget in stored_widgets:
+        widget.configuration = stored_configurations.get(widget.configuration_hash)
+
+
+class WidgetInstanceIterable(ModelIterable):
+    """
+    WidgetInstanceIterable yields widgets with the configurations they keep in the WidgetConfiguration store loaded, one
+        query per chunk of widgets rather than one per widget
+    """
+    def __iter__(self):
+        widgets = super().__iter__()
+        while True:
+            chunk = list(islice(widgets, self.chunk_size))
+            if not chunk:
+                return
+            load_stored_configurations(chunk, using=self.queryset.db)
+            yield from chunk
+
+
+class WidgetInstanceQuerySet(models.QuerySet):
+    """
+    WidgetInstanceQuerySet loads the widgets it yields with WidgetInstanceIterable
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = WidgetInstanceIterable
+
+
+def store_configurations(widgets):
+    """
+    store_configurations prepares unsaved widgets with their configuration_hash set for bulk_create. When
+        WIDGET_CONFIGURATION_STORE is set it stores the configurations that are not stored yet, in one insert, and
+        clears the configuration of each widget so that only the hash is saved on its row
+    """
+    if not api_settings.WIDGET_CONFIGURATION_STORE:
+        return widgets
+    configurations = {widget.configuration_hash: widget.configuration for widget in widgets}
+    stored_hashes = set(
+        WidgetConfiguration.objects.filter(pk__in=configurations.keys()).values_list("configuration_hash", flat=True)
+    )
+    WidgetConfiguration.objects.bulk_create(
+        WidgetConfiguration(configuration_hash=configuration_hash, configuration=configuration)
+        for configuration_hash, configuration in configurations.items()
+        if configuration_hash not in stored_hashes
+    )
+    for widget in widgets:
+        widget.configuration = None
+    return widgets
 
 
 class WidgetInstance(models.Model):
     """
-    WidgetInstance contains data for a single widget instance, regardless of what class of widget it is
+    WidgetInstance contains data for a single widget instance, regardless of what class of widget it is. The hash of
+        its configuration is stored alongside it so that list reads can find cached renders without loading the
+        configuration. A widget whose configuration is in the WidgetConfiguration store has no configuration on its
+        own row; it is loaded from the store by its hash. Widgets of pure widget classes keep their render output in
+        rendered_body, with the render_version of the widget class that rendered it
     """
     widget_list = models.ForeignKey(WidgetList, related_name="widgets", on_delete=models.CASCADE)
     widget_class = models.CharField(max_length=200)
     react_renderer = models.CharField(max_length=200, null=True)
-    configuration = JSONField()
+    configuration = JSONField(null=True)
     position = models.PositiveIntegerField()
     title = models.CharField(max_length=200)
+    configuration_hash = models.CharField(max_length=40, editable=False)
+    rendered_body = JSONField(null=True, editable=False)
+    render_version = models.PositiveIntegerField(null=True, editable=False)
+
+    objects = WidgetInstanceQuerySet.as_manager()
+
+    def refresh_from_db(self, using=None, fields=None):
+        """
+        Load the configuration of a widget from the WidgetConfiguration store if it is kept there. Querysets of widgets
+            load the configurations of all of their widgets at once
+        """
+        super().refresh_from_db(using=using, fields=fields)
+        load_stored_configurations([self], using=self._state.db)
+
+    def save(self, *args, **kwargs):
+        """
+        Keep configuration_hash in step with configuration, and keep the configuration in the WidgetConfiguration store
+            when WIDGET_CONFIGURATION_STORE is set. Code that changes configuration with QuerySet.update must update
+            configuration_hash as well
+        """
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "configuration" in update_fields:
+            self.configuration_hash = get_configuration_hash(self.configuration)
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"configuration_hash"}
+            if api_settings.WIDGET_CONFIGURATION_STORE:
+                WidgetConfiguration.objects.get_or_create(
+                    pk=self.configuration_hash, defaults={"configuration": self.configuration}
+                )
+                configuration = self.configuration
+                self.configuration = None
+                try:
+                    super().save(*args, **kwargs)
+                finally:
+                    self.configuration = configuration
+                return
+        super().save(*args, **kwargs)
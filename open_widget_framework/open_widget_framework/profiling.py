@@ -0,0 +1,143 @@
+"""
+WidgetApp request profiling
+
+Add "open_widget_framework.profiling.WidgetProfilingMiddleware" to MIDDLEWARE, after django's AuthenticationMiddleware.
+A staff user can then profile one request to a widget endpoint by adding ?profile=1 to it or sending an
+X-Widget-Profile header. The request runs under cProfile, and the profile is written to WIDGET_PROFILE_DIR along with
+a json summary of its hottest functions and of the widgets the request rendered: their ids, classes, whether their
+render was cached and how long rendering took. The name of the profile is returned in the X-Widget-Profile response
+header. Open the .prof file with pstats or a viewer such as snakeviz to see a flamegraph.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from open_widget_framework.settings import api_settings
+
+PROFILE_QUERY_PARAMETER = "profile"
+PROFILE_HEADER = "HTTP_X_WIDGET_PROFILE"
+
+# The widget profile of the request that the current thread is profiling
+_profiling = threading.local()
+
+
+def get_widget_profile():
+    """
+    get_widget_profile returns the list that rendered widgets are recorded in while a request is profiled, or None
+    """
+    return getattr(_profiling, "widget_profile", None)
+
+
+def get_profile_dir():
+    """
+    get_profile_dir returns the directory that profiles are written to, creating it if needed
+    """
+    profile_dir = api_settings.WIDGET_PROFILE_DIR or os.path.join(tempfile.gettempdir(), "open_widget_framework")
+    os.makedirs(profile_dir, exist_ok=True)
+    return profile_dir
+
+
+def summarize_profile(profiler, limit):
+    """
+    summarize_profile returns the limit functions of a profile with the most time spent in the function itself
+    """
+    stats = pstats.Stats(profiler)
+    hot_functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            "function": "%s:%s(%s)" % function,
+            "calls": calls,
+            "total_time": total_time,
+            "cumulative_time": cumulative_time,
+        }
+        for function, (_, calls, total_time, cumulative_time, _) in hot_functions
+    ]
+
+
+def is_widget_endpoint(request):
+    """
+    is_widget_endpoint returns whether a request is for a view of the widget framework
+    """
+    try:
+        return resolve(request.path_info).func.__module__.startswith("open_widget_framework.")
+    except Resolver404:
+        return False
+
+
+class WidgetProfilingMiddleware:
+    """
+    WidgetProfilingMiddleware profiles requests to widget endpoints made by staff users who ask for it
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        widget_profile = []
+        previous_widget_profile = get_widget_profile()
+        _profiling.widget_profile = widget_profile
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request)
+            if response.streaming and not response.get("Content-Type", "").startswith("text/event-stream"):
+                # Streamed widget-lists render while they are streamed, so the stream is consumed inside the profile
+                content = profiler.runcall(b"".join, response.streaming_content)
+                streamed_response = response
+                response = HttpResponse(content, status=streamed_response.status_code)
+                for header, value in streamed_response.items():
+                    response[header] = value
+        finally:
+            _profiling.widget_profile = previous_widget_profile
+        elapsed = time.perf_counter() - start
+
+        response["X-Widget-Profile"] = self.save_profile(request, profiler, widget_profile, elapsed)
+        return response
+
+    @staticmethod
+    def should_profile(request):
+        """
+        should_profile returns whether a request asks to be profiled and is allowed to be
+        """
+        if PROFILE_QUERY_PARAMETER not in request.GET and PROFILE_HEADER not in request.META:
+            return False
+        user = getattr(request, "user", None)
+        return bool(user is not None and user.is_staff and is_widget_endpoint(request))
+
+    @staticmethod
+    def save_profile(request, profiler, widget_profile, elapsed):
+        """
+        save_profile writes the profile of a request and its json summary to the profile directory and returns the name
+            they share. Names start with the time and end with a random suffix, so that requests profiled in the same
+            second do not overwrite each other
+        """
+        name = "%s-%s-%s-%s" % (
+            time.strftime("%Y%m%d%H%M%S"),
+            request.method.lower(),
+            re.sub(r"[^a-zA-Z0-9]+", "-", request.path_info).strip("-"),
+            uuid4().hex[:8],
+        )
+        profile_dir = get_profile_dir()
+        profiler.dump_stats(os.path.join(profile_dir, "%s.prof" % name))
+        summary = {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "seconds": elapsed,
+            "widgets": widget_profile,
+            "hot_functions": summarize_profile(profiler, api_settings.WIDGET_PROFILE_TOP_FUNCTIONS),
+        }
+        with open(os.path.join(profile_dir, "%s.json" % name), "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        return name
@@ -1,8 +1,81 @@
 """
 WidgetApp DRF Serializer Field Extensions
 """
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
 
+from open_widget_framework.files import get_file_path, get_file_storage, is_content_hash
+
+
+class ChoiceProvider(object):
+    """
+    ChoiceProvider is the base class for choices that are loaded lazily rather than listed when a choice field is
+        constructed. ReactChoiceField and ReactMultipleChoiceField accept a ChoiceProvider in place of a list of
+        choices. They validate values by looking up only those values, and the frontend searches the choices a page at
+        a time through the choices endpoint instead of receiving them all in the form spec
+    """
+
+    def get_choices(self, values):
+        """Return an ordered dict mapping the values that are valid choices to their labels"""
+        raise NotImplementedError
+
+    def search(self, search, offset, limit):
+        """Return a list of up to limit (value, label) pairs of the choices that match search, starting at offset"""
+        raise NotImplementedError
+
+    def __deepcopy__(self, memo):
+        # Serializers deep copy their fields; providers hold no per-serializer state so they are shared
+        return self
+
+
+class QuerySetChoiceProvider(ChoiceProvider):
+    """
+    QuerySetChoiceProvider provides the objects of a queryset as choices, with the value of value_field as the value
+        and the value of label_field as the label. queryset can be a callable that returns the queryset, so that
+        models need not be imported with the widget class. Values are validated with one value_field__in lookup and
+        searches match label_field with search_lookup, so both should be indexed for large querysets
+    """
+
+    def __init__(self, queryset, label_field, value_field="pk", search_lookup="startswith"):
+        self.queryset = queryset
+        self.label_field = label_field
+        self.value_field = value_field
+        self.search_lookup = search_lookup
+
+    def get_queryset(self):
+        """Return a fresh copy of the queryset of choices"""
+        return self.queryset() if callable(self.queryset) else self.queryset.all()
+
+    def get_choices(self, values):
+        queryset = self.get_queryset()
+        model_field = queryset.model._meta.get_field(self.value_field) if self.value_field != "pk" \
+            else queryset.model._meta.pk
+        lookup_values = set()
+        for value in values:
+            try:
+                lookup_values.add(model_field.to_python(value))
+            except DjangoValidationError:
+                # A value of the wrong type is not a choice
+                pass
+        if not lookup_values:
+            return OrderedDict()
+        return OrderedDict(
+            queryset.filter(**{"%s__in" % self.value_field: lookup_values})
+            .order_by(self.label_field)
+            .values_list(self.value_field, self.label_field)
+        )
+
+    def search(self, search, offset, limit):
+        queryset = self.get_queryset()
+        if search:
+            queryset = queryset.filter(**{"%s__%s" % (self.label_field, self.search_lookup): search})
+        return list(
+            queryset.order_by(self.label_field, self.value_field)
+            .values_list(self.value_field, self.label_field)[offset:offset + limit]
+        )
+
 
 class ReactField(serializers.Field):
     """
@@ -25,12 +98,12 @@ class ReactField(serializers.Field):
         super().bind(field_name, parent)
 
     def configure_form_spec(self):
-        """Return react-significant fields as a dict"""
+        """Return react-significant fields as a dict. props is copied as fields may be shared between serializers"""
         return {
             "key": self.key,
             "label": self.label,
             "inputType": self.input_type,
-            "props": self.props,
+            "props": dict(self.props),
         }
 
     @staticmethod
@@ -90,45 +163,104 @@ class ReactURLField(serializers.URLField, ReactField):
         return configuration
 
 
-class ReactChoiceField(serializers.ChoiceField, ReactField):
+class ReactChoiceProviderMixin(object):
+    """
+    ReactChoiceProviderMixin lets the React choice fields take a ChoiceProvider in place of a list of choices. A field
+        with a choice provider has no choices listed in its form spec; its spec is marked with lazyChoices so that the
+        frontend searches the choices endpoint instead
+    """
+
+    def __init__(self, choices, **kwargs):
+        self.choice_provider = choices if isinstance(choices, ChoiceProvider) else None
+        super().__init__([] if self.choice_provider else self.make_choices_dict(choices), input_type="select", **kwargs)
+
+    def configure_form_spec(self):
+        configuration = super().configure_form_spec()
+        if self.choice_provider is None:
+            configuration.update({"choices": self.choices})
+        else:
+            configuration.update({"choices": {}, "lazyChoices": True})
+        return configuration
+
+    def get_selected_choices(self, value):
+        """Return a dict mapping the selected values in value to their labels, for forms that edit a widget"""
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        if self.choice_provider is None:
+            return {choice: label for choice, label in self.choices.items() if choice in values}
+        return self.choice_provider.get_choices(values)
+
+
+class ReactChoiceField(ReactChoiceProviderMixin, serializers.ChoiceField, ReactField):
     """ReactField extension of DRF ChoiceField"""
 
     def __init__(self, choices, **kwargs):
-        super().__init__(self.make_choices_dict(choices), input_type="select", **kwargs)
+        super().__init__(choices, **kwargs)
 
         # Force multiple to be false so people can't break things. Use ReactMultipleChoiceField to choose multiple
         self.props["isMulti"] = False
 
-    def configure_form_spec(self):
-        configuration = super().configure_form_spec()
-        configuration.update({"choices": self.choices})
-        return configuration
+    def to_internal_value(self, data):
+        if self.choice_provider is None:
+            return super().to_internal_value(data)
+        if data == "" and self.allow_blank:
+            return ""
+        choices = self.choice_provider.get_choices([data])
+        if not choices:
+            self.fail("invalid_choice", input=data)
+        return next(iter(choices))
 
 
-class ReactMultipleChoiceField(serializers.MultipleChoiceField, ReactField):
+class ReactMultipleChoiceField(ReactChoiceProviderMixin, serializers.MultipleChoiceField, ReactField):
     """ReactField extension of DRF MultipleChoiceField"""
 
     def __init__(self, choices, **kwargs):
-        super().__init__(self.make_choices_dict(choices), input_type="select", **kwargs)
+        super().__init__(choices, **kwargs)
         # Force multiple for select multiple
         self.props["isMulti"] = True
 
-    def configure_form_spec(self):
-        configuration = super().configure_form_spec()
-        configuration.update({"choices": self.choices})
-        return configuration
-
     # Is this necessary
     def to_internal_value(self, data):
-        return list(super().to_internal_value(data))
+        if self.choice_provider is None:
+            return list(super().to_internal_value(data))
+        if isinstance(data, str) or not hasattr(data, "__iter__"):
+            self.fail("not_a_list", input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail("empty")
+        # All of the values are looked up with one query
+        choices = {str(choice): choice for choice in self.choice_provider.get_choices(data)}
+        for item in data:
+            if str(item) not in choices:
+                self.fail("invalid_choice", input=item)
+        return list(OrderedDict.fromkeys(choices[str(item)] for item in data))
 
     @staticmethod
     def serialize(value):
         return list(value)
 
 
-class ReactFileField(serializers.FileField, ReactField):
-    """ReactField extension of DRF FileField"""
+class ReactFileField(ReactField):
+    """
+    ReactField for a file uploaded to the widget file endpoint. Its value is the {"hash", "name", "size"} object that
+        the upload returns, and it validates that the file is stored
+    """
+
+    default_error_messages = {
+        "invalid": "Expected the hash and name of an uploaded file.",
+        "missing": "The file has not been uploaded.",
+    }
 
     def __init__(self, **kwargs):
         super().__init__(input_type="file", **kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, dict) or not is_content_hash(data.get("hash")) \
+                or not isinstance(data.get("name", ""), str):
+            self.fail("invalid")
+        storage = get_file_storage()
+        path = get_file_path(data["hash"])
+        if not storage.exists(path):
+            self.fail("missing")
+        return {"hash": data["hash"], "name": data.get("name") or data["hash"], "size": storage.size(path)}
+
+    def to_representation(self, value):
+        return value
@@ -0,0 +1,152 @@
+"""
+WidgetApp refresh-ahead
+
+The output of widget classes with refresh_ahead set (such as RssFeedWidget) goes stale, so their renders expire from the
+cache after WIDGET_RENDER_CACHE_TIMEOUT and the next reader would pay for the fetch and render. record_hot_renders
+notes the renders of those widgets whenever a list is assembled from the render cache, and refresh_hot_renders, run by
+the refresh_widgets management command, re-renders the renders that are still being read shortly before they expire,
+so readers find them cached.
+
+The hot renders are kept in one cache entry so that every worker and the command see them. Workers that record at the
+same time can overwrite each other's entries; a lost entry is recorded again the next time its list is assembled.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import connections
+
+from open_widget_framework.models import WidgetInstance
+from open_widget_framework.settings import api_settings
+from open_widget_framework.utils import get_render_cache_key, get_widget_class_dict
+from open_widget_framework.widget_serializer import SANDBOX_ERROR_BODY, load_configurations, render_widget
+
+log = logging.getLogger(__name__)
+
+HOT_RENDERS_CACHE_KEY = "open_widget_framework:hot-renders"
+
+
+def get_refresh_ahead_classes():
+    """
+    get_refresh_ahead_classes returns the names of the widget classes whose cached renders are refreshed ahead of expiry
+    """
+    return {
+        name for name, widget_class in get_widget_class_dict().items()
+        if widget_class.refresh_ahead and widget_class.cache_renders
+    }
+
+
+def get_hot_renders(now):
+    """
+    get_hot_renders returns the hot renders, a dict mapping render cache keys to (widget_class, configuration_hash,
+        read_at, refreshed_at) tuples, without the ones that have not been read for WIDGET_REFRESH_HOT_TIMEOUT seconds.
+        refreshed_at is None when the render was read before it was known to be hot, so when it expires is unknown
+    """
+    return {
+        cache_key: hot_render for cache_key, hot_render in cache.get(HOT_RENDERS_CACHE_KEY, {}).items()
+        if hot_render[2] > now - api_settings.WIDGET_REFRESH_HOT_TIMEOUT
+    }
+
+
+def set_hot_renders(hot_renders):
+    """
+    set_hot_renders saves the WIDGET_REFRESH_MAX_RENDERS most recently read of hot_renders
+    """
+    if len(hot_renders) > api_settings.WIDGET_REFRESH_MAX_RENDERS:
+        hot_renders = dict(sorted(
+            hot_renders.items(), key=lambda item: item[1][2], reverse=True
+        )[:api_settings.WIDGET_REFRESH_MAX_RENDERS])
+    cache.set(HOT_RENDERS_CACHE_KEY, hot_renders, api_settings.WIDGET_REFRESH_HOT_TIMEOUT)
+
+
+def record_hot_renders(rows, rendered_bodies):
+    """
+    record_hot_renders records the renders of the widget rows of refresh-ahead widget classes as read. Rows with no
+        rendered body missed the cache and are about to be rendered, so they are recorded as just refreshed
+    """
+    refresh_ahead_classes = get_refresh_ahead_classes()
+    reads = [
+        (row.widget_class, row.configuration_hash, rendered_body is None)
+        for row, rendered_body in zip(rows, rendered_bodies) if row.widget_class in refresh_ahead_classes
+    ]
+    if not reads:
+        return
+    now = time.time()
+    hot_renders = get_hot_renders(now)
+    for widget_class, configuration_hash, missed in reads:
+        cache_key = get_render_cache_key(widget_class, configuration_hash)
+        refreshed_at = now if missed else hot_renders.get(cache_key, (None, None, None, None))[3]
+        hot_renders[cache_key] = (widget_class, configuration_hash, now, refreshed_at)
+    set_hot_renders(hot_renders)
+
+
+def get_due_renders(hot_renders, now):
+    """
+    get_due_renders returns the render cache keys of the hot renders that expire within WIDGET_REFRESH_AHEAD seconds,
+        or whose expiry is unknown
+    """
+    refresh_before = now - api_settings.WIDGET_RENDER_CACHE_TIMEOUT + api_settings.WIDGET_REFRESH_AHEAD
+    return [
+        cache_key for cache_key, (_, _, _, refreshed_at) in hot_renders.items()
+        if refreshed_at is None or refreshed_at <= refresh_before
+    ]
+
+
+def refresh_render(cache_key, widget_class_name, configuration):
+    """
+    refresh_render renders a configuration into the render cache. A render that fails leaves the cached render in
+        place until it expires, so the next pass or reader retries it.
+    :return: whether the render was refreshed
+    """
+    try:
+        rendered_body = render_widget(widget_class_name, configuration)
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Could not refresh the render of a %s widget", widget_class_name)
+        return False
+    finally:
+        # Renders run in worker threads, which open their own database connections
+        connections.close_all()
+    if rendered_body is SANDBOX_ERROR_BODY:
+        return False
+    cache.set(cache_key, rendered_body, api_settings.WIDGET_RENDER_CACHE_TIMEOUT)
+    return True
+
+
+def refresh_hot_renders():
+    """
+    refresh_hot_renders re-renders the hot renders that are due into the render cache, WIDGET_REFRESH_CONCURRENCY at a
+        time. Hot renders whose configuration is no longer used by any widget are forgotten.
+    :return: a tuple of (refreshed, failed) counts
+    """
+    start = time.time()
+    hot_renders = get_hot_renders(start)
+    due = get_due_renders(hot_renders, start)
+    if not due:
+        return 0, 0
+    configurations = load_configurations(
+        WidgetInstance.objects.filter(
+            configuration_hash__in={hot_renders[cache_key][1] for cache_key in due}
+        ).order_by("configuration_hash").distinct("configuration_hash").values_list(
+            "configuration_hash", "configuration", "configuration_hash"
+        )
+    )
+    unused = {cache_key for cache_key in due if hot_renders[cache_key][1] not in configurations}
+    due = [cache_key for cache_key in due if cache_key not in unused]
+    with ThreadPoolExecutor(max_workers=api_settings.WIDGET_REFRESH_CONCURRENCY) as executor:
+        results = list(executor.map(
+            lambda cache_key: refresh_render(
+                cache_key, hot_renders[cache_key][0], configurations[hot_renders[cache_key][1]]
+            ),
+            due,
+        ))
+    refreshed = {cache_key for cache_key, result in zip(due, results) if result}
+
+    # Merge with the renders that readers recorded during the pass
+    latest_hot_renders = get_hot_renders(time.time())
+    for cache_key in unused:
+        latest_hot_renders.pop(cache_key, None)
+    for cache_key in refreshed & latest_hot_renders.keys():
+        latest_hot_renders[cache_key] = latest_hot_renders[cache_key][:3] + (start,)
+    set_hot_renders(latest_hot_renders)
+    return len(refreshed), len(due) - len(refreshed)
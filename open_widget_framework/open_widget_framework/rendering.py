@@ -0,0 +1,193 @@
+"""
+WidgetApp server side rendering of whole widget-lists, as html fragments and for async views
+"""
+import json
+import logging
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from open_widget_framework.profiling import get_widget_profile
+from open_widget_framework.settings import api_settings
+from open_widget_framework.utils import get_configuration_hash, get_render_cache_key
+from open_widget_framework.widget_serializer import (
+    SANDBOX_ERROR_BODY,
+    get_cached_render_classes,
+    get_cached_widget_renders,
+    get_validated_widget_serializer,
+    get_widget_class_serializer,
+    make_rendered_widget,
+    record_widget_render,
+    render_widget_rows,
+)
+
+log = logging.getLogger(__name__)
+
+WIDGET_LIST_OPEN_HTML = '<div class="widget-list">'
+WIDGET_LIST_CLOSE_HTML = '</div>'
+WIDGET_HTML = (
+    '<div class="widget" id="widget-{}"><div class="widget-body">'
+    '<h5 class="widget-title">{}</h5><div class="widget-text">{}</div>'
+    '</div></div>'
+)
+
+
+def get_widget_list_html_cache_key(widget_list):
+    """
+    get_widget_list_html_cache_key returns the cache key of the html fragment for a version of a widget-list
+    """
+    return "open_widget_framework:list-html:%s:%s" % (widget_list.id, widget_list.version)
+
+
+def get_widget_list_payload_cache_key(widget_list):
+    """
+    get_widget_list_payload_cache_key returns the cache key of the encoded JSON rendered widgets of a version of a
+        widget-list
+    """
+    return "open_widget_framework:list-json:%s:%s" % (widget_list.id, widget_list.version)
+
+
+def is_widget_list_cacheable(widget_list):
+    """
+    is_widget_list_cacheable returns whether a whole rendered widget-list may be cached by its version: only if every
+        widget class on it caches or stores its renders. Other widget classes render from data, such as users, that
+        can change without the list version changing
+    """
+    cached_render_classes = get_cached_render_classes()
+    return all(widget_class in cached_render_classes for widget_class in widget_list.widget_class_counts)
+
+
+def get_widget_list_payloads(widget_lists):
+    """
+    get_widget_list_payloads returns a dict mapping the id of each of widget_lists to its rendered widgets encoded as
+        JSON, in the same format as WidgetSerializer.render_with_title. The payloads are cached by list version and
+        fetched in one cache round trip. A list whose payload is not cached, because one of its widgets changed, is
+        assembled from the rendered widget cache, so only its changed widgets render. Lists that are not cacheable, and
+        lists with a widget that failed to render in the sandbox, are rendered on every request
+    """
+    cache_keys = {
+        widget_list.id: get_widget_list_payload_cache_key(widget_list) for widget_list in widget_lists
+        if is_widget_list_cacheable(widget_list)
+    }
+    cached_payloads = cache.get_many(list(cache_keys.values()))
+    payloads = {}
+    new_payloads = {}
+    for widget_list in widget_lists:
+        payload = cached_payloads.get(cache_keys.get(widget_list.id))
+        if payload is None:
+            rendered_widgets = list(render_widget_rows(widget_list.get_widgets()))
+            payload = json.dumps(rendered_widgets, cls=DjangoJSONEncoder)
+            if widget_list.id in cache_keys and not any(
+                rendered_widget.get('html') is SANDBOX_ERROR_BODY for rendered_widget in rendered_widgets
+            ):
+                new_payloads[cache_keys[widget_list.id]] = payload
+        payloads[widget_list.id] = payload
+    if new_payloads:
+        cache.set_many(new_payloads, api_settings.WIDGET_RENDER_CACHE_TIMEOUT)
+    return payloads
+
+
+def iter_widget_list_html(widget_list):
+    """
+    iter_widget_list_html yields the html of a widget-list one widget at a time, each widget wrapped with its title the
+        same way as the default react renderer. Widgets render through the rendered widget cache. Widgets whose class
+        renders props for a custom react renderer rather than html are rendered with their title only.
+    """
+    yield WIDGET_LIST_OPEN_HTML
+    for rendered_widget in render_widget_rows(widget_list.get_widgets()):
+        # Widget html is trusted widget class output, the same html the react renderer sets as inner html
+        yield format_html(
+            WIDGET_HTML, rendered_widget['id'], rendered_widget['title'], mark_safe(rendered_widget.get('html', ''))
+        )
+    yield WIDGET_LIST_CLOSE_HTML
+
+
+def stream_widget_list_html(widget_list):
+    """
+    stream_widget_list_html yields the html fragment for a widget-list. A cached fragment for the current list version
+        is yielded whole; otherwise the list is rendered widget by widget and the fragment is cached once complete, if
+        the list is cacheable and none of its widgets failed to render in the sandbox
+    """
+    cacheable = is_widget_list_cacheable(widget_list)
+    cache_key = get_widget_list_html_cache_key(widget_list)
+    fragment = cache.get(cache_key) if cacheable else None
+    if fragment is not None:
+        yield fragment
+        return
+
+    chunks = []
+    for chunk in iter_widget_list_html(widget_list):
+        chunks.append(chunk)
+        yield chunk
+    fragment = "".join(chunks)
+    if cacheable and SANDBOX_ERROR_BODY not in fragment:
+        cache.set(cache_key, fragment, api_settings.WIDGET_RENDER_CACHE_TIMEOUT)
+
+
+def render_widget_list_html(widget_list):
+    """
+    render_widget_list_html returns the complete html fragment for a widget-list
+    """
+    return "".join(stream_widget_list_html(widget_list))
+
+
+def prepare_widget_renders(queryset):
+    """
+    prepare_widget_renders does the synchronous part of rendering widgets in an async view: it loads the widget rows
+        and their cached renders, and builds widget class serializers for the widgets that are not cached. It queries
+        the database (and pre_configure may), so async views must call it from a thread.
+    :return: a list of (row, rendered_body, configuration, widget_class_serializer) tuples. rendered_body is None when
+        the widget is not cached, and widget_class_serializer is None when it is or when the widget class renders in
+        the sandbox
+    """
+    rows, rendered_bodies, configurations = get_cached_widget_renders(queryset)
+    prepared = []
+    for row, rendered_body in zip(rows, rendered_bodies):
+        if rendered_body is None and row.id not in configurations:
+            # The widget was deleted after its row was read
+            continue
+        configuration = configurations.get(row.id)
+        widget_class_serializer = None
+        if rendered_body is None and row.widget_class not in api_settings.WIDGET_SANDBOXED_CLASSES:
+            widget_class_serializer = get_validated_widget_serializer(row.widget_class, configuration)
+        prepared.append((row, rendered_body, configuration, widget_class_serializer))
+    return prepared
+
+
+async def arender_prepared_widgets(prepared):
+    """
+    arender_prepared_widgets renders the widgets returned by prepare_widget_renders concurrently, using each widget
+        class's arender function (or the sandbox) for widgets that were not cached.
+    :return: the rendered widgets in order, in the same format as WidgetSerializer.render_with_title
+    """
+    # Imported here so that sync deployments do not load asyncio
+    import asyncio
+
+    widget_profile = get_widget_profile()
+
+    async def arender_widget(row, rendered_body, configuration, widget_class_serializer):
+        cached = rendered_body is not None
+        start = time.perf_counter()
+        if rendered_body is None:
+            if widget_class_serializer is None:
+                from open_widget_framework.sandbox import WidgetSandboxError, arender_in_sandbox
+
+                try:
+                    rendered_body = await arender_in_sandbox(row.widget_class, configuration)
+                except WidgetSandboxError:
+                    log.exception("Could not render a %s widget in the sandbox", row.widget_class)
+                    rendered_body = SANDBOX_ERROR_BODY
+            else:
+                rendered_body = await widget_class_serializer.arender()
+            if (get_widget_class_serializer(row.widget_class).cache_renders
+                    and rendered_body is not SANDBOX_ERROR_BODY):
+                cache_key = get_render_cache_key(row.widget_class, get_configuration_hash(configuration))
+                cache.set(cache_key, rendered_body, api_settings.WIDGET_RENDER_CACHE_TIMEOUT)
+        if widget_profile is not None:
+            record_widget_render(widget_profile, row, cached, time.perf_counter() - start)
+        return make_rendered_widget(row, rendered_body)
+
+    return list(await asyncio.gather(*(arender_widget(*widget_render) for widget_render in prepared)))
@@ -0,0 +1,196 @@
+"""
+WidgetApp render sandbox
+
+Widget classes named in WIDGET_SANDBOXED_CLASSES render in a pool of worker processes instead of the web worker, so a
+widget that spins or leaks memory fails its own render without degrading the process serving the request. Each render
+gets WIDGET_SANDBOX_CPU_SECONDS of CPU time and WIDGET_SANDBOX_MEMORY_BYTES of memory on top of what the worker
+already uses, and must finish within WIDGET_SANDBOX_TIMEOUT seconds. Workers are forked once and reused across renders.
+Only the widget class path and its configuration are sent to a worker and only the rendered html or props come back.
+
+Limits rely on resource.setrlimit, so the sandbox needs a unix platform; the memory limit needs /proc (linux).
+"""
+import math
+import os
+import resource
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from open_widget_framework.settings import api_settings
+
+
+class WidgetSandboxError(Exception):
+    """
+    WidgetSandboxError is raised when a sandboxed widget render fails or exceeds its limits
+    """
+
+
+class CPULimitExceeded(WidgetSandboxError):
+    """
+    CPULimitExceeded is raised inside a sandbox worker when a render uses up its CPU time
+    """
+
+
+_pool = None
+_pool_pid = None
+# The pid of the sandbox worker that initialize_worker last ran in
+_worker_pid = None
+_pool_lock = threading.Lock()
+
+
+def raise_cpu_limit_exceeded(signum, frame):
+    """
+    Signal handler for SIGXCPU, which the kernel sends when a render passes its CPU time limit
+    """
+    raise CPULimitExceeded("widget render used more than its CPU time")
+
+
+def initialize_worker():
+    """
+    initialize_worker prepares a forked sandbox worker before its first render. Database connections inherited from
+        the parent are dropped without being closed, since closing them would end the parent's sessions; the worker
+        opens its own when needed
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    from django.db import connections
+
+    for connection in connections.all():
+        connection.connection = None
+    signal.signal(signal.SIGXCPU, raise_cpu_limit_exceeded)
+
+
+def get_address_space_size():
+    """
+    get_address_space_size returns the virtual memory size of the current process in bytes, or None if it is unknown
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_soft_limit(value, hard_limit):
+    """
+    get_soft_limit caps a resource limit at its hard limit
+    """
+    return value if hard_limit == resource.RLIM_INFINITY else min(value, hard_limit)
+
+
+def render_in_worker(widget_class_path, configuration, cpu_seconds, memory_bytes):
+    """
+    render_in_worker validates and renders one widget inside a sandbox worker, with CPU time and memory limits that
+        are lifted again afterwards so the worker can be reused
+    """
+    from django.utils.module_loading import import_string
+
+    # ProcessPoolExecutor only takes an initializer from Python 3.7, so workers initialize on their first render
+    initialize_worker()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, cpu_hard_limit = resource.getrlimit(resource.RLIMIT_CPU)
+    _, memory_hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    cpu_limit = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+    resource.setrlimit(resource.RLIMIT_CPU, (get_soft_limit(cpu_limit, cpu_hard_limit), cpu_hard_limit))
+    address_space_size = get_address_space_size()
+    if address_space_size is not None:
+        memory_limit = get_soft_limit(address_space_size + memory_bytes, memory_hard_limit)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_hard_limit))
+    try:
+        widget_class_serializer = import_string(widget_class_path)(data=configuration)
+        if not widget_class_serializer.is_valid():
+            raise WidgetSandboxError("bad configuration: %s" % widget_class_serializer.errors)
+        return widget_class_serializer.render()
+    except MemoryError:
+        raise WidgetSandboxError("widget render used more than its memory")
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_hard_limit, memory_hard_limit))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard_limit, cpu_hard_limit))
+
+
+def get_sandbox_pool():
+    """
+    get_sandbox_pool returns the process pool of this process, creating it on first use. A pool inherited through a
+        fork of the web worker is not reused
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=api_settings.WIDGET_SANDBOX_PROCESSES)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def reset_sandbox_pool(pool, terminate=False):
+    """
+    reset_sandbox_pool drops a broken pool, so the next render starts a new one. With terminate, the worker processes
+        of the pool are killed as well, failing any other renders they are running: a render that does not finish in
+        time cannot be cancelled once it has started, and one blocked on I/O would otherwise hold its worker forever
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    if terminate:
+        # ProcessPoolExecutor has no public way to stop its workers; _processes is None once it has shut down. The
+        # pool's own thread notices the workers die, fails their renders and shuts the pool down, and shutting it down
+        # here as well races with that thread
+        for process in list((pool._processes or {}).values()):  # pylint: disable=protected-access
+            process.terminate()
+        return
+    pool.shutdown(wait=False)
+
+
+def submit_render(widget_class_name, configuration):
+    """
+    submit_render sends a widget render to the sandbox pool and returns (pool, future)
+    """
+    from open_widget_framework.widget_serializer import get_widget_class_serializer
+
+    widget_class = get_widget_class_serializer(widget_class_name)
+    pool = get_sandbox_pool()
+    future = pool.submit(
+        render_in_worker,
+        "%s.%s" % (widget_class.__module__, widget_class.__qualname__),
+        configuration,
+        api_settings.WIDGET_SANDBOX_CPU_SECONDS,
+        api_settings.WIDGET_SANDBOX_MEMORY_BYTES,
+    )
+    return pool, future
+
+
+def render_in_sandbox(widget_class_name, configuration):
+    """
+    render_in_sandbox renders a widget in the sandbox pool and returns the output of its render function.
+        Raises WidgetSandboxError if the render fails, exceeds its limits or does not finish in time, in which last
+        case the pool is replaced
+    """
+    pool, future = submit_render(widget_class_name, configuration)
+    try:
+        return future.result(timeout=api_settings.WIDGET_SANDBOX_TIMEOUT)
+    except FutureTimeoutError:
+        reset_sandbox_pool(pool, terminate=True)
+        raise WidgetSandboxError("widget render did not finish in %s seconds" % api_settings.WIDGET_SANDBOX_TIMEOUT)
+    except BrokenProcessPool:
+        reset_sandbox_pool(pool)
+        raise WidgetSandboxError("sandbox worker died while rendering")
+
+
+async def arender_in_sandbox(widget_class_name, configuration):
+    """
+    arender_in_sandbox is the async version of render_in_sandbox
+    """
+    import asyncio
+
+    pool, future = submit_render(widget_class_name, configuration)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), api_settings.WIDGET_SANDBOX_TIMEOUT)
+    except asyncio.TimeoutError:
+        reset_sandbox_pool(pool, terminate=True)
+        raise WidgetSandboxError("widget render did not finish in %s seconds" % api_settings.WIDGET_SANDBOX_TIMEOUT)
+    except BrokenProcessPool:
+        reset_sandbox_pool(pool)
+        raise WidgetSandboxError("sandbox worker died while rendering")
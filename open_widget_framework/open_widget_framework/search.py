@@ -0,0 +1,152 @@
+"""
+WidgetApp widget search
+
+Widgets are searched in the database, through GIN indexes made in migration 0009. Text searches match words against a
+tsvector of each widget's title and the text of its configuration (to_tsvector does not take jsonb before PostgreSQL
+10, so keys are matched as well as values), and configuration searches match widgets whose configuration contains a
+JSON object. When WIDGET_CONFIGURATION_STORE is set, the configurations in the
+WidgetConfiguration store are searched through the same indexes on the store.
+"""
+from django.contrib.postgres.fields import JSONField
+from django.db.models import Case, CharField, F, PositiveIntegerField, Q, Value, When
+from django.db.models.functions import Cast
+from django.db.transaction import atomic
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from open_widget_framework.db_routers import record_widget_list_write
+from open_widget_framework.events import RESYNC, publish_widget_list_event
+from open_widget_framework.models import WidgetConfiguration, WidgetInstance, WidgetList, store_configurations
+from open_widget_framework.settings import api_settings
+from open_widget_framework.utils import get_configuration_hash
+from open_widget_framework.widget_serializer import (
+    get_widget_class_serializer,
+    load_configurations,
+    render_pure_widget,
+)
+
+# The indexed tsvector expressions. Queries must use the same expressions as migration 0009 for the indexes to be used
+WIDGET_SEARCH_VECTOR = (
+    "to_tsvector('simple'::regconfig, {table}.title || ' ' || COALESCE({table}.configuration::text, ''))"
+)
+CONFIGURATION_SEARCH_VECTOR = "to_tsvector('simple'::regconfig, configuration::text)"
+SEARCH_QUERY = "plainto_tsquery('simple'::regconfig, %s)"
+
+
+def search_widgets(queryset, text=None, configuration=None, widget_class=None):
+    """
+    search_widgets filters a WidgetInstance queryset to the widgets of widget_class whose title or configuration has
+        all of the words in text and whose configuration contains the JSON object configuration. Each filter is skipped
+        if it is None
+    """
+    store = api_settings.WIDGET_CONFIGURATION_STORE
+    if widget_class is not None:
+        queryset = queryset.filter(widget_class=widget_class)
+    if configuration is not None:
+        condition = Q(configuration__contains=configuration)
+        if store:
+            condition |= Q(configuration_hash__in=WidgetConfiguration.objects.filter(
+                configuration__contains=configuration
+            ).values("pk"))
+        queryset = queryset.filter(condition)
+    if text:
+        where = "(%s) @@ %s" % (WIDGET_SEARCH_VECTOR.format(table=WidgetInstance._meta.db_table), SEARCH_QUERY)
+        params = [text]
+        if store:
+            where = "%s OR %s.configuration_hash IN (SELECT configuration_hash FROM %s WHERE %s @@ %s)" % (
+                where, WidgetInstance._meta.db_table, WidgetConfiguration._meta.db_table, CONFIGURATION_SEARCH_VECTOR,
+                SEARCH_QUERY,
+            )
+            params.append(text)
+        # Filters on raw SQL conditions need extra on Django 2.1
+        queryset = queryset.extra(where=["(%s)" % where], params=params)
+    return queryset
+
+
+def get_updated_configuration(widget_class_name, configuration, changes):
+    """
+    get_updated_configuration returns configuration with the keys in changes set, validated by its widget class.
+    :raises ValidationError: if the updated configuration is not valid
+    """
+    widget_class_serializer = get_widget_class_serializer(widget_class_name)(data=dict(configuration, **changes))
+    if not widget_class_serializer.is_valid():
+        raise ValidationError({"changes": widget_class_serializer.errors})
+    return widget_class_serializer.post_configure()
+
+
+def make_case(values, output_field):
+    """
+    make_case returns a Case that maps the configuration_hash of a widget to one of values, a dict keyed by
+        configuration_hash. Each value is cast, as Postgres would otherwise read JSON and null values as text
+    """
+    return Case(
+        *(When(configuration_hash=configuration_hash, then=Cast(Value(value, output_field=output_field), output_field))
+          for configuration_hash, value in values.items()),
+        output_field=output_field,
+    )
+
+
+@atomic
+def bulk_update_configurations(queryset, widget_class_name, changes):
+    """
+    bulk_update_configurations sets the keys in changes on the configurations of the widgets of widget_class_name in a
+        WidgetInstance queryset. Each distinct configuration is validated and, for pure widget classes, rendered once,
+        then every widget is rewritten with one UPDATE statement that keeps configuration_hash current. The versions of
+        the changed widget-lists are incremented, so their cached renders are rebuilt, and their subscribers are sent a
+        resync event.
+    :return: a tuple of the number of widgets and of widget-lists that changed
+    :raises ValidationError: if any updated configuration is not valid, in which case nothing is changed
+    """
+    queryset = queryset.filter(widget_class=widget_class_name)
+    widgets = list(queryset.select_for_update().values_list("widget_list_id", "configuration_hash"))
+    configurations = load_configurations(
+        WidgetInstance.objects.filter(
+            configuration_hash__in={configuration_hash for _, configuration_hash in widgets}
+        ).order_by("configuration_hash").distinct("configuration_hash").values_list(
+            "configuration_hash", "configuration", "configuration_hash"
+        )
+    )
+    updated_configurations = {}
+    for configuration_hash, configuration in configurations.items():
+        updated_configuration = get_updated_configuration(widget_class_name, configuration, changes)
+        if updated_configuration != configuration:
+            updated_configurations[configuration_hash] = updated_configuration
+    if not updated_configurations:
+        return 0, 0
+
+    # Unsaved widgets that hold the updated configurations, cleared if they are kept in the WidgetConfiguration store
+    updated_widgets = store_configurations([
+        WidgetInstance(configuration=configuration, configuration_hash=get_configuration_hash(configuration))
+        for configuration in updated_configurations.values()
+    ])
+    renders = {
+        configuration_hash: render_pure_widget(widget_class_name, configuration)
+        for configuration_hash, configuration in updated_configurations.items()
+    }
+    updated = queryset.filter(configuration_hash__in=updated_configurations.keys()).update(
+        configuration=make_case(
+            {configuration_hash: widget.configuration
+             for configuration_hash, widget in zip(updated_configurations, updated_widgets)},
+            JSONField(),
+        ),
+        configuration_hash=make_case(
+            {configuration_hash: widget.configuration_hash
+             for configuration_hash, widget in zip(updated_configurations, updated_widgets)},
+            CharField(),
+        ),
+        rendered_body=make_case(
+            {configuration_hash: render[0] for configuration_hash, render in renders.items()}, JSONField()
+        ),
+        render_version=make_case(
+            {configuration_hash: render[1] for configuration_hash, render in renders.items()}, PositiveIntegerField()
+        ),
+    )
+
+    widget_list_ids = {
+        widget_list_id for widget_list_id, configuration_hash in widgets if configuration_hash in updated_configurations
+    }
+    WidgetList.objects.filter(pk__in=widget_list_ids).update(version=F("version") + 1, modified=timezone.now())
+    for widget_list in WidgetList.objects.filter(pk__in=widget_list_ids).only("id", "version"):
+        record_widget_list_write(widget_list)
+        publish_widget_list_event(widget_list, RESYNC, None)
+    return updated, len(widget_list_ids)
@@ -3,7 +3,7 @@ This file contains Django settings for open_widget_framework that should be adde
 They come with default values.
 """
 from django.conf import settings
-from django.test.signals import setting_changed
+from django.core.signals import setting_changed
 
 # The list of the types of widget made available. If you add a new type of widget, include it in this list to
 # make it available
@@ -13,13 +13,89 @@ DEFAULTS = {
         "open_widget_framework.widget_classes.URLWidget",
         "open_widget_framework.widget_classes.ManyUserWidget",
         "open_widget_framework.widget_classes.RssFeedWidget",
+        "open_widget_framework.widget_classes.FileWidget",
     ),
 
     'WIDGET_FRAMEWORK_AUTHENTICATION_CLASSES': None,
 
     'WIDGET_FRAMEWORK_PERMISSION_CLASSES': None,
 
-    'WIDGET_LIST_EDIT_PERMISSIONS': None
+    'WIDGET_LIST_EDIT_PERMISSIONS': None,
+
+    # Seconds allowed for fetching an upstream RSS feed, the largest feed body in bytes that will be downloaded and
+    # parsed, how long feed validators and entries are kept in the cache, and how many feeds of a widget-list are
+    # fetched concurrently
+    'RSS_FEED_TIMEOUT': 5,
+    'RSS_FEED_MAX_BYTES': 1024 * 1024,
+    'RSS_FEED_CACHE_TIMEOUT': 60 * 60 * 24,
+    'RSS_FEED_FETCH_CONCURRENCY': 8,
+
+    # How many choices of a field with lazily loaded choices the choices endpoint returns per page, how many
+    # widget-lists the widget-list index endpoint returns per page and how many widgets the widget search endpoint
+    # returns per page
+    'WIDGET_CHOICES_PAGE_SIZE': 20,
+    'WIDGET_LIST_INDEX_PAGE_SIZE': 50,
+    'WIDGET_SEARCH_PAGE_SIZE': 50,
+
+    # Seconds that rendered widgets and rendered widget-list html fragments are kept in the cache
+    'WIDGET_RENDER_CACHE_TIMEOUT': 60 * 5,
+
+    # Seconds before a cached render of a widget class with refresh_ahead expires that the refresh_widgets management
+    # command re-renders it (None does not track which renders are read, so nothing is refreshed), the seconds that a
+    # render stays hot after it was last read, the most hot renders that are tracked, how many renders are refreshed at
+    # once and the seconds between the passes of refresh_widgets --loop
+    'WIDGET_REFRESH_AHEAD': None,
+    'WIDGET_REFRESH_HOT_TIMEOUT': 60 * 15,
+    'WIDGET_REFRESH_MAX_RENDERS': 1000,
+    'WIDGET_REFRESH_CONCURRENCY': 4,
+    'WIDGET_REFRESH_INTERVAL': 30,
+
+    # Whether the widget-list event stream endpoint is served, the backend that delivers widget-list change events, how
+    # many events of each list it keeps for clients that reconnect, the seconds between keepalives on an event stream
+    # and the seconds before an event stream is closed (clients reconnect and resume from the last event they
+    # received). Each open stream holds a worker, so the endpoint is only meant for ASGI deployments
+    'WIDGET_EVENT_STREAM': False,
+    'WIDGET_EVENT_BACKEND': 'open_widget_framework.events.InProcessEventBackend',
+    'WIDGET_EVENT_HISTORY': 100,
+    'WIDGET_EVENT_KEEPALIVE': 15,
+    'WIDGET_EVENT_STREAM_TIMEOUT': 60 * 5,
+
+    # The database alias that WidgetReadReplicaRouter sends widget reads to (None reads everything from the default
+    # database), and the seconds after a widget-list is written during which its reads check that the replica has
+    # caught up with the written version
+    'WIDGET_READ_DATABASE': None,
+    'WIDGET_READ_YOUR_WRITES_TIMEOUT': 10,
+
+    # Whether to import the widget classes and build their form specs when the app is loaded, and the ids of the
+    # widget-lists that the warm_up_widgets management command renders into the cache by default
+    'WIDGET_WARM_UP_ON_READY': False,
+    'WIDGET_WARM_UP_LIST_IDS': (),
+
+    # Whether widgets keep their configuration in the content-addressed WidgetConfiguration store, so that widgets
+    # with identical configurations share one stored copy, instead of on their own row
+    'WIDGET_CONFIGURATION_STORE': False,
+
+    # The names of the widget classes that render in a pool of sandbox processes, how many processes the pool has, the
+    # CPU seconds and bytes of memory each render may use, and the seconds a render may take before it is abandoned
+    'WIDGET_SANDBOXED_CLASSES': (),
+    'WIDGET_SANDBOX_PROCESSES': 2,
+    'WIDGET_SANDBOX_CPU_SECONDS': 2,
+    'WIDGET_SANDBOX_MEMORY_BYTES': 256 * 1024 * 1024,
+    'WIDGET_SANDBOX_TIMEOUT': 5,
+
+    # The dotted path of the storage class that file widget files are kept in (None uses the default storage), the
+    # directory in that storage they are kept under, the chunk size in bytes that files are uploaded and downloaded
+    # in, the largest file in bytes that may be uploaded and the seconds that clients may cache downloaded files
+    'WIDGET_FILE_STORAGE': None,
+    'WIDGET_FILE_DIRECTORY': 'widget_files',
+    'WIDGET_FILE_CHUNK_SIZE': 64 * 1024,
+    'WIDGET_FILE_MAX_BYTES': 100 * 1024 * 1024,
+    'WIDGET_FILE_CACHE_TIMEOUT': 60 * 60 * 24 * 365,
+
+    # The directory that WidgetProfilingMiddleware writes profiles to (None uses a directory in the system temporary
+    # directory) and how many of the hottest functions each profile summary lists
+    'WIDGET_PROFILE_DIR': None,
+    'WIDGET_PROFILE_TOP_FUNCTIONS': 20,
 }
 
 
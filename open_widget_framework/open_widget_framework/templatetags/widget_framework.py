@@ -0,0 +1,21 @@
+"""
+WidgetApp template tags
+"""
+from django import template
+from django.shortcuts import get_object_or_404
+from django.utils.safestring import mark_safe
+
+from open_widget_framework.models import WidgetList
+from open_widget_framework.rendering import render_widget_list_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def render_widget_list(widget_list_id):
+    """
+    render_widget_list renders a widget-list server side as a single html fragment:
+        {% load widget_framework %}
+        {% render_widget_list widget_list_id %}
+    """
+    return mark_safe(render_widget_list_html(get_object_or_404(WidgetList, pk=widget_list_id)))
@@ -9,9 +9,21 @@ DATABASES = {
         "PASSWORD": "1",
         "HOST": "localhost",
         "PORT": "5432",
-    }
+    },
+    # A second connection to the same database, used as the read replica in tests
+    "replica": {
+        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "NAME": "widgetdb",
+        "USER": "widgetuser",
+        "PASSWORD": "1",
+        "HOST": "localhost",
+        "PORT": "5432",
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
+DATABASE_ROUTERS = ["open_widget_framework.db_routers.WidgetReadReplicaRouter"]
+
 CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
 
 SITE_ID = 1
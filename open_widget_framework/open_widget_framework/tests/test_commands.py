@@ -0,0 +1,220 @@
+import os
+from io import StringIO
+from json import dumps, loads
+from tempfile import NamedTemporaryFile
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from open_widget_framework.models import WidgetConfiguration, WidgetList, WidgetInstance
+from open_widget_framework.utils import get_configuration_hash, get_render_cache_key
+from open_widget_framework.widget_serializer import render_widget_rows
+
+
+class TestWidgetListCommands(TestCase):
+    """ Tests the widget-list management commands """
+
+    def test_export_import_widget_lists(self):
+        """ Test that widget-lists exported by export_widget_lists are recreated by import_widget_lists """
+        widget_list = WidgetList.objects.create()
+        WidgetList.objects.create()
+        for position in range(3):
+            WidgetInstance.objects.create(widget_list=widget_list, position=position, widget_class="Text",
+                                          title="example%s" % position, configuration={"body": "body%s" % position})
+
+        output = StringIO()
+        call_command("export_widget_lists", stdout=output)
+        lines = [loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(["widget_list", "widget", "widget", "widget", "widget_list"],
+                         [line["type"] for line in lines])
+        self.assertEqual({"body": "body2"}, lines[3]["configuration"])
+
+        export_file = self.write_export(output.getvalue())
+        call_command("import_widget_lists", export_file, "--batch-size", "2", stdout=StringIO())
+        new_list = WidgetList.objects.order_by("id")[2]
+        widgets = list(new_list.get_widgets())
+        self.assertEqual(["example0", "example1", "example2"], [widget.title for widget in widgets])
+        self.assertEqual(get_configuration_hash({"body": "body1"}), widgets[1].configuration_hash)
+        self.assertEqual(4, WidgetList.objects.count())
+
+    def test_import_bad_configuration(self):
+        """ Test that import_widget_lists imports nothing if a widget configuration is invalid """
+        lines = [
+            {"type": "widget_list", "id": 1},
+            {"type": "widget", "position": 0, "title": "example", "widget_class": "Text", "react_renderer": None,
+             "configuration": {"body": "example"}},
+            {"type": "widget", "position": 1, "title": "example", "widget_class": "URL", "react_renderer": None,
+             "configuration": {"url": "not a url"}},
+        ]
+        export_file = self.write_export("".join(dumps(line) + "\n" for line in lines))
+        with self.assertRaisesRegex(CommandError, "Line 3"):
+            call_command("import_widget_lists", export_file, stdout=StringIO())
+        self.assertEqual(0, WidgetList.objects.count())
+        self.assertEqual(0, WidgetInstance.objects.count())
+
+    def test_import_bad_positions(self):
+        """ Test that import_widget_lists imports nothing unless each widget-list has the positions 0 to n - 1 """
+        for positions, error in (([0, 0], "Line 3: position 0 is already used"), ([0, 2], "none at position 1")):
+            lines = [{"type": "widget_list", "id": 1}] + [
+                {"type": "widget", "position": position, "title": "example", "widget_class": "Text",
+                 "react_renderer": None, "configuration": {"body": "example"}}
+                for position in positions
+            ]
+            export_file = self.write_export("".join(dumps(line) + "\n" for line in lines))
+            with self.assertRaisesRegex(CommandError, error):
+                call_command("import_widget_lists", export_file, stdout=StringIO())
+            self.assertEqual(0, WidgetInstance.objects.count())
+
+    def test_import_post_configure(self):
+        """ Test that import_widget_lists stores the configurations that post_configure returns """
+        lines = [{"type": "widget_list", "id": 1}] + [
+            {"type": "widget", "position": position, "title": "example", "widget_class": "Text",
+             "react_renderer": None, "configuration": {"body": "example%s" % position}}
+            for position in range(2)
+        ]
+        export_file = self.write_export("".join(dumps(line) + "\n" for line in lines))
+        with patch("open_widget_framework.widget_classes.TextWidget.post_configure", autospec=True,
+                   side_effect=lambda widget: dict(widget.initial_data, imported=True)):
+            call_command("import_widget_lists", export_file, stdout=StringIO())
+        self.assertEqual(
+            [({"body": "example%s" % position, "imported": True},
+              get_configuration_hash({"body": "example%s" % position, "imported": True})) for position in range(2)],
+            list(WidgetInstance.objects.order_by("position").values_list("configuration", "configuration_hash")),
+            msg="import_widget_lists did not store the post_configure output",
+        )
+
+    def write_export(self, contents):
+        """ Helper function that writes an export to a temporary file and returns its path """
+        export_file = NamedTemporaryFile("w", suffix=".ndjson", delete=False)
+        export_file.write(contents)
+        export_file.close()
+        self.addCleanup(os.remove, export_file.name)
+        return export_file.name
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_warm_up_widgets(self):
+        """ Test that warm_up_widgets renders widget-lists into the cache and reports its timings """
+        widget_list = WidgetList.objects.create()
+        WidgetInstance.objects.create(widget_list=widget_list, position=0, widget_class="Text",
+                                      title="example", configuration={"body": "example"})
+        output = StringIO()
+        call_command("warm_up_widgets", str(widget_list.id), stdout=output)
+        self.assertEqual(
+            ["import_widget_classes", "form_specs", "render_widget_lists"],
+            [line.split(":")[0] for line in output.getvalue().splitlines()],
+        )
+        self.assertEqual(
+            "<div>example</div>",
+            cache.get(get_render_cache_key("Text", get_configuration_hash({"body": "example"}))),
+        )
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_CLASSES": ("open_widget_framework.widget_class_base.WidgetClassBase",)})
+    def test_warm_up_bad_widget_class(self):
+        """ Test that warm_up_widgets rejects widget classes the framework cannot use """
+        with self.assertRaises(ImproperlyConfigured):
+            call_command("warm_up_widgets", stdout=StringIO())
+
+    def test_render_pure_widgets(self):
+        """ Test that pure widgets store their render output when saved and that render_pure_widgets re-renders it """
+        widget_list = WidgetList.objects.create()
+        self.client.post(reverse("widget-list"), content_type="application/json", data={
+            "widget_class": "Text", "position": 0, "title": "text", "configuration": {"body": "example"},
+            "widget_list": widget_list.id, "react_renderer": None,
+        })
+        widget = WidgetInstance.objects.get(widget_list=widget_list)
+        self.assertEqual(("<div>example</div>", 1), (widget.rendered_body, widget.render_version))
+        WidgetInstance.objects.create(widget_list=widget_list, position=1, widget_class="Text", title="imported",
+                                      configuration={"body": "imported"})
+
+        modified = WidgetList.objects.get(pk=widget_list.id).modified
+        with patch("open_widget_framework.widget_classes.TextWidget.render", return_value="new") as render:
+            with self.assertNumQueries(2):
+                # One query for the rows and one for the configuration of the widget without stored output
+                rendered = list(render_widget_rows(widget_list.get_widgets()))
+            self.assertEqual(["<div>example</div>", "new"], [widget["html"] for widget in rendered])
+            self.assertEqual(1, render.call_count, msg="a widget with stored output was rendered")
+
+            with patch("open_widget_framework.widget_classes.TextWidget.render_version", 2):
+                call_command("render_pure_widgets", stdout=StringIO())
+                self.assertEqual(
+                    [("new", 2), ("new", 2)],
+                    list(widget_list.get_widgets().values_list("rendered_body", "render_version")),
+                    msg="render_pure_widgets did not re-render widgets with an older render version",
+                )
+        widget_list.refresh_from_db()
+        self.assertEqual(2, widget_list.version)
+        self.assertGreater(widget_list.modified, modified, msg="render_pure_widgets did not mark the list modified")
+
+        with patch("open_widget_framework.widget_classes.TextWidget.pure", False):
+            call_command("render_pure_widgets", stdout=StringIO())
+        self.assertEqual(
+            [(None, None), (None, None)],
+            list(widget_list.get_widgets().values_list("rendered_body", "render_version")),
+            msg="render_pure_widgets did not clear the output of widgets that are not pure",
+        )
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        WIDGET_FRAMEWORK={"WIDGET_REFRESH_AHEAD": 60, "WIDGET_RENDER_CACHE_TIMEOUT": 60},
+    )
+    def test_refresh_widgets(self):
+        """ Test that refresh_widgets re-renders the hot renders of refresh-ahead widget classes into the cache """
+        cache.clear()
+        widget_list = WidgetList.objects.create()
+        configuration = {"url": "https://example.com/feed.xml", "feed_display_limit": 3}
+        widget = WidgetInstance.objects.create(widget_list=widget_list, position=0, widget_class="RSS Feed",
+                                               title="feed", configuration=configuration)
+        WidgetInstance.objects.create(widget_list=widget_list, position=1, widget_class="Text",
+                                      title="text", configuration={"body": "example"})
+        cache_key = get_render_cache_key("RSS Feed", get_configuration_hash(configuration))
+
+        with patch("open_widget_framework.widget_classes.RssFeedWidget.render", return_value="first") as render:
+            list(render_widget_rows(widget_list.get_widgets()))
+            render.return_value = "second"
+            output = StringIO()
+            # Renders expire 60 seconds after they are cached and are refreshed 60 seconds ahead, so every pass is due
+            call_command("refresh_widgets", stdout=output)
+        self.assertEqual("Refreshed 1 renders, 0 failed\n", output.getvalue())
+        self.assertEqual("second", cache.get(cache_key), msg="refresh_widgets did not refresh the hot render")
+
+        with patch("open_widget_framework.widget_classes.RssFeedWidget.render", side_effect=ValueError):
+            output = StringIO()
+            with self.assertLogs("open_widget_framework.refresh", "ERROR"):
+                call_command("refresh_widgets", stdout=output)
+        self.assertEqual("Refreshed 0 renders, 1 failed\n", output.getvalue())
+        self.assertEqual("second", cache.get(cache_key), msg="a failed refresh replaced the cached render")
+
+        widget.delete()
+        output = StringIO()
+        call_command("refresh_widgets", stdout=output)
+        self.assertEqual("Refreshed 0 renders, 0 failed\n", output.getvalue())
+        self.assertEqual({}, cache.get("open_widget_framework:hot-renders"),
+                         msg="refresh_widgets kept a render that no widget uses")
+
+    def test_refresh_widgets_not_configured(self):
+        """ Test that refresh_widgets fails when renders are not tracked for refreshing """
+        with self.assertRaises(CommandError):
+            call_command("refresh_widgets", stdout=StringIO())
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_CONFIGURATION_STORE": True})
+    def test_prune_widget_configurations(self):
+        """ Test that prune_widget_configurations deletes only the stored configurations that no widget uses """
+        widget_list = WidgetList.objects.create()
+        widget = WidgetInstance.objects.create(widget_list=widget_list, position=0, widget_class="Text",
+                                               title="Example", configuration={"body": "example1"})
+        widget.configuration = {"body": "example2"}
+        widget.save()
+        self.assertEqual(2, WidgetConfiguration.objects.count())
+
+        call_command("prune_widget_configurations", "--dry-run", stdout=StringIO())
+        self.assertEqual(2, WidgetConfiguration.objects.count())
+        call_command("prune_widget_configurations", stdout=StringIO())
+        self.assertEqual(
+            [get_configuration_hash({"body": "example2"})],
+            list(WidgetConfiguration.objects.values_list("configuration_hash", flat=True)),
+        )
@@ -0,0 +1,70 @@
+from json import loads
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.transaction import atomic
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from open_widget_framework.db_routers import get_written_version_cache_key, use_primary_database
+from open_widget_framework.models import WidgetList, WidgetInstance
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    WIDGET_FRAMEWORK={"WIDGET_READ_DATABASE": "replica"},
+)
+class TestWidgetReadReplicaRouter(TransactionTestCase):
+    """ Tests read replica routing """
+
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        self.widget_list = WidgetList.objects.create()
+        WidgetInstance.objects.create(widget_list=self.widget_list, position=0, widget_class="Text",
+                                      title="example", configuration={"body": "example"})
+        self.url = reverse("widget-list-detail", kwargs={"pk": self.widget_list.id})
+
+    def test_reads_use_replica(self):
+        """ Test that widget-list reads go to the replica once it has caught up with the last write """
+        with self.assertNumQueries(0, using=DEFAULT_DB_ALIAS), self.assertNumQueries(3, using="replica"):
+            # The widget-list, the widget rows and the configurations of the widgets that are not cached
+            data = loads(self.client.get(self.url).content)
+        self.assertEqual(["example"], [widget["title"] for widget in data])
+
+    def test_reads_stay_on_primary(self):
+        """ Test that reads inside transactions and use_primary_database blocks go to the primary """
+        self.assertEqual("replica", WidgetList.objects.all().db)
+        with atomic():
+            self.assertEqual(DEFAULT_DB_ALIAS, WidgetList.objects.all().db)
+        with use_primary_database():
+            self.assertEqual(DEFAULT_DB_ALIAS, WidgetList.objects.all().db)
+            widget_list = WidgetList.objects.get(pk=self.widget_list.id)
+        self.assertEqual(DEFAULT_DB_ALIAS, widget_list.get_widgets().db)
+
+    def test_read_your_writes(self):
+        """ Test that a widget-list whose replica row is older than its last write is read from the primary """
+        cache.set(get_written_version_cache_key(self.widget_list.id), self.widget_list.version + 1)
+        with self.assertNumQueries(3, using=DEFAULT_DB_ALIAS), self.assertNumQueries(1, using="replica"):
+            data = loads(self.client.get(self.url).content)
+        self.assertEqual(["example"], [widget["title"] for widget in data])
+
+    def test_mutations_use_primary(self):
+        """ Test that requests which change widgets never read from the replica """
+        widget_data = {
+            "widget_class": "Text",
+            "position": 1,
+            "title": "example2",
+            "configuration": {"body": "example2"},
+            "widget_list": self.widget_list.id,
+            "react_renderer": None
+        }
+        with self.assertNumQueries(0, using="replica"):
+            self.client.post(reverse("widget-list"), data=widget_data, content_type="application/json")
+            self.client.post(reverse("widget-list-clone", kwargs={"pk": self.widget_list.id}))
+        self.assertEqual(
+            self.widget_list.version + 1,
+            cache.get(get_written_version_cache_key(self.widget_list.id)),
+            msg="a widget-list write did not record its version",
+        )
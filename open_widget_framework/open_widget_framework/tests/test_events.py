@@ -0,0 +1,106 @@
+from itertools import islice
+from json import loads
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from open_widget_framework.events import (
+    RESYNC,
+    WIDGET_ADDED,
+    WIDGET_DELETED,
+    WIDGET_MOVED,
+    WIDGET_UPDATED,
+    InProcessEventBackend,
+    get_event_backend,
+)
+from open_widget_framework.models import WidgetList, WidgetInstance
+
+
+def make_event(version, widget_list_id=1):
+    """ Helper function that builds a widget-list event """
+    return {"type": WIDGET_UPDATED, "widget_list": widget_list_id, "widget": 1, "position": 0, "version": version}
+
+
+class TestInProcessEventBackend(TestCase):
+    """ Tests the in-process event backend """
+
+    def test_subscribe_after_version(self):
+        """ Test that subscribers receive the events after their last version and None when nothing arrives """
+        backend = InProcessEventBackend()
+        for version in range(1, 4):
+            backend.publish(1, make_event(version))
+        backend.publish(2, make_event(1, widget_list_id=2))
+        events = backend.subscribe(1, 1, timeout=0)
+        self.assertEqual([make_event(2), make_event(3), None], list(islice(events, 3)))
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_EVENT_HISTORY": 2})
+    def test_resync_when_history_is_gone(self):
+        """ Test that a subscriber that missed events which are no longer stored is told to resync """
+        backend = InProcessEventBackend()
+        for version in range(1, 5):
+            backend.publish(1, make_event(version))
+        self.assertEqual(
+            [{"type": RESYNC, "widget_list": 1, "version": 4}, make_event(3), make_event(4)],
+            backend.get_events(1, 1),
+        )
+        self.assertEqual([make_event(4)], backend.get_events(1, 3))
+
+
+class TestWidgetListEvents(TransactionTestCase):
+    """ Tests that widget changes are published and streamed """
+
+    def test_mutations_publish_events(self):
+        """ Test that creating, editing, moving and deleting widgets publish events with the new list version """
+        widget_list = WidgetList.objects.create()
+        widget_data = {
+            "widget_class": "Text",
+            "position": 0,
+            "title": "example",
+            "configuration": {"body": "example"},
+            "widget_list": widget_list.id,
+            "react_renderer": None
+        }
+        self.client.post(reverse("widget-list"), data=widget_data, content_type="application/json")
+        widget_data.update({"title": "example2", "position": 1})
+        self.client.post(reverse("widget-list"), data=widget_data, content_type="application/json")
+        widget = WidgetInstance.objects.get(title="example")
+        url = reverse("widget-detail", kwargs={"pk": widget.id})
+        self.client.patch(url, data={"title": "new_title"}, content_type="application/json")
+        self.client.patch(url, data={"title": "new_title", "position": 0}, content_type="application/json")
+        self.client.patch(url, data={"position": 1}, content_type="application/json")
+        self.client.delete(url, content_type="application/json")
+
+        events = get_event_backend().get_events(widget_list.id, 0)
+        self.assertEqual(
+            [(WIDGET_ADDED, 1, 0), (WIDGET_ADDED, 2, 1), (WIDGET_UPDATED, 3, 0), (WIDGET_UPDATED, 4, 0),
+             (WIDGET_MOVED, 5, 1), (WIDGET_DELETED, 6, 1)],
+            [(event["type"], event["version"], event["position"]) for event in events],
+        )
+        self.assertEqual(widget.id, events[-1]["widget"])
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_EVENT_STREAM": True, "WIDGET_EVENT_KEEPALIVE": 0})
+    def test_get_widget_list_events(self):
+        """ Test GET widget-list-events api endpoint """
+        widget_list = WidgetList.objects.create()
+        for version in range(1, 3):
+            get_event_backend().publish(widget_list.id, make_event(version, widget_list_id=widget_list.id))
+
+        url = reverse("widget-list-events", kwargs={"pk": widget_list.id})
+        with override_settings(WIDGET_FRAMEWORK={}):
+            self.assertEqual(
+                status.HTTP_404_NOT_FOUND, self.client.get(url).status_code,
+                msg="GET widget-list-events streamed while WIDGET_EVENT_STREAM is off",
+            )
+        resp = self.client.get(url, HTTP_LAST_EVENT_ID="1")
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK,
+            msg="GET widget-list-events returned a bad status: %s" % resp.status_code,
+        )
+        self.assertEqual("text/event-stream", resp["Content-Type"])
+        chunks = list(islice(resp.streaming_content, 3))
+        self.assertEqual(b"id: 2\nevent: widget_updated\n", chunks[1][:28])
+        self.assertEqual(make_event(2, widget_list_id=widget_list.id), loads(chunks[1].split(b"data: ")[1]))
+        self.assertEqual(b": keepalive\n\n", chunks[2])
+        resp.close()
@@ -0,0 +1,95 @@
+from io import BytesIO
+from unittest.mock import patch
+from urllib.error import HTTPError
+
+from django.test import TestCase, override_settings
+
+from open_widget_framework.feeds import compact_entries, get_feed_entries
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+FEED_URL = "https://example.com/feed.xml"
+
+
+def make_feed(count):
+    """ Helper function that builds an rss document with count entries, one per day of January 2018 """
+    items = "".join(
+        "<item><title>entry%s</title><link>https://example.com/%s</link>"
+        "<pubDate>%s Jan 2018 12:00:00 GMT</pubDate></item>" % (index, index, index + 1)
+        for index in range(count)
+    )
+    return ("<rss version=\"2.0\"><channel><title>feed</title>%s</channel></rss>" % items).encode("utf-8")
+
+
+class FakeResponse(BytesIO):
+    """ A stand in for the response returned by urlopen """
+
+    def __init__(self, body, headers=None):
+        super().__init__(body)
+        self.headers = headers or {}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestFeeds(TestCase):
+    """ Tests the conditional rss feed fetching layer """
+
+    def test_stores_top_entries(self):
+        """ Test that only the newest entries up to the limit are returned """
+        with patch("open_widget_framework.feeds.urlopen", return_value=FakeResponse(make_feed(20))):
+            entries = get_feed_entries(FEED_URL, 3)
+        self.assertEqual(["entry19", "entry18", "entry17"], [title for _, title, _ in entries])
+        self.assertEqual("https://example.com/19", entries[0][2])
+
+    def test_compact_entries_selection(self):
+        """ Test that the heap selection matches a full sort on a large feed, with undated entries last """
+        entries = [
+            {"title": "entry%s" % index, "link": "https://example.com/%s" % index,
+             "published_parsed": (2018, 1, 1 + index % 28, index % 24, index % 60, 0, 0, 1, 0)}
+            for index in range(1500)
+        ]
+        entries.append({"title": "undated", "link": "https://example.com/undated"})
+        expected = sorted(
+            compact_entries(entries, len(entries)), reverse=True, key=lambda entry: entry[0] or 0
+        )
+        self.assertEqual(expected[:12], compact_entries(entries, 12))
+        self.assertEqual("undated", compact_entries(entries, len(entries))[-1][1])
+        self.assertEqual([], compact_entries(entries, 0))
+
+    def test_not_modified_skips_parsing(self):
+        """ Test that stored validators are sent upstream and a 304 reuses the stored entries """
+        response = FakeResponse(make_feed(5), headers={"ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2018 00:00:00 GMT"})
+        with patch("open_widget_framework.feeds.urlopen", return_value=response):
+            entries = get_feed_entries(FEED_URL, 2)
+
+        not_modified = HTTPError(FEED_URL, 304, "Not Modified", {}, None)
+        with patch("open_widget_framework.feeds.urlopen", side_effect=not_modified) as urlopen, \
+                patch("feedparser.parse") as parse:
+            self.assertEqual(entries, get_feed_entries(FEED_URL, 2))
+            self.assertEqual(entries[:1], get_feed_entries(FEED_URL, 1))
+        parse.assert_not_called()
+        request = urlopen.call_args[0][0]
+        self.assertEqual('"abc"', request.get_header("If-none-match"))
+        self.assertEqual("Mon, 01 Jan 2018 00:00:00 GMT", request.get_header("If-modified-since"))
+
+    def test_larger_limit_refetches(self):
+        """ Test that asking for more entries than are stored fetches the feed unconditionally """
+        with patch("open_widget_framework.feeds.urlopen", return_value=FakeResponse(make_feed(5), {"ETag": "a"})):
+            get_feed_entries(FEED_URL, 2)
+        with patch("open_widget_framework.feeds.urlopen", return_value=FakeResponse(make_feed(5))) as urlopen:
+            self.assertEqual(4, len(get_feed_entries(FEED_URL, 4)))
+        self.assertIsNone(urlopen.call_args[0][0].get_header("If-none-match"))
+
+    @override_settings(WIDGET_FRAMEWORK={"RSS_FEED_MAX_BYTES": 1024})
+    def test_oversized_feed(self):
+        """ Test that feeds larger than RSS_FEED_MAX_BYTES are not parsed """
+        with patch("open_widget_framework.feeds.urlopen", return_value=FakeResponse(make_feed(100))), \
+                patch("feedparser.parse") as parse:
+            self.assertEqual([], get_feed_entries(FEED_URL, 3))
+        parse.assert_not_called()
+
+    def test_fetch_error_uses_stored_entries(self):
+        """ Test that the last stored entries are served when the upstream is unavailable """
+        with patch("open_widget_framework.feeds.urlopen", return_value=FakeResponse(make_feed(5), {"ETag": "a"})):
+            entries = get_feed_entries(FEED_URL, 3)
+        with patch("open_widget_framework.feeds.urlopen", side_effect=HTTPError(FEED_URL, 500, "Error", {}, None)):
+            self.assertEqual(entries, get_feed_entries(FEED_URL, 3))
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from json import loads
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from open_widget_framework.files import get_file_path, parse_range
+from open_widget_framework.widget_classes import FileWidget
+
+CONTENT = bytes(range(256)) * 20
+CONTENT_HASH = hashlib.sha256(CONTENT).hexdigest()
+
+
+@override_settings(WIDGET_FRAMEWORK={"WIDGET_FILE_CHUNK_SIZE": 1024, "WIDGET_FILE_MAX_BYTES": 8 * 1024})
+class TestFiles(TestCase):
+    """ Tests the file widget upload and download endpoints """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        media_root_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_root_settings.enable()
+        self.addCleanup(media_root_settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def upload(self, content, name="example.txt"):
+        """ Helper function that uploads content to the file endpoint """
+        return self.client.post(
+            "%s?name=%s" % (reverse("widget-file-list"), name), data=content, content_type="application/octet-stream"
+        )
+
+    def test_upload_file(self):
+        """ Test that uploads are stored once under their content hash """
+        for name in ("first.txt", "second.txt"):
+            resp = self.upload(CONTENT, name=name)
+            self.assertEqual(resp.status_code, status.HTTP_201_CREATED, msg="POST widget-file returned a bad status")
+            self.assertEqual({"hash": CONTENT_HASH, "name": name, "size": len(CONTENT)}, loads(resp.content))
+        path = os.path.join(self.media_root, get_file_path(CONTENT_HASH))
+        with open(path, "rb") as stored_file:
+            self.assertEqual(CONTENT, stored_file.read())
+        self.assertEqual([CONTENT_HASH], os.listdir(os.path.dirname(path)), msg="the upload was stored twice")
+
+        resp = self.upload(b"x" * (8 * 1024 + 1))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, msg="POST widget-file accepted a large file")
+
+    def test_download_file(self):
+        """ Test that downloads are cacheable and serve byte ranges """
+        self.upload(CONTENT)
+        url = "%s?name=example.txt" % reverse("widget-file-detail", kwargs={"pk": CONTENT_HASH})
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(CONTENT, b"".join(resp.streaming_content))
+        self.assertEqual('"%s"' % CONTENT_HASH, resp["ETag"])
+        self.assertIn("immutable", resp["Cache-Control"])
+        self.assertEqual("text/plain", resp["Content-Type"])
+        self.assertEqual("attachment; filename*=UTF-8''example.txt", resp["Content-Disposition"])
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=1000-2999")
+        self.assertEqual(resp.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(CONTENT[1000:3000], b"".join(resp.streaming_content))
+        self.assertEqual("bytes 1000-2999/%s" % len(CONTENT), resp["Content-Range"])
+        self.assertEqual("2000", resp["Content-Length"])
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=-10", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, msg="a range was served for a stale If-Range")
+        resp.close()
+        self.assertEqual(416, self.client.get(url, HTTP_RANGE="bytes=%s-" % len(CONTENT)).status_code)
+        self.assertEqual(304, self.client.get(url, HTTP_IF_NONE_MATCH='"%s"' % CONTENT_HASH).status_code)
+        self.assertEqual(404, self.client.get(reverse("widget-file-detail", kwargs={"pk": "0" * 64})).status_code)
+
+    def test_parse_range(self):
+        """ Test that Range headers are parsed into inclusive byte ranges """
+        self.assertEqual((0, 9), parse_range("bytes=0-9", 100))
+        self.assertEqual((90, 99), parse_range("bytes=90-", 100))
+        self.assertEqual((90, 99), parse_range("bytes=-10", 100))
+        self.assertEqual((0, 99), parse_range("bytes=-1000", 100))
+        self.assertEqual((50, 99), parse_range("bytes=50-1000", 100))
+        self.assertFalse(parse_range("bytes=100-", 100))
+        self.assertIsNone(parse_range("bytes=0-1,5-9", 100))
+        self.assertIsNone(parse_range(None, 100))
+
+    def test_file_widget(self):
+        """ Test that the file widget validates that its file is stored and renders a download link """
+        file = loads(self.upload(CONTENT, name="report <1>.pdf").content)
+        widget = FileWidget(data={"file": {"hash": file["hash"], "name": file["name"]}})
+        self.assertTrue(widget.is_valid())
+        self.assertEqual(
+            '<a href="/api/v1/file/%s/?name=report+%%3C1%%3E.pdf" download="report &lt;1&gt;.pdf">'
+            'report &lt;1&gt;.pdf</a> (5.0\xa0KB)' % CONTENT_HASH,
+            widget.render(),
+        )
+        for file in ({"hash": "0" * 64, "name": "missing"}, {"hash": "../etc/passwd"}, "not a file"):
+            self.assertFalse(FileWidget(data={"file": file}).is_valid(), msg=file)
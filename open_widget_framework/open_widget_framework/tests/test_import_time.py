@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import django
+from django.test import SimpleTestCase
+
+# Modules that are slow to import and only needed by some code paths, so the framework must import them lazily. Django
+# imports asyncio itself from 3.0 on, so the framework can only keep it out of processes on older versions
+LAZY_MODULES = ("feedparser",) + (("asyncio",) if django.VERSION < (3, 0) else ())
+
+
+def get_imported_modules(code):
+    """ Helper function that runs code in a new process and returns the modules it imported """
+    env = dict(
+        os.environ, DJANGO_SETTINGS_MODULE="open_widget_framework.test_settings", PYTHONPATH=os.pathsep.join(sys.path)
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", "%s\nimport sys\nprint('\\n'.join(sys.modules))" % code],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return set(result.stdout.splitlines())
+
+
+class TestImportTime(SimpleTestCase):
+    """ Tests that the framework does not import heavy modules it does not need yet """
+
+    def test_widget_classes_import_lazily(self):
+        """ Test that importing the widget classes loads neither the auth models nor the lazily imported modules """
+        modules = get_imported_modules("import open_widget_framework.widget_classes")
+        for module in LAZY_MODULES + ("django.contrib.auth.models",):
+            self.assertNotIn(module, modules, msg="importing the widget classes imported %s" % module)
+
+    def test_views_import_lazily(self):
+        """ Test that a set up django process serving the sync views does not load the lazily imported modules """
+        modules = get_imported_modules(
+            "import django; django.setup(); import open_widget_framework.urls, open_widget_framework.widget_classes"
+        )
+        self.assertIn("open_widget_framework.views", modules)
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules, msg="importing the views imported %s" % module)
@@ -0,0 +1,31 @@
+from django.test import TransactionTestCase
+
+from open_widget_framework.loadtest import run_load_test
+from open_widget_framework.models import WidgetList
+
+
+class TestLoadTest(TransactionTestCase):
+    """ Tests the load test harness """
+
+    def test_run_load_test(self):
+        """ Test that a load test of a fixed number of requests reports them and removes its widget-lists """
+        report = run_load_test(
+            readers=2,
+            editors=2,
+            duration=None,
+            requests=5,
+            lists=2,
+            list_size=4,
+            widget_mix="Text=2,URL=1,RSS Feed=1",
+            write_mix="move=1,update=1,create=1",
+        )
+        read_endpoints = [endpoint for endpoint in ("retrieve", "batch", "html") if endpoint in report]
+        self.assertEqual(10, sum(report[endpoint]["requests"] for endpoint in read_endpoints),
+                         msg="the readers did not send exactly their requests")
+        for endpoint in read_endpoints:
+            self.assertEqual(0, report[endpoint]["errors"], msg="%s requests failed" % endpoint)
+            self.assertLessEqual(report[endpoint]["p50"], report[endpoint]["p99"])
+        self.assertTrue({"move", "update", "create"} & set(report), msg="the editors sent no requests")
+        for endpoint in report:
+            self.assertIsNotNone(report[endpoint]["lock_waits"])
+        self.assertEqual(0, WidgetList.objects.count())
@@ -1,6 +1,8 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from open_widget_framework.models import WidgetList, WidgetInstance
+from open_widget_framework.models import WidgetConfiguration, WidgetList, WidgetInstance
+from open_widget_framework.utils import get_configuration_hash
+from open_widget_framework.widget_serializer import render_widget_rows
 
 
 class TestModels(TestCase):
@@ -26,3 +28,48 @@ class TestModels(TestCase):
         widgets = widget_list.get_widgets()
         self.assertEqual(1, widgets.count())
         self.assertEqual(configuration, widgets[0].configuration)
+
+    def test_widget_instance_configuration_hash(self):
+        """ Test that saving a widget instance keeps its configuration hash up to date """
+        widget_list = WidgetList.objects.create()
+        widget = WidgetInstance.objects.create(widget_list=widget_list, position=0, widget_class="Text",
+                                               title='Example1', configuration={"body": "example1"})
+        self.assertEqual(get_configuration_hash({"body": "example1"}), widget.configuration_hash)
+
+        widget.configuration = {"body": "example2"}
+        widget.save(update_fields=["configuration"])
+        widget.refresh_from_db()
+        self.assertEqual(get_configuration_hash({"body": "example2"}), widget.configuration_hash)
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_CONFIGURATION_STORE": True})
+    def test_widget_configuration_store(self):
+        """ Test that widgets with identical configurations share one stored configuration """
+        widget_list = WidgetList.objects.create()
+        for position in range(2):
+            WidgetInstance.objects.create(widget_list=widget_list, position=position, widget_class="Text",
+                                          title='Example%s' % position, configuration={"body": "example1"})
+        self.assertEqual(1, WidgetConfiguration.objects.count())
+        self.assertEqual([None, None], list(widget_list.get_widgets().values_list("configuration", flat=True)))
+        self.assertEqual(
+            [{"body": "example1"}, {"body": "example1"}],
+            [widget.configuration for widget in widget_list.get_widgets()],
+        )
+        self.assertEqual(
+            ["<div>example1</div>", "<div>example1</div>"],
+            [widget["html"] for widget in render_widget_rows(widget_list.get_widgets())],
+        )
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_CONFIGURATION_STORE": True})
+    def test_widget_configuration_store_queries(self):
+        """ Test that a queryset of widgets loads their stored configurations in one query """
+        widget_list = WidgetList.objects.create()
+        for position in range(3):
+            WidgetInstance.objects.create(widget_list=widget_list, position=position, widget_class="Text",
+                                          title='Example%s' % position, configuration={"body": "example%s" % position})
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                [{"body": "example%s" % position} for position in range(3)],
+                [widget.configuration for widget in widget_list.get_widgets()],
+            )
+        widget = WidgetInstance.objects.defer("configuration").get(position=1)
+        self.assertEqual({"body": "example1"}, widget.configuration)
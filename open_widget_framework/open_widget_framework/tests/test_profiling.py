@@ -0,0 +1,55 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from open_widget_framework.models import WidgetList, WidgetInstance
+from open_widget_framework.test_settings import MIDDLEWARE
+
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "open_widget_framework_test_profiles")
+
+
+@override_settings(
+    MIDDLEWARE=MIDDLEWARE + ("open_widget_framework.profiling.WidgetProfilingMiddleware",),
+    WIDGET_FRAMEWORK={"WIDGET_PROFILE_DIR": PROFILE_DIR},
+)
+class TestWidgetProfilingMiddleware(TestCase):
+    """ Tests profiling widget endpoint requests """
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, PROFILE_DIR, ignore_errors=True)
+        self.widget_list = WidgetList.objects.create()
+        for position in range(2):
+            WidgetInstance.objects.create(widget_list=self.widget_list, position=position, widget_class="Text",
+                                          title="example%s" % position, configuration={"body": "example"})
+        self.url = reverse("widget-list-detail", kwargs={"pk": self.widget_list.id})
+
+    def test_profile_widget_list(self):
+        """ Test that a staff user's profiled request stores a profile annotated with the rendered widgets """
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        resp = self.client.get(self.url, {"profile": 1})
+        name = resp["X-Widget-Profile"]
+        self.assertTrue(os.path.exists(os.path.join(PROFILE_DIR, "%s.prof" % name)))
+        with open(os.path.join(PROFILE_DIR, "%s.json" % name)) as summary_file:
+            summary = json.load(summary_file)
+        self.assertEqual(
+            [(widget.id, "Text") for widget in self.widget_list.get_widgets()],
+            [(widget["id"], widget["widget_class"]) for widget in summary["widgets"]],
+        )
+        self.assertTrue(summary["hot_functions"], msg="the profile summary listed no hot functions")
+
+        resp = self.client.get(reverse("widget-list-html", kwargs={"pk": self.widget_list.id}),
+                               HTTP_X_WIDGET_PROFILE="1")
+        self.assertIn(b'class="widget-list"', resp.content)
+        self.assertNotEqual(name, resp["X-Widget-Profile"], msg="two profiled requests shared a profile name")
+
+    def test_profile_requires_staff(self):
+        """ Test that requests from users who are not staff are not profiled """
+        self.client.force_login(User.objects.create_user("user"))
+        resp = self.client.get(self.url, {"profile": 1})
+        self.assertNotIn("X-Widget-Profile", resp)
+        self.assertFalse(os.path.exists(PROFILE_DIR))
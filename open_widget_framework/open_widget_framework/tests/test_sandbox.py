@@ -0,0 +1,85 @@
+import time
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from open_widget_framework.sandbox import WidgetSandboxError, get_sandbox_pool, render_in_sandbox
+from open_widget_framework.utils import get_configuration_hash, get_render_cache_key
+from open_widget_framework.widget_class_base import WidgetClassBase
+from open_widget_framework.widget_serializer import SANDBOX_ERROR_BODY, get_rendered_body, render_widget
+
+
+class SpinWidget(WidgetClassBase):
+    """ A widget class whose render never finishes """
+    name = "Spin"
+
+    def render(self):
+        while True:
+            pass
+
+
+class AllocateWidget(WidgetClassBase):
+    """ A widget class whose render allocates a gigabyte """
+    name = "Allocate"
+
+    def render(self):
+        return "%s" % len(bytearray(1024 * 1024 * 1024))
+
+
+class SleepWidget(WidgetClassBase):
+    """ A widget class whose render waits on I/O that never arrives """
+    name = "Sleep"
+    cache_renders = True
+
+    def render(self):
+        time.sleep(60)
+
+
+SANDBOX_SETTINGS = {
+    "WIDGET_CLASSES": (
+        "open_widget_framework.widget_classes.TextWidget",
+        "open_widget_framework.tests.test_sandbox.SpinWidget",
+        "open_widget_framework.tests.test_sandbox.AllocateWidget",
+        "open_widget_framework.tests.test_sandbox.SleepWidget",
+    ),
+    "WIDGET_SANDBOXED_CLASSES": ("Text", "Spin", "Allocate", "Sleep"),
+    "WIDGET_SANDBOX_PROCESSES": 1,
+    "WIDGET_SANDBOX_CPU_SECONDS": 1,
+    "WIDGET_SANDBOX_TIMEOUT": 10,
+}
+
+
+@override_settings(WIDGET_FRAMEWORK=SANDBOX_SETTINGS)
+class TestSandbox(TestCase):
+    """ Tests rendering widgets in the sandbox process pool """
+
+    def test_render_in_sandbox(self):
+        """ Test that sandboxed widget classes render the same output in a worker process """
+        self.assertEqual("<div>example</div>", render_widget("Text", {"body": "example"}))
+
+    def test_sandbox_limits(self):
+        """ Test that renders over their CPU or memory limit fail without breaking the worker """
+        with self.assertRaisesRegex(WidgetSandboxError, "CPU"):
+            render_in_sandbox("Spin", {})
+        with self.assertRaisesRegex(WidgetSandboxError, "memory"):
+            render_in_sandbox("Allocate", {})
+        self.assertEqual("<div>example</div>", render_in_sandbox("Text", {"body": "example"}))
+
+    @override_settings(
+        WIDGET_FRAMEWORK=dict(SANDBOX_SETTINGS, WIDGET_SANDBOX_TIMEOUT=1),
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    )
+    def test_sandbox_timeout(self):
+        """ Test that a render that does not finish in time kills the pool and shows an uncached placeholder """
+        render_in_sandbox("Text", {"body": "example"})
+        pool = get_sandbox_pool()
+        workers = list(pool._processes.values())  # pylint: disable=protected-access
+        with self.assertLogs("open_widget_framework.widget_serializer", "ERROR"):
+            self.assertEqual(SANDBOX_ERROR_BODY, get_rendered_body("Sleep", {}))
+        self.assertIsNone(cache.get(get_render_cache_key("Sleep", get_configuration_hash({}))),
+                          msg="a failed sandbox render was cached")
+        for worker in workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive(), msg="the worker of a render that timed out was not terminated")
+        self.assertIsNot(pool, get_sandbox_pool(), msg="the pool of a render that timed out was not replaced")
+        self.assertEqual("<div>example</div>", render_in_sandbox("Text", {"body": "example"}))
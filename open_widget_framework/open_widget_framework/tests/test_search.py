@@ -0,0 +1,146 @@
+from json import dumps, loads
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from open_widget_framework.models import WidgetConfiguration, WidgetInstance, WidgetList
+from open_widget_framework.search import search_widgets
+from open_widget_framework.utils import get_configuration_hash
+
+OLD_FEED = {"url": "https://old.example.com/feed.xml", "feed_display_limit": 3}
+NEW_FEED = {"url": "https://new.example.com/feed.xml", "feed_display_limit": 3}
+OTHER_FEED = {"url": "https://other.example.com/feed.xml", "feed_display_limit": 5}
+
+
+class TestSearch(TestCase):
+    """ Tests the widget search and bulk update endpoints """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+        self.widget_lists = [WidgetList.objects.create() for _ in range(3)]
+        self.widgets = [
+            WidgetInstance.objects.create(widget_list=self.widget_lists[0], position=0, widget_class="RSS Feed",
+                                          title="News", configuration=OLD_FEED),
+            WidgetInstance.objects.create(widget_list=self.widget_lists[1], position=0, widget_class="RSS Feed",
+                                          title="Campus news", configuration=OLD_FEED),
+            WidgetInstance.objects.create(widget_list=self.widget_lists[1], position=1, widget_class="RSS Feed",
+                                          title="Sports", configuration=OTHER_FEED),
+            WidgetInstance.objects.create(widget_list=self.widget_lists[2], position=0, widget_class="Text",
+                                          title="Welcome", configuration={"body": "campus news and events"}),
+        ]
+
+    def search(self, **params):
+        """ Helper function that searches widgets and returns the ids of the results and the next offset """
+        resp = self.client.get(reverse("widget-search"), params)
+        self.assertEqual(status.HTTP_200_OK, resp.status_code, msg="search returned a bad status")
+        data = loads(resp.content)
+        return [widget["id"] for widget in data["results"]], data["next"]
+
+    def bulk_update(self, data):
+        """ Helper function that posts a bulk update """
+        return self.client.post(reverse("widget-bulk-update"), data=dumps(data), content_type="application/json")
+
+    def test_search_widgets(self):
+        """ Test searching widgets by text, configuration and widget class """
+        ids = [widget.id for widget in self.widgets]
+        self.assertEqual((ids[1:2] + ids[3:], None), self.search(q="campus news"))
+        self.assertEqual((ids[:2], None), self.search(q="old.example.com"))
+        self.assertEqual((ids[:2], None), self.search(configuration=dumps({"url": OLD_FEED["url"]})))
+        self.assertEqual((ids[1:2], None), self.search(q="campus", widget_class="RSS Feed"))
+        with override_settings(WIDGET_FRAMEWORK={"WIDGET_SEARCH_PAGE_SIZE": 2}):
+            self.assertEqual((ids[:2], 2), self.search())
+            self.assertEqual((ids[2:], None), self.search(offset=2))
+
+        resp = self.client.get(reverse("widget-search"), {"q": "news"})
+        self.assertEqual(
+            {"id": ids[0], "widget_list_id": self.widget_lists[0].id, "widget_class": "RSS Feed", "position": 0,
+             "title": "News", "configuration": OLD_FEED},
+            loads(resp.content)["results"][0],
+        )
+        for params in ({"configuration": "[1]"}, {"configuration": "{"}, {"widget_class": "Missing"}):
+            self.assertEqual(
+                status.HTTP_400_BAD_REQUEST, self.client.get(reverse("widget-search"), params).status_code,
+                msg="search accepted bad parameters: %s" % params,
+            )
+
+    def test_search_permissions(self):
+        """ Test that only admins can search and bulk update widgets """
+        self.client.force_login(User.objects.create_user("editor"))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(reverse("widget-search")).status_code)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.bulk_update({}).status_code)
+
+    def test_search_indexes(self):
+        """ Test that text and configuration searches use the GIN indexes """
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+        try:
+            text_plan = search_widgets(WidgetInstance.objects.all(), text="news").explain()
+            configuration_plan = search_widgets(WidgetInstance.objects.all(), configuration={"url": "x"}).explain()
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+        self.assertIn("open_widget_framework_widgetinstance_search_gin", text_plan)
+        self.assertIn("open_widget_framework_widgetinstance_configuration_gin", configuration_plan)
+
+    def test_bulk_update(self):
+        """ Test that bulk_update rewrites matching configurations and invalidates the lists they are on """
+        versions = [widget_list.version for widget_list in self.widget_lists]
+        with self.assertNumQueries(9):
+            # The session and user, the savepoints, the locked rows, their distinct configurations, one update of the
+            # widgets, one of the list versions and the changed lists for their events
+            resp = self.bulk_update({
+                "widget_class": "RSS Feed",
+                "configuration": {"url": OLD_FEED["url"]},
+                "changes": {"url": NEW_FEED["url"]},
+            })
+        self.assertEqual({"updated": 2, "widget_lists": 2}, loads(resp.content))
+        self.assertEqual(
+            [(NEW_FEED, get_configuration_hash(NEW_FEED))] * 2 + [(OTHER_FEED, get_configuration_hash(OTHER_FEED))],
+            [WidgetInstance.objects.values_list("configuration", "configuration_hash").get(pk=widget.id)
+             for widget in self.widgets[:3]],
+            msg="bulk_update did not rewrite the matching configurations and their hashes",
+        )
+        self.assertEqual(
+            [versions[0] + 1, versions[1] + 1, versions[2]],
+            [widget_list.version for widget_list in WidgetList.objects.filter(
+                pk__in=[widget_list.id for widget_list in self.widget_lists]
+            ).order_by("id")],
+            msg="bulk_update did not increment the versions of the changed widget-lists",
+        )
+
+        resp = self.bulk_update({"widget_class": "RSS Feed", "q": "sports", "changes": {"feed_display_limit": 100}})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code, msg="bulk_update saved a bad configuration")
+        self.assertEqual(OTHER_FEED, WidgetInstance.objects.get(pk=self.widgets[2].id).configuration)
+        resp = self.bulk_update({"widget_class": "RSS Feed", "changes": {"feed_display_limit": 1}})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code, msg="bulk_update ran without a search")
+
+    def test_bulk_update_pure_widgets(self):
+        """ Test that bulk_update re-renders the stored output of widgets of pure widget classes """
+        self.bulk_update({"widget_class": "Text", "q": "campus", "changes": {"body": "closed"}})
+        self.assertEqual(
+            ({"body": "closed"}, "<div>closed</div>", 1),
+            WidgetInstance.objects.values_list("configuration", "rendered_body", "render_version").get(
+                pk=self.widgets[3].id
+            ),
+        )
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_CONFIGURATION_STORE": True})
+    def test_search_configuration_store(self):
+        """ Test searching and bulk updating widgets whose configurations are in the WidgetConfiguration store """
+        widget = WidgetInstance.objects.create(widget_list=self.widget_lists[2], position=1, widget_class="RSS Feed",
+                                               title="Stored", configuration=OTHER_FEED)
+        self.assertIn(widget.id, self.search(q="other.example.com")[0])
+        self.assertIn(widget.id, self.search(configuration=dumps({"url": OTHER_FEED["url"]}))[0])
+
+        resp = self.bulk_update({"widget_class": "RSS Feed", "q": "stored", "changes": {"feed_display_limit": 1}})
+        self.assertEqual({"updated": 1, "widget_lists": 1}, loads(resp.content))
+        updated_feed = dict(OTHER_FEED, feed_display_limit=1)
+        self.assertEqual(
+            (None, get_configuration_hash(updated_feed)),
+            WidgetInstance.objects.values_list("configuration", "configuration_hash").get(pk=widget.id),
+        )
+        self.assertEqual(updated_feed, WidgetConfiguration.objects.get(pk=get_configuration_hash(updated_feed))
+                         .configuration)
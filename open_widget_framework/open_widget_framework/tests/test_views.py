@@ -1,9 +1,15 @@
+import asyncio
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.template import Context, Template
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework import status
 from json import loads
 
 from open_widget_framework.models import WidgetList, WidgetInstance
+from open_widget_framework.rendering import arender_prepared_widgets, prepare_widget_renders
 from open_widget_framework.widget_serializer import WidgetSerializer
 from open_widget_framework.utils import get_widget_class_dict
 
@@ -49,6 +55,43 @@ class TestViews(TestCase):
             msg="widget-list-get-configurations returned bad widget class data",
         )
 
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_CHOICES_PAGE_SIZE": 2})
+    def test_get_widget_choices(self):
+        """ Test widget-list-choices api endpoint pages through searched choices """
+        users = [User.objects.create_user(username) for username in ('carol', 'alice', 'bob', 'alan', 'amy')]
+        url = reverse("widget-list-choices")
+        params = {"widget_class": "Many User", "field": "user_ids", "search": "a"}
+        data = loads(self.client.get(url, params).content)
+        self.assertEqual(
+            [{"value": users[3].id, "label": "alan"}, {"value": users[1].id, "label": "alice"}],
+            data["results"],
+            msg="widget-list-choices returned bad choices",
+        )
+        self.assertEqual(2, data["next"])
+        data = loads(self.client.get(url, dict(params, offset=data["next"])).content)
+        self.assertEqual(([{"value": users[4].id, "label": "amy"}], None), (data["results"], data["next"]))
+
+        for params in ({"widget_class": "Unknown", "field": "user_ids"}, {"widget_class": "Text", "field": "body"},
+                       {"widget_class": "Many User", "field": "user_ids", "offset": "x"}):
+            resp = self.client.get(url, params)
+            self.assertEqual(
+                resp.status_code, status.HTTP_400_BAD_REQUEST, msg="widget-list-choices accepted %s" % params
+            )
+
+    def test_get_many_user_widget_selected_choices(self):
+        """ Test GET widget-detail lists the labels of the selected users of a widget with lazy choices """
+        widget_list = WidgetList.objects.create()
+        users = [User.objects.create_user(username) for username in ('alice', 'bob', 'carol')]
+        widget = WidgetInstance.objects.create(widget_list=widget_list, title='users', position=0,
+                                               widget_class='Many User',
+                                               configuration={'user_ids': [users[0].id, users[2].id]})
+        data = loads(self.client.get(reverse("widget-detail", kwargs={"pk": widget.id})).content)
+        self.assertEqual(
+            {str(users[0].id): 'alice', str(users[2].id): 'carol'},
+            data["widgetClassConfigurations"]["Many User"][1]["choices"],
+            msg="GET widget-detail returned bad selected choices",
+        )
+
     def test_get_widget_list(self):
         """ Test GET widget-list-detail api endpoint """
         widget_list = WidgetList.objects.create()
@@ -377,3 +420,254 @@ class TestViews(TestCase):
         self.assertEqual(widget1.id, data[0]['id'], msg="PATCH widget-detail moved widget1 unnecessarily")
         self.assertEqual(widget2.id, data[1]['id'], msg="PATCH widget-detail moved widget2 unnecessarily")
         self.assertEqual(widget3.id, data[2]['id'], msg="PATCH widget-detail moved widget3 unnecessarily")
+
+    def test_widget_mutations_increment_list_version(self):
+        """ Test that creating, editing, moving and deleting widgets increments the widget-list version """
+        widget_list = WidgetList.objects.create()
+        add_widget(widget_list, index=1)
+        widget_data = {
+            "widget_class": "Text",
+            "position": 1,
+            "title": "example",
+            "configuration": {"body": "example"},
+            "widget_list": widget_list.id,
+            "react_renderer": None
+        }
+        self.client.post(reverse("widget-list"), data=widget_data, content_type="application/json")
+        widget = WidgetInstance.objects.get(title="example")
+        url = reverse("widget-detail", kwargs={"pk": widget.id})
+        self.client.patch(url, data={"title": "new_title"}, content_type="application/json")
+        self.client.patch(url, data={"position": 0}, content_type="application/json")
+        self.client.delete(url, content_type="application/json")
+        widget_list.refresh_from_db()
+        self.assertEqual(4, widget_list.version, msg="widget mutations did not increment the widget-list version")
+
+    def test_widget_mutations_update_list_metadata(self):
+        """ Test that creating, changing and deleting widgets keeps the widget-list metadata up to date """
+        widget_list = WidgetList.objects.create()
+        add_widget(widget_list, index=1)
+        modified = widget_list.modified
+        widgets = ((1, "Text", {"body": "b"}), (2, "URL", {"url": "https://example.com"}))
+        for position, widget_class, configuration in widgets:
+            self.client.post(reverse("widget-list"), content_type="application/json", data={
+                "widget_class": widget_class, "position": position, "title": "example", "configuration": configuration,
+                "widget_list": widget_list.id, "react_renderer": None,
+            })
+        widget_list.refresh_from_db()
+        self.assertEqual(
+            (3, {"Text": 2, "URL": 1}), (widget_list.widget_count, widget_list.widget_class_counts),
+            msg="creating widgets did not update the widget-list metadata",
+        )
+        self.assertGreater(widget_list.modified, modified)
+
+        widget = widget_list.get_widgets().get(widget_class="URL")
+        resp = self.client.delete(reverse("widget-detail", kwargs={"pk": widget.id}))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, msg=resp.content)
+        widget_list.refresh_from_db()
+        self.assertEqual((2, {"Text": 2}), (widget_list.widget_count, widget_list.widget_class_counts))
+
+        clone = widget_list.clone()
+        clone.refresh_from_db()
+        self.assertEqual((2, {"Text": 2}), (clone.widget_count, clone.widget_class_counts))
+
+    @override_settings(WIDGET_FRAMEWORK={"WIDGET_LIST_INDEX_PAGE_SIZE": 2})
+    def test_get_widget_list_index(self):
+        """ Test widget-list-index api endpoint pages through widget-list metadata, most recently modified first """
+        widget_lists = [WidgetList.objects.create() for _ in range(3)]
+        for index, widget_list in enumerate(widget_lists):
+            for widget_index in range(index):
+                add_widget(widget_list, index=widget_index)
+            widget_list.increment_version()
+
+        url = reverse("widget-list-index")
+        with self.assertNumQueries(1):
+            data = loads(self.client.get(url).content)
+        self.assertEqual(
+            [(widget_lists[2].id, 2, {"Text": 2}), (widget_lists[1].id, 1, {"Text": 1})],
+            [(result["id"], result["widget_count"], result["widget_class_counts"]) for result in data["results"]],
+            msg="widget-list-index returned bad metadata",
+        )
+        self.assertEqual(2, data["next"])
+        data = loads(self.client.get(url, {"offset": data["next"]}).content)
+        self.assertEqual(([widget_lists[0].id], None), ([result["id"] for result in data["results"]], data["next"]))
+
+    def test_get_widget_list_html(self):
+        """ Test GET widget-list-html api endpoint """
+        widget_list = WidgetList.objects.create()
+        add_widget(widget_list, index=1)
+        add_widget(widget_list, index=2)
+        widget1, widget2 = widget_list.get_widgets()
+        url = reverse("widget-list-html", kwargs={"pk": widget_list.id})
+        resp = self.client.get(url)
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK,
+            msg="GET widget-list-html returned a bad status: %s" % resp.status_code,
+        )
+        expected_html = (
+            '<div class="widget-list">'
+            '<div class="widget" id="widget-%s"><div class="widget-body">'
+            '<h5 class="widget-title">widget1</h5><div class="widget-text"><div>example1</div></div></div></div>'
+            '<div class="widget" id="widget-%s"><div class="widget-body">'
+            '<h5 class="widget-title">widget2</h5><div class="widget-text"><div>example2</div></div></div></div>'
+            '</div>' % (widget1.id, widget2.id)
+        )
+        self.assertEqual(
+            expected_html,
+            b"".join(resp.streaming_content).decode("utf-8"),
+            msg="GET widget-list-html returned bad html",
+        )
+        template = Template("{% load widget_framework %}{% render_widget_list list_id %}")
+        self.assertEqual(
+            expected_html,
+            template.render(Context({"list_id": widget_list.id})),
+            msg="render_widget_list template tag returned bad html",
+        )
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_widget_list_html_cached_by_version(self):
+        """ Test that the widget-list html fragment is cached until the widget-list version changes """
+        widget_list = WidgetList.objects.create()
+        add_widget(widget_list, index=1)
+        url = reverse("widget-list-html", kwargs={"pk": widget_list.id})
+        html = b"".join(self.client.get(url).streaming_content)
+
+        WidgetInstance.objects.filter(widget_list=widget_list).update(title="changed")
+        resp = self.client.get(url)
+        self.assertEqual(html, resp.content, msg="GET widget-list-html did not serve the cached fragment")
+
+        widget_list.increment_version()
+        resp = self.client.get(url)
+        self.assertIn(b"changed", b"".join(resp.streaming_content), msg="GET widget-list-html served a stale fragment")
+
+    def test_get_widget_list_batch(self):
+        """ Test GET widget-list-batch api endpoint """
+        widget_list1 = WidgetList.objects.create()
+        add_widget(widget_list1, index=1)
+        widget_list2 = WidgetList.objects.create()
+        url = reverse("widget-list-batch")
+        resp = self.client.get(url, {"ids": "%s,%s,%s" % (widget_list1.id, widget_list2.id, widget_list2.id + 1)})
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_200_OK,
+            msg="GET widget-list-batch returned a bad status: %s" % resp.status_code,
+        )
+        self.assertEqual(
+            {
+                str(widget_list1.id): [WidgetSerializer(widget_list1.get_widgets()[0]).render_with_title()],
+                str(widget_list2.id): [],
+            },
+            loads(resp.content),
+            msg="GET widget-list-batch returned bad data",
+        )
+        resp = self.client.get(url, {"ids": "1,a"})
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_400_BAD_REQUEST,
+            msg="GET widget-list-batch returned a bad status: %s" % resp.status_code,
+        )
+
+    def test_async_widget_list_render(self):
+        """ Test that rendering a widget-list concurrently matches rendering it synchronously """
+        widget_list = WidgetList.objects.create()
+        for index in range(3):
+            add_widget(widget_list, index=index)
+        rendered_widgets = asyncio.get_event_loop().run_until_complete(
+            arender_prepared_widgets(prepare_widget_renders(widget_list.get_widgets()))
+        )
+        self.assertEqual(
+            [WidgetSerializer(widget).render_with_title() for widget in widget_list.get_widgets()],
+            rendered_widgets,
+            msg="async widget rendering returned bad data",
+        )
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_cached_widget_list_skips_configuration(self):
+        """ Test that reading a widget-list whose widgets are cached loads only the pruned widget rows """
+        widget_list = WidgetList.objects.create()
+        for index in range(3):
+            add_widget(widget_list, index=index)
+        url = reverse("widget-list-detail", kwargs={"pk": widget_list.id})
+        data = loads(self.client.get(url).content)
+
+        with self.assertNumQueries(1):
+            # The encoded list is cached by version, so only the widget-list is loaded
+            self.assertEqual(data, loads(self.client.get(url).content))
+
+        widget_list.increment_version()
+        with self.assertNumQueries(2):
+            # One query for the widget-list and one for the widget rows
+            self.assertEqual(data, loads(self.client.get(url).content))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_widget_list_payload_rebuilt_from_cached_widgets(self):
+        """ Test that changing one widget re-renders only that widget when the list and batch payloads are rebuilt """
+        widget_lists = [WidgetList.objects.create() for _ in range(2)]
+        for widget_list in widget_lists:
+            for index in range(3):
+                add_widget(widget_list, index=index)
+        batch_url = "%s?ids=%s,%s" % (reverse("widget-list-batch"), widget_lists[0].id, widget_lists[1].id)
+        self.client.get(batch_url)
+
+        widget = widget_lists[0].get_widgets()[1]
+        widget.configuration = {"body": "changed"}
+        widget.save()
+        widget_lists[0].increment_version()
+
+        with patch("open_widget_framework.widget_classes.TextWidget.render", autospec=True,
+                   side_effect=lambda widget: "<div>%s</div>" % widget.data["body"]) as render:
+            data = loads(self.client.get(batch_url).content)
+        self.assertEqual(1, render.call_count, msg="widgets that did not change were rendered again")
+        self.assertEqual(
+            ["<div>example0</div>", "<div>changed</div>", "<div>example2</div>"],
+            [widget["html"] for widget in data[str(widget_lists[0].id)]],
+        )
+        self.assertEqual(3, len(data[str(widget_lists[1].id)]))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_uncached_widget_class_renders_fresh(self):
+        """ Test that lists with widgets of classes that do not cache their renders show changes to users at once """
+        widget_list = WidgetList.objects.create()
+        user = User.objects.create_user("before")
+        self.client.post(reverse("widget-list"), content_type="application/json", data={
+            "widget_class": "Many User", "position": 0, "title": "users", "configuration": {"user_ids": [user.id]},
+            "widget_list": widget_list.id, "react_renderer": None,
+        })
+        list_url = reverse("widget-list-detail", kwargs={"pk": widget_list.id})
+        html_url = reverse("widget-list-html", kwargs={"pk": widget_list.id})
+        self.assertIn("before", loads(self.client.get(list_url).content)[0]["html"])
+        self.assertIn("before", b"".join(self.client.get(html_url).streaming_content).decode())
+
+        user.username = "after"
+        user.save()
+        self.assertIn("after", loads(self.client.get(list_url).content)[0]["html"],
+                      msg="a renamed user was served from a cached list")
+        self.assertIn("after", b"".join(self.client.get(html_url).streaming_content).decode(),
+                      msg="a renamed user was served from a cached html fragment")
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_clone_widget_list(self):
+        """ Test POST widget-list-clone api endpoint """
+        widget_list = WidgetList.objects.create()
+        for index in range(3):
+            add_widget(widget_list, index=index)
+        self.client.get(reverse("widget-list-detail", kwargs={"pk": widget_list.id}))
+
+        resp = self.client.post(reverse("widget-list-clone", kwargs={"pk": widget_list.id}))
+        self.assertEqual(
+            resp.status_code,
+            status.HTTP_201_CREATED,
+            msg="POST widget-list-clone returned a bad status: %s" % resp.status_code,
+        )
+        clone = WidgetList.objects.get(pk=loads(resp.content)["id"])
+        fields = ("position", "title", "widget_class", "configuration", "configuration_hash")
+        self.assertEqual(
+            list(widget_list.get_widgets().values_list(*fields)),
+            list(clone.get_widgets().values_list(*fields)),
+            msg="POST widget-list-clone did not copy the widgets",
+        )
+
+        with self.assertNumQueries(2):
+            # The copies share cached renders with the original widgets, so their configurations are not loaded
+            data = loads(self.client.get(reverse("widget-list-detail", kwargs={"pk": clone.id})).content)
+        self.assertEqual(["widget0", "widget1", "widget2"], [widget["title"] for widget in data])
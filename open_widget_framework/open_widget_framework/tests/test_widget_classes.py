@@ -1,11 +1,17 @@
+import asyncio
+from unittest.mock import patch
+
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
+from rest_framework.fields import ChoiceField
 from json import loads
 
 from open_widget_framework.models import WidgetList, WidgetInstance
-from open_widget_framework.widget_serializer import WidgetSerializer
+from open_widget_framework.widget_class_base import WidgetClassBase
+from open_widget_framework.widget_classes import ManyUserWidget, RssFeedWidget
+from open_widget_framework.widget_serializer import WidgetSerializer, render_widget_rows
 
 
 def get_post_data(widget_list, widget_class, configuration):
@@ -100,3 +106,149 @@ class TestWidgetClasses(TestCase):
             data[0],
             msg="POST widget-list returned bad data",
         )
+
+    def test_rss_feed_widget_render(self):
+        """ Test that the rss feed widget renders its entries escaped and up to the display limit """
+        entries = [
+            (1514808000, "<b>entry2</b>", "https://example.com/2"),
+            (1514721600, "entry1", "https://example.com/1"),
+            (None, "undated", None),
+        ]
+        widget = RssFeedWidget(data={"url": "https://example.com/feed.xml", "feed_display_limit": 3})
+        self.assertTrue(widget.is_valid())
+        with patch("open_widget_framework.widget_classes.get_feed_entries", return_value=entries) as get_feed_entries:
+            html = widget.render()
+        get_feed_entries.assert_called_once_with("https://example.com/feed.xml", 3)
+        self.assertEqual(
+            '<p><a href="https://example.com/2">01/01 12:00PM | &lt;b&gt;entry2&lt;/b&gt;</a></p>'
+            '<p><a href="https://example.com/1">12/31 12:00PM | entry1</a></p>'
+            '<p><a href=""> | undated</a></p>',
+            html,
+        )
+
+    def test_rss_feed_widget_arender(self):
+        """ Test that the rss feed widget renders the same html asynchronously """
+        entries = [(1514808000, "entry", "https://example.com/1")]
+        widget = RssFeedWidget(data={"url": "https://example.com/feed.xml", "feed_display_limit": 3})
+        self.assertTrue(widget.is_valid())
+        with patch("open_widget_framework.widget_classes.get_feed_entries", return_value=entries):
+            self.assertEqual(widget.render(), asyncio.get_event_loop().run_until_complete(widget.arender()))
+
+    def test_render_widget_row_parity(self):
+        """ Test that the values() row fast path renders every widget class exactly like render_with_title """
+        widget_list = WidgetList.objects.create()
+        user = User.objects.create_user('user1')
+        configurations = [
+            ('Text', {'body': '<b>example body</b>'}, None),
+            ('URL', {'url': 'https://zagaran.com'}, 'customRenderer'),
+            ('Many User', {'user_ids': [user.id]}, None),
+            ('RSS Feed', {'url': 'https://example.com/feed.xml', 'feed_display_limit': 3}, None),
+        ]
+        for position, (widget_class, configuration, react_renderer) in enumerate(configurations):
+            WidgetInstance.objects.create(widget_list=widget_list, widget_class=widget_class, position=position,
+                                          title='widget%s' % position, configuration=configuration,
+                                          react_renderer=react_renderer)
+
+        entries = [(1514808000, "entry", "https://example.com/1")]
+        with patch("open_widget_framework.widget_classes.get_feed_entries", return_value=entries):
+            expected = [WidgetSerializer(widget).render_with_title() for widget in widget_list.get_widgets()]
+            with self.assertNumQueries(4):
+                # One query for the rows, one for the configurations of uncached widgets and two for validating and
+                # loading the many user widget's users
+                rendered = list(render_widget_rows(widget_list.get_widgets()))
+        self.assertEqual(expected, rendered)
+
+    def test_many_user_widget_render_many(self):
+        """ Test that the many user widgets of a list load their users with one query """
+        widget_list = WidgetList.objects.create()
+        users = [User.objects.create_user('user%s' % index) for index in range(4)]
+        for position in range(4):
+            WidgetInstance.objects.create(widget_list=widget_list, widget_class='Many User', position=position,
+                                          title='widget%s' % position,
+                                          configuration={'user_ids': [user.id for user in users[position:]]})
+
+        expected = [WidgetSerializer(widget).render_with_title() for widget in widget_list.get_widgets()]
+        with self.assertNumQueries(7):
+            # One query for the rows, one for the configurations, one lookup validating the users of each widget and
+            # one for the users of all the widgets
+            rendered = list(render_widget_rows(widget_list.get_widgets()))
+        self.assertEqual(expected, rendered)
+        self.assertIn('user3', rendered[3]['html'])
+        self.assertNotIn('user0', rendered[3]['html'])
+
+    def test_rss_feed_widget_render_many(self):
+        """ Test that rss feed widgets sharing a feed fetch it once, up to the largest display limit """
+        entries = {
+            "https://example.com/a.xml": [(1514808000 - index, "a%s" % index, None) for index in range(5)],
+            "https://example.com/b.xml": [(1514808000, "b0", None)],
+        }
+        configurations = [
+            {"url": "https://example.com/a.xml", "feed_display_limit": 2},
+            {"url": "https://example.com/b.xml", "feed_display_limit": 3},
+            {"url": "https://example.com/a.xml", "feed_display_limit": 4},
+        ]
+        widgets = [RssFeedWidget(data=configuration) for configuration in configurations]
+        for widget in widgets:
+            self.assertTrue(widget.is_valid())
+
+        with patch("open_widget_framework.widget_classes.get_feed_entries",
+                   side_effect=lambda url, limit: entries[url][:limit]) as get_feed_entries:
+            expected = [widget.render() for widget in widgets]
+            get_feed_entries.reset_mock()
+            self.assertEqual(expected, RssFeedWidget.render_many(widgets))
+        self.assertEqual(
+            [("https://example.com/a.xml", 4), ("https://example.com/b.xml", 3)],
+            sorted(call[0] for call in get_feed_entries.call_args_list),
+            msg="render_many did not fetch each feed once",
+        )
+
+    def test_many_user_widget_lazy_choices(self):
+        """ Test that the many user widget validates its users with one lookup instead of loading every user """
+        users = [User.objects.create_user('user%s' % index) for index in range(3)]
+        with self.assertNumQueries(0):
+            form_spec = WidgetSerializer.get_configuration_form_spec('Many User')
+        self.assertEqual({}, form_spec[1]['choices'])
+        self.assertTrue(form_spec[1]['lazyChoices'])
+
+        widget = ManyUserWidget(data={'user_ids': [str(users[0].id), users[2].id]})
+        with self.assertNumQueries(1):
+            self.assertTrue(widget.is_valid())
+        self.assertEqual([users[0].id, users[2].id], widget.validated_data['user_ids'])
+
+        for user_ids in ([users[0].id, 0], ['not an id'], 'abc'):
+            self.assertFalse(ManyUserWidget(data={'user_ids': user_ids}).is_valid(), msg=user_ids)
+
+    def test_shared_widget_class_fields(self):
+        """ Test that widget classes without pre_configure share their fields and still validate independently """
+        first = RssFeedWidget(data={"url": "https://example.com/a.xml", "feed_display_limit": 2})
+        second = RssFeedWidget(data={"url": "https://example.com/b.xml", "feed_display_limit": 5})
+        invalid = RssFeedWidget(data={"url": "not a url", "feed_display_limit": 5})
+        self.assertIs(first.fields, second.fields, msg="RssFeedWidget serializers did not share their fields")
+        self.assertFalse(hasattr(first.fields["url"].parent, "initial_data"),
+                         msg="Shared fields were bound to a serializer with data")
+        self.assertTrue(first.is_valid() and second.is_valid(), msg="Valid configurations did not validate")
+        self.assertFalse(invalid.is_valid(), msg="An invalid configuration validated with shared fields")
+        self.assertEqual(
+            (first.validated_data["url"], second.validated_data["feed_display_limit"]),
+            ("https://example.com/a.xml", 5),
+            msg="Serializers with shared fields did not keep their own validated data",
+        )
+        with self.assertRaises(TypeError, msg="Shared fields could be changed"):
+            first.fields["url"] = None
+
+        class PreConfiguredWidget(WidgetClassBase):
+            """ A widget class that changes its fields on each instance """
+            choice = ChoiceField(choices=[])
+
+            def pre_configure(self):
+                self.fields["choice"].choices = [(1, "one"), (2, "two")]
+
+        widget = PreConfiguredWidget(data={"choice": 1})
+        self.assertIs(widget.fields, widget.fields, msg="A widget class with pre_configure rebuilt its fields")
+        self.assertIsNot(
+            widget.fields, PreConfiguredWidget().fields,
+            msg="A widget class with pre_configure shared its fields",
+        )
+        self.assertTrue(widget.is_valid(), msg="Validation did not use the choices set by pre_configure")
+        self.assertFalse(PreConfiguredWidget(data={"choice": 3}).is_valid(),
+                         msg="Validation accepted a choice that pre_configure did not set")
@@ -1,11 +1,13 @@
 """
 WidgetApp urls
 """
+import django
 from django.conf.urls import url
 from django.urls import include
 from rest_framework import routers
 
 from open_widget_framework.views import (
+    WidgetFileViewSet,
     WidgetViewSet,
     WidgetListViewSet,
 )
@@ -13,7 +15,17 @@ from open_widget_framework.views import (
 router = routers.SimpleRouter()
 router.register(r'list', WidgetListViewSet, basename="widget-list")
 router.register(r'widget', WidgetViewSet, basename="widget")
+router.register(r'file', WidgetFileViewSet, basename="widget-file")
 
 urlpatterns = [
     url(r"^api/v1/", include(router.urls))
 ]
+
+if django.VERSION >= (3, 1):
+    # Async views need Django 3.1+ and are only useful under ASGI
+    from open_widget_framework import async_views
+
+    urlpatterns += [
+        url(r"^api/v1/async/list/batch/$", async_views.widget_list_batch, name="widget-list-async-batch"),
+        url(r"^api/v1/async/list/(?P<pk>[0-9]+)/$", async_views.widget_list_retrieve, name="widget-list-async-detail"),
+    ]
@@ -1,16 +1,46 @@
+import hashlib
+import json
+from functools import lru_cache
+
 from django.utils.module_loading import import_string
 
 from open_widget_framework.settings import api_settings
 
 
+@lru_cache(maxsize=None)
+def import_widget_classes(widget_class_paths):
+    """
+    import_widget_classes imports the widget classes at a tuple of dotted paths and maps their names to them. The
+        result is kept for each tuple of paths, so the classes are only imported once per process
+    """
+    imported_widget_classes = [import_string(widget_class) for widget_class in widget_class_paths]
+    return {widget_class.name: widget_class for widget_class in imported_widget_classes}
+
+
 def get_widget_class_dict():
     """
     get_widget_class_dict constructs a dictionary of widget_class names to widget_class objects. This is the sole means
         by which widget_classes are listed and defined.
     """
-    widget_classes = api_settings.WIDGET_CLASSES
+    return dict(import_widget_classes(tuple(api_settings.WIDGET_CLASSES)))
 
-    imported_widget_classes = [
-        import_string(widget_class) for widget_class in widget_classes
-    ]
-    return {widget_class.name: widget_class for widget_class in imported_widget_classes}
+
+def get_configuration_hash(configuration):
+    """
+    get_configuration_hash returns a stable hash of a widget configuration. Equal configurations hash equally
+        regardless of key order
+    """
+    canonical = json.dumps(configuration, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def get_render_cache_key(widget_class_name, configuration_hash):
+    """
+    get_render_cache_key returns the cache key for the rendered body of a widget of a widget class with cache_renders
+        set. Those classes render from their configuration alone, so widgets with the same class and configuration
+        share a cache entry
+    """
+    return "open_widget_framework:render:%s:%s" % (
+        hashlib.sha1(widget_class_name.encode("utf-8")).hexdigest(),
+        configuration_hash,
+    )
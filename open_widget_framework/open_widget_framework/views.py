@@ -1,15 +1,49 @@
 """
 WidgetApp views
 """
+import json
+import mimetypes
+import time
+from urllib.parse import quote
+
+from django.core.cache import cache
 from django.db.transaction import atomic
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import action
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
+from rest_framework.settings import api_settings as rest_framework_settings
+from rest_framework.viewsets import ModelViewSet, ViewSet
 
+from open_widget_framework.db_routers import get_widget_lists_for_read, use_primary_database
+from open_widget_framework.events import (
+    WIDGET_ADDED,
+    WIDGET_DELETED,
+    WIDGET_MOVED,
+    WIDGET_UPDATED,
+    get_event_backend,
+    publish_widget_list_event,
+)
+from open_widget_framework.files import (
+    FileTooLargeError,
+    get_file_path,
+    get_file_storage,
+    iter_file_range,
+    parse_range,
+    store_file,
+)
 from open_widget_framework.models import WidgetList, WidgetInstance
+from open_widget_framework.rendering import (
+    get_widget_list_html_cache_key,
+    get_widget_list_payloads,
+    is_widget_list_cacheable,
+    stream_widget_list_html,
+)
+from open_widget_framework.search import bulk_update_configurations, search_widgets
+from open_widget_framework.utils import get_widget_class_dict
 from open_widget_framework.widget_serializer import WidgetSerializer, WidgetListSerializer, \
-    get_widget_class_configurations
+    get_widget_class_configurations, get_widget_class_serializer, load_configurations, render_widget_rows
 from open_widget_framework.settings import api_settings
 
 # TODO: validate with widget list
@@ -21,7 +55,73 @@ def make_widget_list_response(queryset):
         with their title. This is the response for most of the widget level api endpoints so that the frontend can
         update it's widget-list
     """
-    return JsonResponse([WidgetSerializer(widget).render_with_title() for widget in queryset], safe=False)
+    return JsonResponse(list(render_widget_rows(queryset)), safe=False)
+
+
+def stream_widget_list_events(widget_list, last_version):
+    """
+    stream_widget_list_events yields the changes to a widget-list after last_version as server-sent events. Each event's
+        id is the widget-list version, so a reconnecting EventSource resumes from the last event it received. The stream
+        ends after WIDGET_EVENT_STREAM_TIMEOUT seconds to free the worker; clients reconnect automatically
+    """
+    yield 'retry: 1000\n\n'
+    deadline = time.monotonic() + api_settings.WIDGET_EVENT_STREAM_TIMEOUT
+    events = get_event_backend().subscribe(widget_list.id, last_version, api_settings.WIDGET_EVENT_KEEPALIVE)
+    for event in events:
+        if event is None:
+            yield ': keepalive\n\n'
+        else:
+            yield 'id: %s\nevent: %s\ndata: %s\n\n' % (event['version'], event['type'], json.dumps(event))
+        if time.monotonic() >= deadline:
+            break
+
+
+def make_file_response(response, headers):
+    """
+    make_file_response sets headers on a response for a widget file and returns it
+    """
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def get_widget_list_ids(request):
+    """
+    get_widget_list_ids parses the comma separated widget-list ids in the ids query parameter of a batch request
+    """
+    try:
+        return [int(widget_list_id) for widget_list_id in request.GET.get('ids', '').split(',') if widget_list_id]
+    except ValueError:
+        raise ValidationError('ids must be a comma separated list of widget-list ids')
+
+
+def get_offset(request):
+    """
+    get_offset parses the offset query parameter of a paged request
+    """
+    try:
+        return max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        raise ValidationError('offset must be an integer')
+
+
+def get_search_filters(data):
+    """
+    get_search_filters returns the search_widgets filters in the q, configuration and widget_class parameters of a
+        widget search. configuration may be given as a JSON encoded object
+    """
+    configuration = data.get('configuration')
+    if isinstance(configuration, str):
+        try:
+            configuration = json.loads(configuration)
+        except ValueError:
+            raise ValidationError('configuration must be a JSON object')
+    if configuration is not None and not isinstance(configuration, dict):
+        raise ValidationError('configuration must be a JSON object')
+    widget_class = data.get('widget_class')
+    if widget_class is not None and widget_class not in get_widget_class_dict():
+        raise ValidationError('Unrecognized widget class')
+    return {'text': data.get('q') or None, 'configuration': configuration, 'widget_class': widget_class}
 
 
 class WidgetListViewSet(ModelViewSet):
@@ -29,14 +129,49 @@ class WidgetListViewSet(ModelViewSet):
     WidgetListViewSet handles requests at the widget-list level with the following mapping (as reflected in urls.py):
         get_lists (GET with no list ID) -> list
         GET (with list ID) -> retrieve
+        GET html (with list ID) -> html
+        GET batch (with ?ids=...) -> batch
+        GET index -> index
+        GET choices (with ?widget_class=...&field=...) -> choices
+        GET events (with list ID) -> events
         POST -> create
+        POST clone (with list ID) -> clone
         DELETE -> destroy
 
         It also implements authentication and permissions if they are defined in the widget-framework settings
     """
     queryset = WidgetList.objects.all()
     serializer_class = WidgetListSerializer
-    permission_classes = (api_settings.WIDGET_FRAMEWORK_PERMISSION_CLASSES,)
+    authentication_classes = (
+        api_settings.WIDGET_FRAMEWORK_AUTHENTICATION_CLASSES or rest_framework_settings.DEFAULT_AUTHENTICATION_CLASSES
+    )
+    permission_classes = (
+        api_settings.WIDGET_FRAMEWORK_PERMISSION_CLASSES or rest_framework_settings.DEFAULT_PERMISSION_CLASSES
+    )
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Requests that change widget-lists read from the primary database; other requests may read from a replica
+        """
+        if request.method in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with use_primary_database():
+            return super().dispatch(request, *args, **kwargs)
+
+    def get_object(self):
+        """
+        get_object returns the requested widget-list, from the primary database if the replica has not caught up with
+            a recent write to it
+        """
+        try:
+            pk = int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+        widget_list = get_widget_lists_for_read(self.get_queryset(), [pk]).get(pk)
+        if widget_list is None:
+            raise Http404
+        self.check_object_permissions(self.request, widget_list)
+        return widget_list
 
     @action(detail=False)
     def get_configurations(self, request):
@@ -45,11 +180,116 @@ class WidgetListViewSet(ModelViewSet):
         """
         return JsonResponse({'widgetClassConfigurations': get_widget_class_configurations()})
 
+    @action(detail=False)
+    def index(self, request):
+        """
+        API endpoint that returns a page of widget-lists with their metadata (version, widget_count,
+            widget_class_counts and modified), most recently modified first, without loading their widgets. Pages start
+            at the offset query parameter; next is the offset of the next page, or null on the last page
+        """
+        offset = get_offset(request)
+        page_size = api_settings.WIDGET_LIST_INDEX_PAGE_SIZE
+        # Fetch one extra widget-list to tell whether there is a next page
+        widget_lists = list(
+            self.filter_queryset(self.get_queryset())
+            .order_by('-modified', '-id')
+            .values('id', 'version', 'widget_count', 'widget_class_counts', 'modified')[offset:offset + page_size + 1]
+        )
+        return JsonResponse({
+            'results': widget_lists[:page_size],
+            'next': offset + page_size if len(widget_lists) > page_size else None,
+        })
+
+    @action(detail=False)
+    def choices(self, request):
+        """
+        API endpoint that returns a page of the choices of a widget class field whose choices come from a
+            ChoiceProvider, for ?widget_class=...&field=... and optionally search and offset. next is the offset of the
+            next page, or null on the last page
+        """
+        widget_class_name = request.GET.get('widget_class')
+        if widget_class_name not in get_widget_class_dict():
+            raise ValidationError('Unrecognized widget class')
+        field = get_widget_class_serializer(widget_class_name)().fields.get(request.GET.get('field'))
+        if getattr(field, 'choice_provider', None) is None:
+            raise ValidationError('field must be a field with lazily loaded choices')
+        offset = get_offset(request)
+        page_size = api_settings.WIDGET_CHOICES_PAGE_SIZE
+        # Fetch one extra choice to tell whether there is a next page
+        choices = field.choice_provider.search(request.GET.get('search', ''), offset, page_size + 1)
+        return JsonResponse({
+            'results': [{'value': value, 'label': label} for value, label in choices[:page_size]],
+            'next': offset + page_size if len(choices) > page_size else None,
+        })
+
     def retrieve(self, request, *args, **kwargs):
         """
-        API endpoint that returns an ordered list of rendered widgets from a specific widget-list
+        API endpoint that returns an ordered list of rendered widgets from a specific widget-list. The encoded list is
+            cached by list version
         """
-        return make_widget_list_response(self.get_object().get_widgets())
+        widget_list = self.get_object()
+        return HttpResponse(get_widget_list_payloads([widget_list])[widget_list.id], content_type='application/json')
+
+    @action(detail=False)
+    def batch(self, request):
+        """
+        API endpoint that returns the ordered lists of rendered widgets for several widget-lists, keyed by widget-list
+            id. The response is composed from the cached encoded lists, which are fetched in one cache round trip
+        """
+        widget_lists = get_widget_lists_for_read(self.get_queryset(), get_widget_list_ids(request))
+        for widget_list in widget_lists.values():
+            self.check_object_permissions(request, widget_list)
+        payloads = get_widget_list_payloads(list(widget_lists.values()))
+        return HttpResponse(
+            '{%s}' % ', '.join('"%s": %s' % (widget_list_id, payload) for widget_list_id, payload in payloads.items()),
+            content_type='application/json',
+        )
+
+    @action(detail=True)
+    def events(self, request, pk=None):
+        """
+        API endpoint that streams changes to a widget-list as server-sent events. Clients resume from the version in
+            the Last-Event-ID header or the version query parameter; without either they receive only new changes.
+            Each stream holds its worker for up to WIDGET_EVENT_STREAM_TIMEOUT seconds, so the endpoint is off unless
+            WIDGET_EVENT_STREAM is set, which is only meant for ASGI deployments
+        """
+        if not api_settings.WIDGET_EVENT_STREAM:
+            raise Http404
+        widget_list = self.get_object()
+        last_version = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('version')
+        try:
+            last_version = widget_list.version if last_version is None else int(last_version)
+        except ValueError:
+            raise ValidationError('version must be a widget-list version')
+        response = StreamingHttpResponse(
+            stream_widget_list_events(widget_list, last_version), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        API endpoint that copies a widget-list and all of its widgets into a new widget-list, for creating lists from a
+            template list. Returns the new widget-list
+        """
+        widget_list = self.get_object().clone()
+        return JsonResponse(self.get_serializer(widget_list).data, status=201)
+
+    @action(detail=True)
+    def html(self, request, pk=None):
+        """
+        API endpoint that returns a widget-list as a single html fragment with each widget wrapped with its title, for
+            consumers that do not render widgets with react. The fragment is cached by list version and streamed as it
+            renders when it is not cached
+        """
+        widget_list = self.get_object()
+        if is_widget_list_cacheable(widget_list):
+            fragment = cache.get(get_widget_list_html_cache_key(widget_list))
+            if fragment is not None:
+                return HttpResponse(fragment)
+        return StreamingHttpResponse(stream_widget_list_html(widget_list))
 
 
 class WidgetViewSet(ModelViewSet):
@@ -60,9 +300,18 @@ class WidgetViewSet(ModelViewSet):
         DELETE -> destroy
         PUT -> update
         PATCH -> partial_update
+        GET search (with ?q=...&configuration=...&widget_class=...) -> search
+        POST bulk_update -> bulk_update
     """
     serializer_class = WidgetSerializer
 
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Widget requests are made while editing widget-lists, so they always read from the primary database
+        """
+        with use_primary_database():
+            return super().dispatch(request, *args, **kwargs)
+
     def get_widget_list(self, widget_list_id=None):
         if self.request.method == 'POST':
             widget_list_id = self.request.data['widget_list']
@@ -81,12 +330,64 @@ class WidgetViewSet(ModelViewSet):
                 #TODO Handle permissions denied
                 self.permission_denied(self.request, "This user does not have permission to edit that widget list")
 
+    def record_widget_list_change(self, event_type, widget_id, position=None, widget_list_id=None):
+        """
+        record_widget_list_change increments the version of the widget-list and publishes the change to its event
+            stream. Every view that changes a widget must call it
+        """
+        widget_list = self.get_widget_list(widget_list_id=widget_list_id)
+        widget_list.increment_version()
+        publish_widget_list_event(widget_list, event_type, widget_id, position=position)
+
     def get_queryset(self, widget_list_id=None):
         """
         get_queryset returns all widgets belonging to the list specified in kwargs['widget_list_id']
         """
         return self.get_widget_list(widget_list_id=widget_list_id).get_widgets()
 
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def search(self, request):
+        """
+        API endpoint for admins that returns a page of the widgets of every widget-list that match the search, ordered
+            by id. q matches the words of widget titles and configurations, configuration matches configurations that
+            contain a JSON object and widget_class matches the widget class. Pages start at the offset query
+            parameter; next is the offset of the next page, or null on the last page
+        """
+        offset = get_offset(request)
+        page_size = api_settings.WIDGET_SEARCH_PAGE_SIZE
+        # Fetch one extra widget to tell whether there is a next page
+        widgets = list(
+            search_widgets(WidgetInstance.objects.all(), **get_search_filters(request.GET)).order_by('id').values(
+                'id', 'widget_list_id', 'widget_class', 'position', 'title', 'configuration', 'configuration_hash'
+            )[offset:offset + page_size + 1]
+        )
+        configurations = load_configurations(
+            (widget['id'], widget['configuration'], widget.pop('configuration_hash')) for widget in widgets
+        )
+        for widget in widgets:
+            widget['configuration'] = configurations[widget['id']]
+        return JsonResponse({
+            'results': widgets[:page_size],
+            'next': offset + page_size if len(widgets) > page_size else None,
+        })
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk_update(self, request):
+        """
+        API endpoint for admins that sets the keys of the changes object on the configurations of every widget of
+            widget_class that matches the q and configuration search, with one update. Returns how many widgets and
+            widget-lists changed
+        """
+        filters = get_search_filters(request.data)
+        if filters['widget_class'] is None or not isinstance(request.data.get('changes'), dict):
+            raise ValidationError('bulk_update needs a widget_class and a changes object')
+        if filters['text'] is None and filters['configuration'] is None:
+            raise ValidationError('bulk_update needs q or configuration to select widgets')
+        updated, widget_lists = bulk_update_configurations(
+            search_widgets(WidgetInstance.objects.all(), **filters), filters['widget_class'], request.data['changes']
+        )
+        return JsonResponse({'updated': updated, 'widget_lists': widget_lists})
+
     def retrieve(self, request, *args, **kwargs):
         """
         retrieve is used for acquiring data to update a widget. It returns the configuration for form rendering and the
@@ -95,18 +396,22 @@ class WidgetViewSet(ModelViewSet):
         serializer = self.serializer_class(self.get_object())
         return JsonResponse({
             'widgetClassConfigurations': {
-                serializer.data['widget_class']: get_widget_class_configurations()[serializer.data['widget_class']],
+                serializer.data['widget_class']: serializer.get_configuration_form_spec(
+                    serializer.data['widget_class'], selected=serializer.data['configuration']
+                ),
             },
             'widgetData': serializer.get_form_data(),
         })
 
+    @atomic
     def create(self, request, *args, **kwargs):
         """
         API endpoint to create a widget instance on a list after validating the data with the serializer class.
             Returns the updated widget-list
         """
         self.check_widget_list_edit_permissions()
-        super().create(request, *args, **kwargs)
+        response = super().create(request, *args, **kwargs)
+        self.record_widget_list_change(WIDGET_ADDED, response.data['id'], position=response.data['position'])
         return make_widget_list_response(self.get_queryset())
 
     @atomic
@@ -121,9 +426,14 @@ class WidgetViewSet(ModelViewSet):
         for widget in self.get_queryset().filter(position__gt=widget_to_delete.position).select_for_update():
             widget.position -= 1
             widget.save()
+        widget_id = widget_to_delete.id
         self.perform_destroy(widget_to_delete)
+        self.record_widget_list_change(
+            WIDGET_DELETED, widget_id, position=widget_to_delete.position, widget_list_id=widget_list_id
+        )
         return make_widget_list_response(self.get_queryset(widget_list_id=widget_list_id))
 
+    @atomic
     def update(self, request, *args, **kwargs):
         """
         API endpoint to update the data for a widget instance. There are no frontend components that currently
@@ -132,9 +442,21 @@ class WidgetViewSet(ModelViewSet):
         """
         #TODO implement?
         self.check_widget_list_edit_permissions()
-        super().update(request, *args, **kwargs)
+        response = super().update(request, *args, **kwargs)
+        self.record_widget_list_change(
+            WIDGET_UPDATED if response.data['position'] == self.previous_position else WIDGET_MOVED,
+            response.data['id'],
+            position=response.data['position'],
+        )
         return make_widget_list_response(self.get_queryset())
 
+    def perform_update(self, serializer):
+        """
+        perform_update saves a widget, keeping its position from before the update for update to compare
+        """
+        self.previous_position = serializer.instance.position
+        super().perform_update(serializer)
+
     @atomic
     def partial_update(self, request, *args, **kwargs):
         """
@@ -157,5 +479,75 @@ class WidgetViewSet(ModelViewSet):
                     widget.position += 1
                     widget.save()
 
+        # DRF's partial_update calls update, which records the change to the widget-list
         super().partial_update(request, *args, **kwargs)
         return make_widget_list_response(self.get_queryset())
+
+
+class WidgetFileViewSet(ViewSet):
+    """
+    WidgetFileViewSet stores and serves the files of file widgets with the following mapping (as reflected in urls.py):
+        POST (with the file as the request body and ?name=...) -> create
+        GET (with content hash) -> retrieve
+    """
+    lookup_value_regex = '[0-9a-f]{64}'
+    authentication_classes = (
+        api_settings.WIDGET_FRAMEWORK_AUTHENTICATION_CLASSES or rest_framework_settings.DEFAULT_AUTHENTICATION_CLASSES
+    )
+    permission_classes = (
+        api_settings.WIDGET_FRAMEWORK_PERMISSION_CLASSES or rest_framework_settings.DEFAULT_PERMISSION_CLASSES
+    )
+
+    def create(self, request):
+        """
+        API endpoint that stores the request body as a file, streaming it to storage in chunks. Files with the same
+            content are stored once. Returns the value for a file widget's file field
+        """
+        try:
+            content_hash, size = store_file(request)
+        except FileTooLargeError:
+            raise ValidationError('Files may be at most %s bytes' % api_settings.WIDGET_FILE_MAX_BYTES)
+        return JsonResponse(
+            {'hash': content_hash, 'name': request.GET.get('name') or content_hash, 'size': size}, status=201
+        )
+
+    def retrieve(self, request, pk=None):
+        """
+        API endpoint that downloads a stored file, or the byte range of it in the Range header. Stored files never
+            change, so clients may cache them for WIDGET_FILE_CACHE_TIMEOUT seconds and revalidate them by ETag
+        """
+        etag = '"%s"' % pk
+        headers = {
+            'Cache-Control': 'public, max-age=%s, immutable' % api_settings.WIDGET_FILE_CACHE_TIMEOUT,
+            'ETag': etag,
+            'Accept-Ranges': 'bytes',
+        }
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return make_file_response(HttpResponseNotModified(), headers)
+
+        storage = get_file_storage()
+        path = get_file_path(pk)
+        if not storage.exists(path):
+            raise Http404
+        size = storage.size(path)
+        byte_range = None
+        if request.META.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        if byte_range is False:
+            headers['Content-Range'] = 'bytes */%s' % size
+            return make_file_response(HttpResponse(status=416), headers)
+
+        name = request.GET.get('name') or pk
+        start, end = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            iter_file_range(storage.open(path, 'rb'), start, end),
+            status=206 if byte_range else 200,
+            content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        )
+        # Uploaded files are always downloaded rather than displayed, so they cannot run scripts on this site
+        headers['Content-Disposition'] = "attachment; filename*=UTF-8''%s" % quote(name)
+        headers['X-Content-Type-Options'] = 'nosniff'
+        headers['Content-Length'] = end - start + 1
+        if byte_range:
+            headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end, size)
+        return make_file_response(response, headers)
@@ -0,0 +1,70 @@
+"""
+WidgetApp warm-up
+
+Importing the widget classes, building their DRF fields and computing form specs is otherwise paid for by the first
+requests a new worker serves. warm_up does that work ahead of time and returns how long each step took. It runs in
+OpenWidgetFrameworkConfig.ready when WIDGET_WARM_UP_ON_READY is set, and the warm_up_widgets management command also
+pre-renders the hottest widget-lists into the cache.
+"""
+import time
+from collections import OrderedDict
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from open_widget_framework.models import WidgetList
+from open_widget_framework.settings import api_settings
+from open_widget_framework.utils import get_widget_class_dict, import_widget_classes
+from open_widget_framework.widget_class_base import WidgetClassBase
+from open_widget_framework.widget_serializer import (
+    WidgetSerializer,
+    get_widget_row_fields,
+    has_static_form_spec,
+    render_widget_rows,
+)
+
+
+def check_widget_classes(widget_classes):
+    """
+    check_widget_classes raises ImproperlyConfigured if an imported widget class cannot be used by the framework
+    """
+    for widget_class in widget_classes:
+        if not (isinstance(widget_class, type) and issubclass(widget_class, WidgetClassBase)):
+            raise ImproperlyConfigured("widget class %r does not extend WidgetClassBase" % widget_class)
+        if not getattr(widget_class, "name", None):
+            raise ImproperlyConfigured("widget class %s has no name" % widget_class.__name__)
+        if widget_class.render is WidgetClassBase.render:
+            raise ImproperlyConfigured("widget class %s does not implement render" % widget_class.__name__)
+
+
+def warm_up(widget_list_ids=()):
+    """
+    warm_up imports and checks WIDGET_CLASSES, builds the WidgetSerializer fields and the static form specs of every
+        widget class, and renders the widget-lists with ids widget_list_ids into the render cache. Rendering lists
+        queries the database, so it must not be asked for from AppConfig.ready.
+    :return: an ordered dict mapping the name of each step to the seconds it took
+    """
+    timings = OrderedDict()
+
+    start = time.perf_counter()
+    widget_class_paths = tuple(api_settings.WIDGET_CLASSES)
+    check_widget_classes([import_string(widget_class_path) for widget_class_path in widget_class_paths])
+    if len(import_widget_classes(widget_class_paths)) != len(widget_class_paths):
+        raise ImproperlyConfigured("two WIDGET_CLASSES have the same name")
+    timings["import_widget_classes"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_widget_row_fields()
+    for name, widget_class in get_widget_class_dict().items():
+        if has_static_form_spec(widget_class):
+            WidgetSerializer.get_configuration_form_spec(name)
+    timings["form_specs"] = time.perf_counter() - start
+
+    if widget_list_ids:
+        start = time.perf_counter()
+        for widget_list in WidgetList.objects.filter(pk__in=widget_list_ids):
+            for _ in render_widget_rows(widget_list.get_widgets()):
+                pass
+        timings["render_widget_lists"] = time.perf_counter() - start
+
+    return timings
@@ -1,15 +1,70 @@
+from types import MappingProxyType
+
 from rest_framework import serializers
 
+# The bound fields shared by every instance of a widget class with static fields, keyed by widget class
+_shared_fields = {}
+
 
 class WidgetClassBase(serializers.Serializer):
     """
     WidgetClassBase is the base class for a widget class. It should be extended to properly serialize a widget
         configuration json blob. It must implement a render method and has stubs for pre and post configuring data
+
+    cache_renders: A widget class whose render output depends only on its configuration (and on data that may be up
+        to WIDGET_RENDER_CACHE_TIMEOUT seconds stale, such as a feed) can set cache_renders = True. Its renders are
+        cached by configuration, and lists made only of cached or pure widget classes are cached whole. Widget classes
+        that render from database rows, which can change without the widget changing, must leave it unset
+    pure: A widget class whose render output depends only on its configuration can set pure = True. Its widgets are
+        rendered when they are saved and the output is stored on the widget, so reading them does not render them.
+    render_version: Increase render_version when the render output of a pure widget class changes, then run the
+        render_pure_widgets management command to re-render the stored output
+    refresh_ahead: A widget class whose render output goes stale over time (such as a feed) can set refresh_ahead =
+        True along with cache_renders. Its cached renders that are still being read are re-rendered by the
+        refresh_widgets management command shortly before they expire, so readers rarely render them
+
+    Widget classes that do not implement pre_configure have the same fields on every instance, so their fields are
+        built and bound once, to an instance with no data, and shared, read-only, by all of their instances rather than
+        deep copied for each one. Shared fields are not bound to the instance that uses them, so their validation and
+        to_representation cannot use the context or partial of that instance. Widget classes whose fields use either,
+        or that change their fields in any other way, must implement pre_configure
     """
+    cache_renders = False
+    pure = False
+    render_version = 1
+    refresh_ahead = False
+
     def __init__(self, *args, **kwargs):
         self.pre_configure()
         super().__init__(*args, **kwargs)
 
+    @classmethod
+    def has_static_fields(cls):
+        """
+        has_static_fields(): Returns whether the fields of the widget class are the same on every instance. Widget
+            classes that implement pre_configure may load their fields from the database, so their fields are built for
+            each instance
+        """
+        return cls.pre_configure is WidgetClassBase.pre_configure
+
+    @property
+    def fields(self):
+        """
+        fields: The fields of a widget class with static fields are bound once to a prototype instance with no data,
+            context or partial, and then shared by every instance as a read-only mapping. Other widget classes build
+            their fields once per instance, so the changes pre_configure makes to them are kept
+        """
+        if not self.has_static_fields():
+            # Serializer.fields caches the fields in the instance dict, which this property takes precedence over
+            return self.__dict__["fields"] if "fields" in self.__dict__ else super().fields
+        fields = _shared_fields.get(type(self))
+        if fields is None:
+            prototype = type(self)()
+            fields = _shared_fields.setdefault(
+                type(self), MappingProxyType(super(WidgetClassBase, prototype).fields)
+            )
+        return fields
+
     def render(self):
         """
         render(): This method MUST be implemented in every widget class. It can return either a string of a dictionary:
@@ -21,6 +76,28 @@ class WidgetClassBase(serializers.Serializer):
         """
         raise NotImplementedError
 
+    @classmethod
+    def render_many(cls, instances):
+        """
+        render_many(instances): This method may be implemented in a widget class to render several of its validated
+            instances together, so that data they share (such as users or feeds) is loaded once. List renders call it
+            once per widget class with all of the instances of that class that are not cached. It must return a list
+            of the values render would return for each instance, in order. By default it calls render on each instance.
+        """
+        # Can be overridden by child class
+        return [instance.render() for instance in instances]
+
+    async def arender(self):
+        """
+        arender(): This method may be implemented in a widget class that does I/O while rendering, so that async views
+            can render many widgets concurrently. It must return the same value as render. By default it runs render in
+            a worker thread so that widget classes that only implement render work in async views unchanged.
+        """
+        # Can be overridden by child class. asyncio is imported here as only async views need it
+        import asyncio
+
+        return await asyncio.get_event_loop().run_in_executor(None, self.render)
+
     def pre_configure(self):
         """pre_configure(): This method may be implemented in a widget class. It runs whenever the widget class
             serializer is initialized. It can be used to dynamically load content that comes from the database (such as
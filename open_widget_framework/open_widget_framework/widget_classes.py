@@ -1,20 +1,34 @@
 """
 WidgetApp widget classes
 """
-from django.contrib.auth.models import User
-from django.utils.html import escape, format_html
+from urllib.parse import urlencode
 
+from django.template.defaultfilters import filesizeformat
+from django.urls import reverse
+from django.utils.html import escape, format_html, format_html_join
+
+from open_widget_framework.feeds import get_feed_entries
+from open_widget_framework.settings import api_settings
 from open_widget_framework.widget_class_base import WidgetClassBase
 from open_widget_framework.react_fields import (
+    QuerySetChoiceProvider,
     ReactCharField,
     ReactURLField,
     ReactMultipleChoiceField,
     ReactFileField,
     ReactIntegerField,
 )
-import feedparser
 import time
 
+
+def get_users():
+    """Return a queryset of all users"""
+    # Imported here so that importing the widget classes does not load the auth models
+    from django.contrib.auth.models import User
+
+    return User.objects.all()
+
+
 class TextWidget(WidgetClassBase):
     """
     A basic text widget
@@ -26,6 +40,8 @@ class TextWidget(WidgetClassBase):
     """
 
     name = "Text"
+    cache_renders = True
+    pure = True
     body = ReactCharField(props={"placeholder": "Enter widget text"})
 
     def render(self):
@@ -43,6 +59,8 @@ class URLWidget(WidgetClassBase):
     """
 
     name = "URL"
+    cache_renders = True
+    pure = True
     url = ReactURLField(props={"placeholder": "Enter URL"})
 
     def render(self):
@@ -60,22 +78,29 @@ class ManyUserWidget(WidgetClassBase):
     """
 
     name = "Many User"
-    user_ids = ReactMultipleChoiceField([], props={"placeholder": "Select users"})
-
-    def pre_configure(self):
-        # Dynamically set users to choose from
-        self.fields["user_ids"].choices = [
-            (user.id, user.username) for user in User.objects.all().order_by("id")
-        ]
+    user_ids = ReactMultipleChoiceField(
+        QuerySetChoiceProvider(get_users, "username"),
+        props={"placeholder": "Select users"},
+    )
 
     def render(self):
-        users = {User.objects.get(id=user_id) for user_id in self.data["user_ids"]}
+        return self.render_many([self])[0]
+
+    @classmethod
+    def render_many(cls, instances):
+        """Load the users of all the instances in one query and render each instance's table"""
+        users = get_users().in_bulk({user_id for instance in instances for user_id in instance.data["user_ids"]})
+        return [instance.render_users(users) for instance in instances]
+
+    def render_users(self, users):
+        """Render a table of the selected users, given a dict of users keyed by id"""
+        selected_users = [users[user_id] for user_id in sorted(self.data["user_ids"]) if user_id in users]
         select_user_html = (
             "<table><tr><th>Username</th><th>Last Name</th><th>First Name</th><th>Last Logged In</th></tr>"
             + "".join(
                 [
                     format_html("<tr><td>{}</td><td>{}</td><td>{}</td></tr>", u.username, u.last_name, u.first_name)
-                    for u in users
+                    for u in selected_users
                 ]
             )
             + "</table>"
@@ -94,40 +119,78 @@ class RssFeedWidget(WidgetClassBase):
     Renderer: default
     """
     name = "RSS Feed"
+    cache_renders = True
+    refresh_ahead = True
     url = ReactURLField(props={"placeholder": "Enter RSS Feed URL"})
     feed_display_limit = ReactIntegerField(min_value=0, max_value=12, props={"default": 3})
+    entry_template = '<p><a href="{}">{} | {}</a></p>'
 
     def render(self):
-        feed_output = ""
-        feed = feedparser.parse(self.data["url"]).entries
+        return self.render_feed(get_feed_entries(self.data["url"], self.data["feed_display_limit"]))
+
+    @classmethod
+    def render_many(cls, instances):
+        """Fetch each distinct feed once, up to the largest limit it is displayed with, fetching feeds concurrently"""
+        feed_limits = {}
+        for instance in instances:
+            url = instance.data["url"]
+            feed_limits[url] = max(feed_limits.get(url, 0), instance.data["feed_display_limit"])
+        if len(feed_limits) > 1:
+            # Imported here as only lists with several feeds need a thread pool
+            from concurrent.futures import ThreadPoolExecutor
+
+            max_workers = min(len(feed_limits), api_settings.RSS_FEED_FETCH_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                feeds = dict(zip(feed_limits, executor.map(get_feed_entries, feed_limits, feed_limits.values())))
+        else:
+            feeds = {url: get_feed_entries(url, limit) for url, limit in feed_limits.items()}
+        # Feed entries are newest first, so a shorter limit is a prefix of the entries fetched for a longer one
+        return [
+            instance.render_feed(feeds[instance.data["url"]][:instance.data["feed_display_limit"]])
+            for instance in instances
+        ]
+
+    async def arender(self):
+        # Only the feed fetch blocks, so only it runs in a worker thread
+        import asyncio
+
+        feed = await asyncio.get_event_loop().run_in_executor(
+            None, get_feed_entries, self.data["url"], self.data["feed_display_limit"]
+        )
+        return self.render_feed(feed)
+
+    def render_feed(self, feed):
+        """Render compact feed entries as html"""
         if not feed:
             return "<p>No RSS entries found. You may have selected an invalid RSS url.</p>"
-        timestamp_key = "published_parsed" if "published_parsed" in feed[0] else "updated_parsed"
-        sorted_feed = sorted(feed, reverse=True, key=lambda entry: entry[timestamp_key])
-        display_limit = min(0, self.data["feed_display_limit"])
-        for entry in sorted_feed[:display_limit]:
-            entry_title = entry.get("title", None)
-            entry_link = entry.get("link", None)
-            entry_timestamp = entry.get(timestamp_key, None)
-            if entry_timestamp:
-                entry_timestamp = time.strftime('%m/%d %I:%M%p', entry_timestamp)
-            feed_output += f'<p><a href="{entry_link}">{entry_timestamp} | {entry_title}<a><p>'
-        return feed_output
+        return format_html_join("", self.entry_template, (
+            (entry_link or "", self.format_timestamp(entry_timestamp), entry_title or "")
+            for entry_timestamp, entry_title, entry_link in feed
+        ))
+
+    @staticmethod
+    def format_timestamp(timestamp):
+        """Format an entry's epoch timestamp for display, or return an empty string if the entry has none"""
+        return time.strftime("%m/%d %I:%M%p", time.gmtime(timestamp)) if timestamp else ""
 
 
 class FileWidget(WidgetClassBase):
     """
-    UNIMPLEMENTED
     Upload a file and display a download link
 
     Fields:
-        file:
+        file: a file uploaded to the widget file endpoint
 
-    Renderer:
+    Renderer: default
     """
 
     name = "File"
+    cache_renders = True
     file = ReactFileField()
 
-    def render(self, request, configuration):
-        pass
+    def render(self):
+        file = self.data["file"]
+        url = "%s?%s" % (reverse("widget-file-detail", kwargs={"pk": file["hash"]}), urlencode({"name": file["name"]}))
+        return format_html(
+            '<a href="{}" download="{}">{}</a> ({})', url, file["name"], file["name"], filesizeformat(file["size"])
+        )
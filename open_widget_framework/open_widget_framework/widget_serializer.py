@@ -1,11 +1,28 @@
+import logging
+import time
+from copy import copy, deepcopy
+from functools import lru_cache
+
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from rest_framework.serializers import ModelSerializer, ValidationError
 from rest_framework.validators import UniqueTogetherValidator
 from django.db.models import CharField
 
 from open_widget_framework.react_fields import ReactCharField, ReactChoiceField
-from open_widget_framework.models import WidgetInstance, WidgetList
-from open_widget_framework.utils import get_widget_class_dict
+from open_widget_framework.models import WidgetInstance, WidgetList, get_stored_configurations
+from open_widget_framework.profiling import get_widget_profile
+from open_widget_framework.settings import api_settings
+from open_widget_framework.utils import get_configuration_hash, get_render_cache_key, get_widget_class_dict
+
+log = logging.getLogger(__name__)
+
+# Form specs of widget classes that do not change between requests, keyed by (serializer class, widget class)
+_static_form_specs = {}
+
+# The body shown in place of a sandboxed widget whose render failed. It is never cached or stored, so the widget renders
+# again on the next read
+SANDBOX_ERROR_BODY = "<p>This widget could not be rendered.</p>"
 
 
 def get_widget_class_configurations():
@@ -27,12 +44,126 @@ def get_widget_class_serializer(widget_class_name):
         raise ImproperlyConfigured("no widget of type %s found" % widget_class_name)
 
 
+def has_static_form_spec(widget_class):
+    """
+    has_static_form_spec returns whether the form spec of a widget class is the same on every request. Widget classes
+        that implement pre_configure may load their fields from the database, so their form spec is built every time
+    """
+    return widget_class.has_static_fields()
+
+
+def get_validated_widget_serializer(widget_class_name, configuration):
+    """
+    Return a widget_class serializer for widget_class_name that has validated configuration
+    """
+    widget_serializer = get_widget_class_serializer(widget_class_name)(data=configuration)
+    if not widget_serializer.is_valid():
+        # TODO: handle error here
+        raise Exception
+    return widget_serializer
+
+
+def render_widget(widget_class_name, configuration):
+    """
+    render_widget validates a configuration and returns the output of the widget class's render function. Widget
+        classes in WIDGET_SANDBOXED_CLASSES render in the sandbox process pool, and return SANDBOX_ERROR_BODY if their
+        render fails there. Callers must not cache or store SANDBOX_ERROR_BODY
+    """
+    if widget_class_name in api_settings.WIDGET_SANDBOXED_CLASSES:
+        from open_widget_framework.sandbox import WidgetSandboxError, render_in_sandbox
+
+        try:
+            return render_in_sandbox(widget_class_name, configuration)
+        except WidgetSandboxError:
+            log.exception("Could not render a %s widget in the sandbox", widget_class_name)
+            return SANDBOX_ERROR_BODY
+    return get_validated_widget_serializer(widget_class_name, configuration).render()
+
+
+def render_widgets(widget_class_name, configurations):
+    """
+    render_widgets validates several configurations of one widget class and returns the output of the widget class's
+        render function for each, in order. They are rendered together by the widget class's render_many function, so
+        the widget class can load data they share once. Widget classes in WIDGET_SANDBOXED_CLASSES render one at a
+        time in the sandbox process pool
+    """
+    if widget_class_name in api_settings.WIDGET_SANDBOXED_CLASSES:
+        return [render_widget(widget_class_name, configuration) for configuration in configurations]
+    widget_class = get_widget_class_serializer(widget_class_name)
+    return widget_class.render_many([
+        get_validated_widget_serializer(widget_class_name, configuration) for configuration in configurations
+    ])
+
+
+def render_pure_widget(widget_class_name, configuration):
+    """
+    render_pure_widget returns the (rendered_body, render_version) to store with a widget that is being saved: the
+        render output of a pure widget class and its render version, or (None, None) for other widget classes and for
+        renders that failed in the sandbox, which are rendered again when they are read
+    """
+    widget_class = get_widget_class_serializer(widget_class_name)
+    if not widget_class.pure:
+        return None, None
+    rendered_body = render_widget(widget_class_name, configuration)
+    if rendered_body is SANDBOX_ERROR_BODY:
+        return None, None
+    return rendered_body, widget_class.render_version
+
+
+def get_pure_render_versions():
+    """
+    get_pure_render_versions returns a dict mapping the names of the pure widget classes to their render versions.
+        Stored render output is only used if it was rendered with the current render version of its widget class
+    """
+    return {name: widget_class.render_version for name, widget_class in get_widget_class_dict().items()
+            if widget_class.pure}
+
+
+def get_cached_render_classes():
+    """
+    get_cached_render_classes returns the names of the widget classes whose render output may be reused: classes with
+        cache_renders set, whose renders are cached, and pure classes, whose renders are stored. Lists made only of
+        these classes can be cached whole
+    """
+    return {name for name, widget_class in get_widget_class_dict().items() if widget_class.cache_renders
+            or widget_class.pure}
+
+
+def get_rendered_body(widget_class_name, configuration):
+    """
+    get_rendered_body returns the output of a widget class's render function for a configuration, reusing a cached
+        render of the same widget class and configuration if there is one and the widget class caches its renders
+    """
+    if not get_widget_class_serializer(widget_class_name).cache_renders:
+        return render_widget(widget_class_name, configuration)
+    cache_key = get_render_cache_key(widget_class_name, get_configuration_hash(configuration))
+    rendered_body = cache.get(cache_key)
+    if rendered_body is None:
+        rendered_body = render_widget(widget_class_name, configuration)
+        if rendered_body is not SANDBOX_ERROR_BODY:
+            cache.set(cache_key, rendered_body, api_settings.WIDGET_RENDER_CACHE_TIMEOUT)
+    return rendered_body
+
+
+def add_rendered_body(rendered_widget, rendered_body):
+    """
+    add_rendered_body updates the widget data in rendered_widget with a rendered body and returns it.
+        If the render function returned a string, that string will be set html prop of the default renderer.
+        If it returned a dict, that dict will be passed as props to a react_renderer which must be specified.
+    """
+    if isinstance(rendered_body, dict):
+        rendered_widget.update(rendered_body)
+    else:
+        rendered_widget.update({'html': rendered_body})
+    return rendered_widget
+
+
 class WidgetListSerializer(ModelSerializer):
     """
     A very simple serializer that allows us to use DRF ModelViewSets to create and destroy widget-lists in views.py
     """
     class Meta:
-        fields = '__all__'
+        exclude = ('version', 'widget_count', 'widget_class_counts', 'modified')
         model = WidgetList
 
 
@@ -69,7 +200,9 @@ class WidgetSerializer(ModelSerializer):
             configuration fields in the individual widget class.
         """
         model = WidgetInstance
-        fields = '__all__'
+        exclude = ('configuration_hash', 'rendered_body', 'render_version')
+        # Only the database row may be empty, when the configuration is in the WidgetConfiguration store
+        extra_kwargs = {'configuration': {'allow_null': False}}
         form_fields = ('title',)
         validators = [
             WidgetListPositionValidator(
@@ -90,6 +223,13 @@ class WidgetSerializer(ModelSerializer):
         self.serializer_choice_field = ReactChoiceField
         super().__init__(*args, **kwargs)
 
+    def get_validators(self):
+        """
+        DRF validators keep the instance being validated on themselves, so each serializer gets its own copies of the
+            Meta validators and concurrent requests are validated independently
+        """
+        return [copy(validator) for validator in super().get_validators()]
+
     def validate_widget_class(self, value):
         """
         validate_widget_class checks to make sure that the widget_class is one of the given widget classes
@@ -110,6 +250,19 @@ class WidgetSerializer(ModelSerializer):
             #TODO: better error messaging
             raise ValidationError('Bad configuration')
 
+    def validate(self, attrs):
+        """
+        validate renders widgets of pure widget classes when their configuration is saved, so that their render output
+            is stored with them
+        """
+        attrs = super().validate(attrs)
+        if 'configuration' in attrs:
+            widget_class_name = attrs.get('widget_class') or self.instance.widget_class
+            attrs['rendered_body'], attrs['render_version'] = render_pure_widget(
+                widget_class_name, attrs['configuration']
+            )
+        return attrs
+
     def render_with_title(self):
         """
         Runs the class's render function and adds on the title.
@@ -118,13 +271,18 @@ class WidgetSerializer(ModelSerializer):
         """
         base_configuration = self.data
         base_configuration.pop('configuration')
+        return add_rendered_body(base_configuration, self.get_rendered_body())
 
-        rendered_body = self.get_widget_serializer().render()
-        if isinstance(rendered_body, dict):
-            base_configuration.update(rendered_body)
-        else:
-            base_configuration.update({'html': rendered_body})
-        return base_configuration
+    def get_rendered_body(self):
+        """
+        get_rendered_body returns the output of the widget class's render function, reusing the output stored with a
+            widget of a pure widget class or a cached render of the same widget class and configuration if there is one
+        """
+        instance = self.instance
+        if instance is not None and instance.rendered_body is not None \
+                and instance.render_version == get_pure_render_versions().get(instance.widget_class):
+            return instance.rendered_body
+        return get_rendered_body(self.data['widget_class'], self.data['configuration'])
 
     def get_form_data(self):
         """
@@ -137,28 +295,191 @@ class WidgetSerializer(ModelSerializer):
         return form_data
 
     @classmethod
-    def get_configuration_form_spec(cls, widget_class_name):
+    def get_configuration_form_spec(cls, widget_class_name, selected=None):
         """
-        get_configuration_form_spec returns configurations for a specific widget_class
+        get_configuration_form_spec returns configurations for a specific widget_class. Form specs that are the same on
+            every request are built once and copied
         :param widget_class_name: widget_class to get configuration for
+        :param selected: the configuration of a widget being edited. Fields with lazily loaded choices list the labels
+            of its selected choices, so the form can display them
         :return: a list of dicts that represent the input fields in a form that the frontend will render
         """
-        widget_serializer = get_widget_class_serializer(widget_class_name)()
+        widget_class = get_widget_class_serializer(widget_class_name)
+        if (cls, widget_class) in _static_form_specs:
+            form_spec = deepcopy(_static_form_specs[(cls, widget_class)])
+        else:
+            form_spec = cls.build_configuration_form_spec(widget_class)
+        if selected:
+            fields = widget_class().fields
+            for field_spec in form_spec:
+                if field_spec.get('lazyChoices') and field_spec['key'] in selected:
+                    field_spec['choices'] = fields[field_spec['key']].get_selected_choices(selected[field_spec['key']])
+        return form_spec
+
+    @classmethod
+    def build_configuration_form_spec(cls, widget_class):
+        """
+        build_configuration_form_spec builds the form spec of a widget class, and keeps it for reuse if it is the same
+            on every request
+        """
+        widget_serializer = widget_class()
         widget_base_form_spec = [cls().fields[key].configure_form_spec() for key in cls.Meta.form_fields]
         widget_base_form_spec[0]['props'] = {'placeholder': 'Enter widget title', 'autoFocus': True}
         widget_class_form_spec = [widget_serializer.fields[key].configure_form_spec()
                                   for key in widget_serializer.fields]
-        return widget_base_form_spec + widget_class_form_spec
+        form_spec = widget_base_form_spec + widget_class_form_spec
+        if has_static_form_spec(widget_class):
+            _static_form_specs[(cls, widget_class)] = deepcopy(form_spec)
+        return form_spec
 
     def get_widget_serializer(self):
         """
         Finds the appropriate widget_class serializer for it's own widget class and validates it's JSON blob
         """
-        widget_class_serializer = get_widget_class_serializer(self.data['widget_class'])
-        widget_serializer = widget_class_serializer(data=self.data['configuration'])
-        if not widget_serializer.is_valid():
-            # TODO: handle error here
-            raise Exception
-        else:
-            return widget_serializer
+        return get_validated_widget_serializer(self.data['widget_class'], self.data['configuration'])
+
+
+@lru_cache(maxsize=None)
+def get_widget_row_fields():
+    """
+    get_widget_row_fields returns (key, column) pairs that map WidgetInstance values() columns to the keys of
+        WidgetSerializer.render_with_title. It is computed once from the fields of WidgetSerializer
+    """
+    return tuple(
+        (key, WidgetInstance._meta.get_field(field.source).attname)
+        for key, field in WidgetSerializer().fields.items()
+        if key != 'configuration'
+    )
+
+
+def get_widget_rows(queryset):
+    """
+    get_widget_rows returns the rows of a WidgetInstance queryset that render_widget_rows needs, as named tuples. A
+        named tuple has no per-row dict, so a large list holds much less memory in rows than it does with values() dicts
+        or model instances. The configuration is left out; it is only loaded for widgets whose render is not stored or
+        cached
+    """
+    return queryset.values_list(
+        'configuration_hash', 'rendered_body', 'render_version', *(column for _, column in get_widget_row_fields()),
+        named=True
+    )
+
+
+def make_rendered_widget(row, rendered_body):
+    """
+    make_rendered_widget builds the render_with_title output for a row returned by get_widget_rows
+    """
+    return add_rendered_body({key: getattr(row, column) for key, column in get_widget_row_fields()}, rendered_body)
+
+
+def load_configurations(rows, using=None):
+    """
+    load_configurations takes (key, configuration, configuration_hash) rows of widgets and returns a dict mapping each
+        key to the widget's configuration, loading the configurations kept in the WidgetConfiguration store in one query
+    """
+    rows = list(rows)
+    stored_configurations = get_stored_configurations(
+        {configuration_hash for _, configuration, configuration_hash in rows if configuration is None}, using=using
+    )
+    return {
+        key: stored_configurations[configuration_hash] if configuration is None else configuration
+        for key, configuration, configuration_hash in rows
+    }
+
+
+def record_widget_render(widget_profile, row, cached, seconds):
+    """
+    record_widget_render adds a rendered widget to the widgets recorded for a profiled request
+    """
+    widget_profile.append({'id': row.id, 'widget_class': row.widget_class, 'cached': cached, 'seconds': seconds})
+
+
+def get_cached_widget_renders(queryset):
+    """
+    get_cached_widget_renders loads the widget rows of a queryset with the render output stored on widgets of pure
+        widget classes, then loads the cached renders of the widgets of classes with cache_renders set in one cache
+        round trip and the
+        configurations of the widgets that missed the cache in one query. The renders of refresh-ahead widget classes
+        are recorded as hot if WIDGET_REFRESH_AHEAD is set.
+    :return: a tuple of (rows, rendered_bodies, configurations). rendered_bodies holds the stored or cached render of
+        each row or None, and configurations maps the ids of the rows that missed the cache to their configuration. A
+        widget deleted between the two queries has no configuration, and callers skip it
+    """
+    rows = list(get_widget_rows(queryset))
+    render_versions = get_pure_render_versions()
+    cached_classes = {name for name, widget_class in get_widget_class_dict().items() if widget_class.cache_renders}
+    rendered_bodies = [
+        row.rendered_body if row.rendered_body is not None
+        and row.render_version == render_versions.get(row.widget_class) else None
+        for row in rows
+    ]
+    cache_keys = {
+        index: get_render_cache_key(row.widget_class, row.configuration_hash)
+        for index, (row, rendered_body) in enumerate(zip(rows, rendered_bodies))
+        if rendered_body is None and row.widget_class in cached_classes
+    }
+    if cache_keys:
+        cached_bodies = cache.get_many(list(cache_keys.values()))
+        for index, cache_key in cache_keys.items():
+            rendered_bodies[index] = cached_bodies.get(cache_key)
+    if api_settings.WIDGET_REFRESH_AHEAD is not None:
+        # Imported here as refresh imports this module
+        from open_widget_framework.refresh import record_hot_renders
+
+        record_hot_renders(rows, rendered_bodies)
+    missing_ids = [row.id for row, rendered_body in zip(rows, rendered_bodies) if rendered_body is None]
+    configurations = {}
+    if missing_ids:
+        # Read the configurations from the same database as the rows
+        missing_rows = WidgetInstance.objects.using(queryset.db).filter(pk__in=missing_ids).values_list(
+            'id', 'configuration', 'configuration_hash'
+        )
+        configurations = load_configurations(missing_rows, using=queryset.db)
+    return rows, rendered_bodies, configurations
+
+
+def render_widget_rows(queryset):
+    """
+    render_widget_rows is a read-only fast path for WidgetSerializer.render_with_title. It yields the same dict for
+        each widget of a queryset, in order, without building a WidgetSerializer per widget and without loading the
+        configuration of widgets whose render is cached. Widgets that share a class and configuration render once, and
+        the uncached widgets of each class render together with render_many when the first of them is reached
+    """
+    rows, rendered_bodies, configurations = get_cached_widget_renders(queryset)
+    widget_profile = get_widget_profile()
+
+    # The distinct uncached configurations of each widget class, keyed by their render cache key
+    missing_renders = {}
+    row_cache_keys = {}
+    for row, rendered_body in zip(rows, rendered_bodies):
+        if rendered_body is None and row.id in configurations:
+            configuration = configurations[row.id]
+            cache_key = get_render_cache_key(row.widget_class, get_configuration_hash(configuration))
+            missing_renders.setdefault(row.widget_class, {})[cache_key] = configuration
+            row_cache_keys[row.id] = cache_key
 
+    new_bodies = {}
+    for row, rendered_body in zip(rows, rendered_bodies):
+        cached = rendered_body is not None
+        start = time.perf_counter()
+        if rendered_body is None:
+            if row.id not in configurations:
+                # The widget was deleted after its row was read
+                continue
+            cache_key = row_cache_keys[row.id]
+            if cache_key not in new_bodies:
+                class_renders = missing_renders[row.widget_class]
+                class_bodies = dict(zip(
+                    class_renders.keys(), render_widgets(row.widget_class, list(class_renders.values()))
+                ))
+                if get_widget_class_serializer(row.widget_class).cache_renders:
+                    cache.set_many(
+                        {cache_key: body for cache_key, body in class_bodies.items() if body is not SANDBOX_ERROR_BODY},
+                        api_settings.WIDGET_RENDER_CACHE_TIMEOUT,
+                    )
+                new_bodies.update(class_bodies)
+            rendered_body = new_bodies[cache_key]
+        if widget_profile is not None:
+            # The first widget of each class is recorded with the time taken to render the whole class
+            record_widget_render(widget_profile, row, cached, time.perf_counter() - start)
+        yield make_rendered_widget(row, rendered_body)